@@ -0,0 +1,311 @@
+import hashlib
+import heapq
+import math
+from array import array
+from functools import lru_cache
+
+from automatas import Diccionario, columnas
+
+# Analítica opcional en la misma pasada del análisis (analizar_csv(..., analitica=True)): además del
+# tráfico por AP, tráfico por usuario y por MAC de cliente, histograma por hora de inicio, sesiones por
+# razón de terminación, usuarios y clientes distintos por AP (HyperLogLog) y cuantiles de Session_Time y
+# de los octetos por sesión (cubetas logarítmicas). Los bocetos usan memoria acotada y se combinan
+# entre procesos, así que funcionan también en modo paralelo.
+DIMENSIONES = ['usuarios', 'clientes', 'horas', 'razones', 'unicos', 'cuantiles']
+PRECISION_HLL = 10  # 2**10 registros por boceto: error típico 1.04 / sqrt(1024) ~ 3%
+ERROR_CUANTILES = 0.01  # Error relativo de los cuantiles
+CUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+_I_USUARIO = columnas.index('Usuario')
+_I_CLIENTE = columnas.index('MAC_Cliente')
+_I_HORA = columnas.index('Inicio_de_Conexión_Hora')
+_I_RAZON = columnas.index('Razon_de_Terminación_de_Sesión')
+_I_MAC_AP = columnas.index('MAC_AP')
+
+@lru_cache(maxsize=1 << 12)
+def _hash64(valor):
+    # Hash estable entre procesos (hash() de str cambia en cada ejecución), memorizado para los valores repetidos
+    return int.from_bytes(hashlib.blake2b(valor.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HyperLogLog:
+    # Cantidad aproximada de valores distintos en 2**precision bytes, sin importar cuántos haya.
+    # Mientras hay pocos valores (la mayoría de las AP) se guardan sus hashes, que ocupan menos y dan la
+    # cantidad exacta; al pasar de 2**precision / 16 valores se pasa a los registros.
+    __slots__ = ('precision', 'registros', 'hashes')
+
+    def __init__(self, precision=PRECISION_HLL):
+        self.precision = precision
+        self.registros = None
+        self.hashes = array('Q')
+
+    def agregar(self, valor):
+        h = _hash64(valor)
+        if self.registros is not None:
+            self._registrar(h)
+        elif h not in self.hashes:
+            self.hashes.append(h)
+            if len(self.hashes) > (1 << self.precision) // 16:
+                self._densificar()
+
+    def _registrar(self, h):
+        bits = 64 - self.precision
+        rango = bits + 1 - (h & ((1 << bits) - 1)).bit_length()  # Posición del primer 1 en los bits restantes
+        indice = h >> bits
+        if rango > self.registros[indice]:
+            self.registros[indice] = rango
+
+    def _densificar(self):
+        self.registros = bytearray(1 << self.precision)
+        for h in self.hashes:
+            self._registrar(h)
+        self.hashes = None
+
+    def combinar(self, otro):
+        if self.registros is None and otro.registros is None:
+            for h in otro.hashes:
+                if h not in self.hashes:
+                    self.hashes.append(h)
+            if len(self.hashes) <= (1 << self.precision) // 16:
+                return
+        if self.registros is None:
+            self._densificar()
+        if otro.registros is None:
+            for h in otro.hashes:
+                self._registrar(h)
+        else:
+            self.registros = bytearray(map(max, self.registros, otro.registros))
+
+    def estimar(self):
+        if self.registros is None:
+            return len(self.hashes)
+        m = len(self.registros)
+        estimacion = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registros)
+        ceros = self.registros.count(0)
+        if estimacion <= 2.5 * m and ceros:
+            estimacion = m * math.log(m / ceros)  # Conteo lineal: más preciso con pocos valores
+        return round(estimacion)
+
+    def bytes_ocupados(self):
+        return len(self.hashes) * 8 if self.registros is None else len(self.registros)
+
+class CuantilesLog:
+    # Cuantiles aproximados con error relativo acotado (al estilo de DDSketch): cada valor positivo se
+    # cuenta en la cubeta ceil(log_gamma(valor)), así que la cantidad de cubetas crece con el logaritmo
+    # del rango de valores y no con la cantidad de filas
+    def __init__(self, error_relativo=ERROR_CUANTILES):
+        self.error_relativo = error_relativo
+        self.gamma = (1 + error_relativo) / (1 - error_relativo)
+        self._log_gamma = math.log(self.gamma)
+        self.cubetas = {}
+        self.ceros = 0
+        self.cantidad = 0
+        self.minimo = None
+        self.maximo = None
+
+    def agregar(self, valor):
+        if valor > 0:
+            cubeta = math.ceil(math.log(valor) / self._log_gamma)
+            self.cubetas[cubeta] = self.cubetas.get(cubeta, 0) + 1
+        else:
+            self.ceros += 1
+        self.cantidad += 1
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+
+    def combinar(self, otro):
+        for cubeta, cantidad in otro.cubetas.items():
+            self.cubetas[cubeta] = self.cubetas.get(cubeta, 0) + cantidad
+        self.ceros += otro.ceros
+        self.cantidad += otro.cantidad
+        for valor in (otro.minimo, otro.maximo):
+            if valor is not None:
+                self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+                self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+
+    def cuantil(self, q):
+        if not self.cantidad:
+            return None
+        posicion = q * (self.cantidad - 1)
+        if posicion < self.ceros:
+            return 0
+        acumulado = self.ceros
+        for cubeta in sorted(self.cubetas):
+            acumulado += self.cubetas[cubeta]
+            if acumulado > posicion:
+                estimado = round(2 * self.gamma ** cubeta / (self.gamma + 1))
+                return min(max(estimado, self.minimo), self.maximo)
+        return self.maximo
+
+    def a_dict(self):
+        resumen = {'cantidad': self.cantidad, 'minimo': self.minimo, 'maximo': self.maximo}
+        for q in CUANTILES:
+            resumen[f'p{round(q * 100)}'] = self.cuantil(q)
+        return resumen
+
+class TraficoPor:
+    # Octetos y sesiones por valor de una columna (usuario, MAC del cliente), con los valores codificados
+    def __init__(self, columna):
+        self.columna = columna
+        self.valores = Diccionario()
+        self.trafico = []
+        self.sesiones = []
+
+    def sumar(self, valor, trafico, sesiones=1):
+        codigo = self.valores.codigos.get(valor)
+        if codigo is None:
+            codigo = self.valores.codigo(valor)
+            self.trafico.append(0)
+            self.sesiones.append(0)
+        self.trafico[codigo] += trafico
+        self.sesiones[codigo] += sesiones
+
+    def combinar(self, otro):
+        for valor, trafico, sesiones in zip(otro.valores.valores, otro.trafico, otro.sesiones):
+            self.sumar(valor, trafico, sesiones)
+
+    def ranking(self, top=None):
+        # (valor, octetos, sesiones) de mayor a menor tráfico; con 'top' solo se ordenan los primeros
+        codigos = range(len(self.trafico))
+        if top is None:
+            codigos = sorted(codigos, key=self.trafico.__getitem__, reverse=True)
+        else:
+            codigos = heapq.nlargest(top, codigos, key=self.trafico.__getitem__)
+        return [(self.valores[codigo], self.trafico[codigo], self.sesiones[codigo]) for codigo in codigos]
+
+class Analitica:
+    # Consumidor de registros (ver automatas.consumir) que calcula las 'dimensiones' pedidas de las filas limpias
+    # Con 'memoria' (bytes) el tráfico por usuario y por cliente se aproxima con frecuentes.TraficoFrecuente
+    def __init__(self, dimensiones=None, memoria=None, precision=PRECISION_HLL, error_relativo=ERROR_CUANTILES):
+        dimensiones = DIMENSIONES if dimensiones is None else list(dimensiones)
+        desconocidas = [dimension for dimension in dimensiones if dimension not in DIMENSIONES]
+        if desconocidas:
+            raise ValueError(f"Dimensiones de analítica desconocidas: {', '.join(desconocidas)}")
+        self.dimensiones = [dimension for dimension in DIMENSIONES if dimension in dimensiones]
+        self.precision = precision
+        self.usuarios = self.clientes = None
+        if memoria is not None:
+            from frecuentes import TraficoFrecuente
+        if 'usuarios' in dimensiones:
+            self.usuarios = TraficoPor('Usuario') if memoria is None else TraficoFrecuente(memoria)
+        if 'clientes' in dimensiones:
+            self.clientes = TraficoPor('MAC_Cliente') if memoria is None else TraficoFrecuente(memoria)
+        self.horas_sesiones = [0] * 24 if 'horas' in dimensiones else None
+        self.horas_trafico = [0] * 24 if 'horas' in dimensiones else None
+        self.razones = {} if 'razones' in dimensiones else None
+        self.unicos = {} if 'unicos' in dimensiones else None  # MAC_AP -> (HyperLogLog de usuarios, de clientes)
+        self.session_time = CuantilesLog(error_relativo) if 'cuantiles' in dimensiones else None
+        self.octetos = CuantilesLog(error_relativo) if 'cuantiles' in dimensiones else None
+
+    def __call__(self, registro):
+        if registro.erroneo:
+            return
+        campos = registro.campos
+        trafico = registro.input_octetos + registro.output_octetos
+        if self.usuarios is not None:
+            self.usuarios.sumar(campos[_I_USUARIO], trafico)
+        if self.clientes is not None:
+            self.clientes.sumar(campos[_I_CLIENTE], trafico)
+        if self.horas_sesiones is not None:
+            hora = int(campos[_I_HORA][:2])
+            self.horas_sesiones[hora] += 1
+            self.horas_trafico[hora] += trafico
+        if self.razones is not None:
+            razon = campos[_I_RAZON]
+            self.razones[razon] = self.razones.get(razon, 0) + 1
+        if self.unicos is not None:
+            bocetos = self.unicos.get(campos[_I_MAC_AP])
+            if bocetos is None:
+                bocetos = self.unicos[campos[_I_MAC_AP]] = (HyperLogLog(self.precision), HyperLogLog(self.precision))
+            bocetos[0].agregar(campos[_I_USUARIO])
+            bocetos[1].agregar(campos[_I_CLIENTE])
+        if self.session_time is not None:
+            self.session_time.agregar(registro.session_time)
+            self.octetos.agregar(trafico)
+
+    def combinar(self, otra):
+        # Suma la analítica de otro análisis parcial (un rango del modo paralelo) con las mismas dimensiones
+        if self.usuarios is not None:
+            self.usuarios.combinar(otra.usuarios)
+        if self.clientes is not None:
+            self.clientes.combinar(otra.clientes)
+        if self.horas_sesiones is not None:
+            self.horas_sesiones = [a + b for a, b in zip(self.horas_sesiones, otra.horas_sesiones)]
+            self.horas_trafico = [a + b for a, b in zip(self.horas_trafico, otra.horas_trafico)]
+        if self.razones is not None:
+            for razon, cantidad in otra.razones.items():
+                self.razones[razon] = self.razones.get(razon, 0) + cantidad
+        if self.unicos is not None:
+            for ap, (usuarios, clientes) in otra.unicos.items():
+                if ap in self.unicos:
+                    self.unicos[ap][0].combinar(usuarios)
+                    self.unicos[ap][1].combinar(clientes)
+                else:
+                    self.unicos[ap] = (usuarios, clientes)
+        if self.session_time is not None:
+            self.session_time.combinar(otra.session_time)
+            self.octetos.combinar(otra.octetos)
+
+    def bytes_ocupados(self):
+        # Memoria aproximada de los bocetos de únicos por AP (los de cuantiles son unas pocas cubetas)
+        if self.unicos is None:
+            return 0
+        return sum(usuarios.bytes_ocupados() + clientes.bytes_ocupados() for usuarios, clientes in self.unicos.values())
+
+    def tablas(self, top=None):
+        # (nombre, encabezado, filas) de cada dimensión calculada, para mostrar o exportar.
+        # 'top' limita los rankings por usuario, cliente y AP.
+        if self.usuarios is not None:
+            yield 'Usuarios', ['Usuario', 'Octetos', 'Sesiones'], self.usuarios.ranking(top)
+        if self.clientes is not None:
+            yield 'Clientes', ['MAC_Cliente', 'Octetos', 'Sesiones'], self.clientes.ranking(top)
+        if self.horas_sesiones is not None:
+            yield 'Horas', ['Hora', 'Sesiones', 'Octetos'], [
+                (f"{hora:02d}", sesiones, trafico)
+                for hora, (sesiones, trafico) in enumerate(zip(self.horas_sesiones, self.horas_trafico))]
+        if self.razones is not None:
+            yield 'Razones', ['Razon_de_Terminación_de_Sesión', 'Sesiones'], sorted(
+                self.razones.items(), key=lambda item: item[1], reverse=True)
+        if self.unicos is not None:
+            filas = sorted(((ap, usuarios.estimar(), clientes.estimar())
+                            for ap, (usuarios, clientes) in self.unicos.items()), key=lambda fila: fila[1], reverse=True)
+            yield 'Únicos por AP', ['MAC_AP', 'Usuarios (aprox.)', 'Clientes (aprox.)'], \
+                filas if top is None else filas[:top]
+        if self.session_time is not None:
+            encabezado = ['Medida', 'Cantidad', 'Mínimo', 'Máximo'] + [f'p{round(q * 100)}' for q in CUANTILES]
+            yield 'Cuantiles', encabezado, [
+                [nombre] + list(boceto.a_dict().values())
+                for nombre, boceto in (('Session_Time', self.session_time), ('Octetos', self.octetos))]
+
+    def a_dict(self, top=None):
+        # Resumen serializable con una clave por dimensión calculada
+        resumen = {}
+        if self.usuarios is not None:
+            resumen['usuarios'] = [{'usuario': usuario, 'octetos': trafico, 'sesiones': sesiones}
+                                   for usuario, trafico, sesiones in self.usuarios.ranking(top)]
+        if self.clientes is not None:
+            resumen['clientes'] = [{'mac_cliente': cliente, 'octetos': trafico, 'sesiones': sesiones}
+                                   for cliente, trafico, sesiones in self.clientes.ranking(top)]
+        if self.horas_sesiones is not None:
+            resumen['horas'] = [{'hora': hora, 'sesiones': sesiones, 'octetos': trafico}
+                                for hora, (sesiones, trafico) in enumerate(zip(self.horas_sesiones, self.horas_trafico))]
+        if self.razones is not None:
+            resumen['razones'] = dict(self.razones)
+        if self.unicos is not None:
+            unicos = sorted(({'mac_ap': ap, 'usuarios': usuarios.estimar(), 'clientes': clientes.estimar()}
+                             for ap, (usuarios, clientes) in self.unicos.items()),
+                            key=lambda ap: ap['usuarios'], reverse=True)
+            resumen['unicos'] = unicos if top is None else unicos[:top]
+        if self.session_time is not None:
+            resumen['cuantiles'] = {'session_time': self.session_time.a_dict(), 'octetos': self.octetos.a_dict()}
+        return resumen
+
+    def texto(self, top=10):
+        # Secciones del informe de la interfaz
+        texto = ""
+        for nombre, encabezado, filas in self.tablas(top):
+            texto += f"\n{nombre} ({', '.join(encabezado)}):\n"
+            for fila in filas:
+                texto += ' '.join(str(valor) if valor != '' else '(vacía)' for valor in fila) + "\n"
+        return texto
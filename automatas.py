@@ -1,6 +1,18 @@
 import re
 import csv
-from datetime import datetime
+import heapq
+import os
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from datetime import date, datetime
+
+from comprimido import FORMATOS, abrir_salida, abrir_texto, ruta_salida
+
+try:
+    from re import _parser as _sre_parser  # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parser
 
 # Especificar las columnas que se van a leer (omitimos las últimas dos)
 columnas = [
@@ -30,88 +42,843 @@ regex_patterns = {
     'Razon_de_Terminación_de_Sesión': re.compile(r"^(User-Request|Stale-Session|Session-Timeout|NAS-Reboot|Admin-Reboot|)$")
 }
 
-def comprobar_columnas(columna, row):
+# Clasificador de campos: para cada valor se calcula la máscara de bits (bit i = columnas[i])
+# de las columnas cuyo formato cumple. Las columnas que comparten expresión se evalúan juntas
+# y solo se prueban las expresiones que admiten la longitud del valor.
+_mascaras_por_patron = {}
+for _i, _columna in enumerate(columnas):
+    _mascaras_por_patron[regex_patterns[_columna].pattern] = _mascaras_por_patron.get(regex_patterns[_columna].pattern, 0) | (1 << _i)
+
+_clasificadores = []  # (máscara, match, longitud mínima, longitud máxima)
+for _patron, _mascara in _mascaras_por_patron.items():
+    _minimo, _maximo = _sre_parser.parse(_patron).getwidth()
+    _clasificadores.append((_mascara, re.compile(_patron).match, _minimo, _maximo))
+
+_LONGITUD_MAX = max(maximo for _, _, _, maximo in _clasificadores if maximo < _sre_parser.MAXREPEAT)
+_candidatos_por_longitud = [
+    [(mascara, match) for mascara, match, minimo, maximo in _clasificadores if minimo <= n <= maximo]
+    for n in range(_LONGITUD_MAX + 2)
+]
+_todos_los_candidatos = [(mascara, match) for mascara, match, _, _ in _clasificadores]
+_MASCARA_COMPLETA = (1 << len(columnas)) - 1
+
+# Patrones sobre la fila completa: las 16 columnas unidas por '\x00' (ningún formato lo admite).
+# _patron_fila valida una fila limpia con una sola llamada; en _patron_columnas_validas cada campo
+# puede no cumplir y el grupo 'c{i}' indica si el campo i cumple su columna.
+_patron_fila = re.compile('\x00'.join(
+    f"(?:{regex_patterns[columna].pattern[1:-1]})" for columna in columnas
+) + r'\Z')
+_patron_columnas_validas = re.compile('\x00'.join(
+    f"(?:(?P<c{i}>{regex_patterns[columna].pattern[1:-1]})|[^\x00]*)" for i, columna in enumerate(columnas)
+) + r'\Z')
+_indices_columnas_validas = [(i, _patron_columnas_validas.groupindex[f'c{i}'] - 1) for i in range(len(columnas))]
+
+# Para cada columna, busca en la fila delimitada ('\x00' + campos + '\x00') el primer campo que cumple su formato
+_buscadores = [
+    re.compile(f"\x00((?:{regex_patterns[columna].pattern[1:-1]}))(?=\x00)").search for columna in columnas
+]
+
+def clasificar_campo(valor):
+    # Devuelve la máscara de bits de las columnas que admiten el valor
+    if valor is None:
+        return 0
+    if valor.endswith('\n'):
+        candidatos = _todos_los_candidatos  # '$' también acepta un salto de línea final
+    else:
+        candidatos = _candidatos_por_longitud[min(len(valor), _LONGITUD_MAX + 1)]
+    mascara = 0
+    for mascara_patron, match in candidatos:
+        if match(valor):
+            mascara |= mascara_patron
+    return mascara
+
+def buscar_en_fila(columna, row):
+    # Primer valor de los primeros len(row) - 1 campos de la fila que cumple el formato de 'columna' (None si no hay)
     for i in range(len(row) - 1):
         if regex_patterns[columna].match(row[columnas[i]]):
-            global col_v
-            col_v = row[columnas[i]]
-            return True
-    return False
+            return row[columnas[i]]
+    return None
+
+def comprobar_columnas(columna, row):
+    # El valor encontrado ya no queda en una variable global (col_v): se obtiene con buscar_en_fila
+    return buscar_en_fila(columna, row) is not None
+
+def _reparar_con_mascaras(valores, limite):
+    # Clasifica cada campo una sola vez y asigna a cada columna el primer campo cuya máscara la incluye
+    reemplazos = [None] * len(columnas)
+    pendientes = _MASCARA_COMPLETA
+    for valor in valores[:limite]:
+        nuevas = clasificar_campo(valor) & pendientes
+        pendientes &= ~nuevas
+        while nuevas:
+            bit = nuevas & -nuevas
+            reemplazos[bit.bit_length() - 1] = valor
+            nuevas ^= bit
+    return reemplazos
+
+def _verificar_fila(row):
+    # Como Disposicion.verificar para una fila de csv.DictReader (dict por nombre de columna)
+    valores = [row.get(columna) for columna in columnas]
+    ausentes = _NINGUNA
+    if None in valores:
+        ausentes = frozenset(i for i, columna in enumerate(columnas) if columna not in row)
+    return _verificar_valores(valores, min(len(row) - 1, len(columnas)), ausentes)
+
+_NINGUNA = frozenset()
+
+def _verificar_valores(valores, limite, ausentes=_NINGUNA):
+    # Revisar cada valor de la fila y corregir si es necesario; 'valores' se corrige en el lugar.
+    # Devuelve la lista de valores corregidos (en el orden de 'columnas'), si la fila es errónea y las columnas con error.
+    # Como en comprobar_columnas, el reemplazo de una columna es el primero de los primeros 'limite' campos que cumple
+    # (len(row) - 1 con la fila como dict). Las columnas en 'ausentes' no están en el encabezado: su error se
+    # informa con el valor ''.
+    m = None
+    if None not in valores:
+        unido = '\x00'.join(valores)
+        if _patron_fila.match(unido):
+            return valores, False, ()  # Fila limpia: una sola pasada
+        if '\n' not in unido:
+            m = _patron_columnas_validas.match(unido)
+
+    if m:
+        # Columnas que no cumplen, y para cada una el primer campo que cumple su formato (una búsqueda por columna)
+        grupos = m.groups()
+        fallidas = [i for i, indice in _indices_columnas_validas if grupos[indice] is None]
+        delimitado = '\x00' + ('\x00'.join(valores[:limite]) if limite < len(columnas) else unido) + '\x00'
+        reemplazos = {}
+        for i in fallidas:
+            encontrado = _buscadores[i](delimitado)
+            reemplazos[i] = encontrado.group(1) if encontrado else None
+    else:
+        # Campos faltantes o con saltos de línea: reparación campo a campo con el clasificador
+        fallidas = [i for i, valor in enumerate(valores) if not clasificar_campo(valor) & (1 << i)]
+        reemplazos = _reparar_con_mascaras(valores, limite)
+
+    errores = []
+    for i in fallidas:
+        if reemplazos[i] is not None:
+            valores[i] = reemplazos[i]
+        else:
+            errores.append((columnas[i], '' if i in ausentes else valores[i]))
+            valores[i] = ""
+
+    return valores, bool(errores), errores
+
+def _imprimir_error(row_num, columna, valor):
+    print(f"Error en columna '{columna}': {valor}, En la linea: {row_num}")
+
+def _motivo_error(valor):
+    return 'vacio' if not valor else 'formato_invalido'
+
+class ReporteErrores:
+    # Recibe los campos inválidos de un análisis (se usa como reportar_error) y lleva la cuenta por
+    # columna y por motivo. En consola solo se muestran los primeros 'limite_consola' errores (None:
+    # todos) y al final un resumen; el detalle completo de las filas queda en errores.csv.
+    def __init__(self, limite_consola=100):
+        self.limite_consola = limite_consola
+        self.total = 0
+        self.por_columna = {}
+        self.por_motivo = {}
+
+    def __call__(self, row_num, columna, valor):
+        self.total += 1
+        self.por_columna[columna] = self.por_columna.get(columna, 0) + 1
+        motivo = _motivo_error(valor)
+        self.por_motivo[motivo] = self.por_motivo.get(motivo, 0) + 1
+        if self.limite_consola is None or self.total <= self.limite_consola:
+            _imprimir_error(row_num, columna, valor)
+
+    def omitidos(self):
+        if self.limite_consola is None:
+            return 0
+        return max(self.total - self.limite_consola, 0)
+
+    def imprimir_resumen(self):
+        if self.omitidos():
+            print(f"... y {self.omitidos()} errores más (ver errores.csv). Errores por columna: "
+                  + ', '.join(f"{columna}: {cantidad}" for columna, cantidad in self.por_columna.items()))
+
+    def a_dict(self):
+        return {'campos': self.total, 'por_columna': dict(self.por_columna),
+                'por_motivo': dict(self.por_motivo), 'omitidos_en_consola': self.omitidos()}
+
+def rotar_archivo(path, copias=1):
+    # Mueve 'path' a 'path.1' (y 'path.1' a 'path.2', etc.) conservando 'copias' versiones anteriores;
+    # con copias=0 solo se borra. Así cada análisis empieza su errores.csv de cero.
+    if not os.path.exists(path):
+        return
+    if copias <= 0:
+        os.remove(path)
+        return
+    for numero in range(copias - 1, 0, -1):
+        if os.path.exists(f"{path}.{numero}"):
+            os.replace(f"{path}.{numero}", f"{path}.{numero + 1}")
+    os.replace(path, f"{path}.1")
 
 def verificar_y_ordenar_fila(row, row_num):
-    # Revisar cada valor de la fila y corregir si es necesario
-    fila_corregida = {}
-    fila_erronea = False
-    for columna in columnas:
-        if columna in row and regex_patterns[columna].match(row[columna]):
-            fila_corregida[columna] = row[columna]
-        elif comprobar_columnas(columna, row):
-            fila_corregida[columna] = col_v
+    valores, fila_erronea, errores = _verificar_fila(row)
+    for columna, valor in errores:
+        _imprimir_error(row_num, columna, valor)
+    return dict(zip(columnas, valores)), fila_erronea
+
+# Registro validado de una fila. 'campos' son los 16 valores corregidos en el orden de 'columnas';
+# los enteros y la fecha son None cuando el campo correspondiente no es válido.
+Registro = namedtuple('Registro', [
+    'numero', 'erroneo', 'dia', 'mac_ap', 'input_octetos', 'output_octetos', 'session_time', 'campos'
+])
+
+_I_DIA = columnas.index('Inicio_de_Conexión_Dia')
+_I_MAC_AP = columnas.index('MAC_AP')
+_I_INPUT = columnas.index('Input_Octects')
+_I_OUTPUT = columnas.index('Output_Octects')
+_I_SESSION = columnas.index('Session_Time')
+
+def _fecha_iso(fecha):
+    # Acepta 'YYYY-MM-DD', date o datetime y devuelve 'YYYY-MM-DD' (None si no hay límite)
+    if fecha is None or isinstance(fecha, str):
+        return fecha
+    return fecha.strftime('%Y-%m-%d')
+
+def _entero(valor):
+    return int(valor) if valor else None
+
+TAMANO_BUFER = 1 << 20  # Búfer de escritura de temporal.csv y errores.csv
+
+_fecha_valida = regex_patterns['Inicio_de_Conexión_Dia'].match
+
+def fuera_de_rango(dia, desde, hasta):
+    # Filtro previo barato: True si el día crudo de la fila (sin validar) tiene formato válido y queda
+    # fuera de [desde, hasta]. Un día válido nunca se reemplaza al reparar la fila, así que esas filas
+    # se descartan antes de pagar la validación. Las fechas YYYY-MM-DD se comparan como texto.
+    return (dia is not None and ((desde is not None and dia < desde) or (hasta is not None and dia > hasta))
+            and _fecha_valida(dia) is not None)
+
+class Disposicion:
+    # Posición de cada columna de 'columnas' en las filas de csv.reader, calculada una vez por archivo a partir
+    # del encabezado, para leer las filas como listas en lugar de los dicts de csv.DictReader. Se ve lo mismo
+    # que en el dict: con nombres repetidos vale el último, a una fila corta le faltan (None) los últimos
+    # campos y los campos de más no corresponden a ninguna columna.
+    def __init__(self, encabezado):
+        posiciones = {nombre: indice for indice, nombre in enumerate(encabezado)}
+        self.largo = len(encabezado)
+        self.claves = len(posiciones)  # len() del dict de DictReader para una fila sin campos de más
+        self.posiciones = [posiciones.get(columna) for columna in columnas]
+        self.ausentes = frozenset(i for i, posicion in enumerate(self.posiciones) if posicion is None)
+        self.en_orden = self.posiciones == list(range(len(columnas)))  # Encabezado estándar: las columnas al principio
+        self.posicion_dia = posiciones.get('Inicio_de_Conexión_Dia')
+
+    def dia(self, fila):
+        posicion = self.posicion_dia
+        return fila[posicion] if posicion is not None and posicion < len(fila) else None
+
+    def valores(self, fila):
+        if self.en_orden and len(fila) >= len(columnas):
+            return fila[:len(columnas)]
+        return [fila[posicion] if posicion is not None and posicion < len(fila) else None
+                for posicion in self.posiciones]
+
+    def verificar(self, fila):
+        if self.en_orden and len(fila) >= len(columnas):
+            valores = fila[:len(columnas)]
+            if _patron_fila.match('\x00'.join(valores)):
+                return valores, False, ()  # Fila limpia, sin pasar por _verificar_valores
+        else:
+            valores = self.valores(fila)
+        limite = min(self.claves + (len(fila) > self.largo) - 1, len(columnas))
+        return _verificar_valores(valores, limite, self.ausentes)
+
+class _FilasDict:
+    # La misma interfaz que Disposicion para filas que ya son dicts por nombre de columna
+    def dia(self, row):
+        return row.get('Inicio_de_Conexión_Dia')
+
+    def valores(self, row):
+        return [row.get(columna) for columna in columnas]
+
+    def verificar(self, row):
+        return _verificar_fila(row)
+
+_FILAS_DICT = _FilasDict()
+
+def _filas_csv(lineas, encabezado=None):
+    # Filas de csv.reader sobre 'lineas' sin las vacías (como csv.DictReader) y la Disposicion del encabezado,
+    # que sin 'encabezado' es la primera fila
+    reader = csv.reader(lineas)
+    if encabezado is None:
+        encabezado = next(reader, [])
+    return filter(None, reader), Disposicion(encabezado)
+
+def _registros_de_filas(filas, desde=None, hasta=None, reportar_error=None, metricas=None, disposicion=None,
+                        rango_errores=None):
+    # Valida cada (número, fila) y produce los registros cuyo día de inicio está en [desde, hasta].
+    # Las filas son listas de csv.reader ubicadas con 'disposicion' o, sin ella, dicts por nombre de columna.
+    # Las filas fuera de rango se descartan sin validarlas, así que solo se informan los errores de
+    # las filas del rango. Una fila sin día de inicio válido no puede filtrarse por fecha y se
+    # produce siempre como errónea. Con 'metricas' (ver metricas.Metricas) se miden las etapas.
+    # Con 'rango_errores' (desde, hasta) solo se informan los errores de las filas que el prefiltro de ese
+    # rango no descartaría: así, leyendo todas las fechas, se informa lo mismo que en un análisis del rango.
+    desde, hasta = _fecha_iso(desde), _fecha_iso(hasta)
+    acotado = desde is not None or hasta is not None
+    if rango_errores is not None:
+        errores_desde, errores_hasta = _fecha_iso(rango_errores[0]), _fecha_iso(rango_errores[1])
+    if disposicion is None:
+        disposicion = _FILAS_DICT
+    dia_crudo, prefiltro, verificar = disposicion.dia, fuera_de_rango, disposicion.verificar
+    if metricas is not None:
+        filas = metricas.leer(filas)
+        prefiltro = metricas.prefiltro
+
+        def verificar(row):
+            return metricas.verificar(row, disposicion)
+    for row_num, row in filas:
+        if acotado and prefiltro(dia_crudo(row), desde, hasta):
+            if metricas is not None:
+                metricas.contar_fuera_de_rango()
+            continue
+        campos, fila_erronea, errores = verificar(row)
+        if reportar_error is not None and (rango_errores is None
+                                           or not fuera_de_rango(dia_crudo(row), errores_desde, errores_hasta)):
+            for columna, valor in errores:
+                reportar_error(row_num, columna, valor)
+
+        dia = campos[_I_DIA]
+        if dia and ((desde is not None and dia < desde) or (hasta is not None and dia > hasta)):
+            if metricas is not None:
+                metricas.contar_fuera_de_rango()
+            continue
+        try:
+            dia = date.fromisoformat(dia)
+        except ValueError:
+            dia, fila_erronea = None, True
+        if fila_erronea:
+            yield Registro(row_num, True, dia, campos[_I_MAC_AP], _entero(campos[_I_INPUT]),
+                           _entero(campos[_I_OUTPUT]), _entero(campos[_I_SESSION]), campos)
         else:
-            print(f"Error en columna '{columna}': {row.get(columna, '')}, En la linea: {row_num}")
-            fila_corregida[columna] = ""
-            fila_erronea = True
-
-    return fila_corregida, fila_erronea
-
-def analizar_csv(file_path, fecha_inicio, fecha_fin):
-    archivo_temporal = 'temporal.csv'
-    archivo_errores = 'errores.csv'
-    ap_trafico = {}
-
-    fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d')
-    fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d')
-
-    datos_exportar = []
-
-    with open(file_path, newline='', encoding='utf-8') as csvfile, \
-            open(archivo_temporal, 'w', newline='', encoding='utf-8') as temporalfile, \
-            open(archivo_errores, 'a', newline='', encoding='utf-8') as errfile:  # Abrir en modo 'a' para añadir
-
-        reader = csv.DictReader(csvfile)  # Crear lector de CSV con diccionarios
-        writer = csv.DictWriter(temporalfile, fieldnames=columnas + ['', ''])  # Escritor para archivo temporal
-        error_writer = csv.DictWriter(errfile, fieldnames=columnas + ['', ''])  # Escritor para archivo de errores
-
-        writer.writeheader()  # Escribir los encabezados en el archivo temporal
-        # No escribimos los encabezados en errores.csv porque ya están escritos
-
-        for row_num, row in enumerate(reader, start=1):
-            row, fila_erronea = verificar_y_ordenar_fila(row, row_num)
-
-            # Filtrar por fecha de conexión
-            fecha_conexion_dt = datetime.strptime(row['Inicio_de_Conexión_Dia'], '%Y-%m-%d')
-            if fecha_inicio_dt <= fecha_conexion_dt <= fecha_fin_dt:
-                if not fila_erronea:
-                    ap = row['MAC_AP']
-                    trafico = int(row['Input_Octects']) + int(row['Output_Octects'])
-                    
-                    # Actualizar el diccionario 'ap_trafico' con el tráfico acumulado por AP
-                    if ap in ap_trafico:
-                        ap_trafico[ap] += trafico
-                    else:
-                        ap_trafico[ap] = trafico
-
-                    # Crear fila con campos vacíos al final
-                    filtered_row = {k: row[k] for k in columnas if k in row} #Acomoda las columnas
-                    filtered_row.update({'': '', '': ''})
-
-                    # Escribir la fila en el archivo temporal
-                    writer.writerow(filtered_row)
-                    datos_exportar.append(filtered_row)
+            yield Registro(row_num, False, dia, campos[_I_MAC_AP], int(campos[_I_INPUT]),
+                           int(campos[_I_OUTPUT]), int(campos[_I_SESSION]), campos)
+
+class AnalisisCancelado(Exception):
+    pass
+
+class Progreso:
+    # Avance de la lectura de un análisis. La lectura llama a avanzar() cada tantas filas; cada 'intervalo'
+    # segundos se llama a al_avanzar(progreso) y, si cancelado() devuelve True, se corta con AnalisisCancelado.
+    # 'acumulador' es el AcumuladorTrafico del análisis, para mostrar resultados parciales.
+    def __init__(self, total_bytes, al_avanzar=None, cancelado=None, intervalo=0.2):
+        self.total_bytes = total_bytes
+        self.bytes_leidos = 0
+        self.filas = 0
+        self.acumulador = None
+        self.al_avanzar = al_avanzar
+        self.cancelado = cancelado
+        self.intervalo = intervalo
+        self.inicio = time.perf_counter()
+        self._ultimo_aviso = self.inicio
+
+    def filas_por_segundo(self):
+        segundos = time.perf_counter() - self.inicio
+        return self.filas / segundos if segundos > 0 else 0.0
+
+    def avanzar(self, filas, bytes_leidos, forzar=False):
+        self.filas = filas
+        self.bytes_leidos = bytes_leidos
+        if self.cancelado is not None and self.cancelado():
+            raise AnalisisCancelado()
+        ahora = time.perf_counter()
+        if self.al_avanzar is not None and (forzar or ahora - self._ultimo_aviso >= self.intervalo):
+            self._ultimo_aviso = ahora
+            self.al_avanzar(self)
+
+    def seguir(self, filas, posicion, cada=1024):
+        # Envuelve un iterador de (número, fila); posicion() devuelve los bytes leídos del archivo
+        base = self.filas
+        leidas = 0
+        for leidas, fila in enumerate(filas, start=1):
+            if leidas % cada == 0:
+                self.avanzar(base + leidas, posicion())
+            yield fila
+        self.avanzar(base + leidas, posicion(), forzar=True)
+
+def iter_registros(path, desde=None, hasta=None, reportar_error=None, progreso=None, metricas=None,
+                   rango_errores=None):
+    # Lee el CSV fila a fila y produce un Registro por cada fila en el rango de fechas, sin acumular nada en memoria.
+    # reportar_error(numero_de_fila, columna, valor) se llama por cada campo inválido de las filas que pasan el
+    # prefiltro de fechas: las de otros días se descartan sin validarlas (ver _registros_de_filas, también para
+    # 'rango_errores').
+    # Con 'progreso' (un Progreso) se informa el avance por bytes leídos y se puede cancelar la lectura.
+    # Un archivo comprimido (gzip, bz2 o xz) se descomprime mientras se lee; el avance es sobre los bytes comprimidos.
+    # Las filas se leen como listas con la Disposicion del encabezado.
+    with abrir_texto(path) as (csvfile, posicion):
+        filas, disposicion = _filas_csv(csvfile)
+        filas = enumerate(filas, start=1)
+        if progreso is not None:
+            filas = progreso.seguir(filas, posicion)
+        yield from _registros_de_filas(filas, desde, hasta, reportar_error, metricas, disposicion, rango_errores)
+
+class Diccionario:
+    # Codifica valores repetidos (MAC_AP, usuarios, días...) como enteros chicos, en orden de primera
+    # aparición. Cada valor distinto se guarda una sola vez; 'valores[codigo]' lo devuelve.
+    __slots__ = ('codigos', 'valores')
+
+    def __init__(self, valores=()):
+        self.codigos = {}
+        self.valores = []
+        for valor in valores:
+            self.codigo(valor)
+
+    def codigo(self, valor):
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = self.codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+    def __len__(self):
+        return len(self.valores)
+
+    def __getitem__(self, codigo):
+        return self.valores[codigo]
+
+# Consumidores de registros: se combinan con consumir() y cada uno recibe todos los registros.
+class AcumuladorTrafico:
+    # Suma Input_Octects + Output_Octects y cuenta las sesiones por MAC_AP de los registros sin errores.
+    # Las AP se codifican con un Diccionario y 'trafico' y 'sesiones' son listas indexadas por código;
+    # los dicts por MAC_AP (ap_trafico, ap_sesiones) se arman recién al pedirlos.
+    def __init__(self):
+        self.aps = Diccionario()
+        self.trafico = []
+        self.sesiones = []
+        self.filas_validas = 0
+        self.filas_erroneas = 0
+
+    def __call__(self, registro):
+        if registro.erroneo:
+            self.filas_erroneas += 1
+            return
+        codigo = self.aps.codigos.get(registro.mac_ap)
+        if codigo is None:
+            codigo = self.codigo(registro.mac_ap)
+        self.trafico[codigo] += registro.input_octetos + registro.output_octetos
+        self.sesiones[codigo] += 1
+        self.filas_validas += 1
+
+    def codigo(self, ap):
+        # Código de la AP, agregándola con tráfico y sesiones en cero si es nueva
+        codigo = self.aps.codigo(ap)
+        if codigo == len(self.trafico):
+            self.trafico.append(0)
+            self.sesiones.append(0)
+        return codigo
+
+    def sumar(self, ap, trafico, sesiones):
+        codigo = self.codigo(ap)
+        self.trafico[codigo] += trafico
+        self.sesiones[codigo] += sesiones
+
+    @property
+    def ap_trafico(self):
+        return dict(zip(self.aps.valores, self.trafico))
+
+    @property
+    def ap_sesiones(self):
+        return dict(zip(self.aps.valores, self.sesiones))
+
+    def top(self, cantidad):
+        # Las 'cantidad' AP de más tráfico hasta el momento como (MAC_AP, octetos), sin ordenar todas
+        codigos = heapq.nlargest(cantidad, range(len(self.trafico)), key=self.trafico.__getitem__)
+        return [(self.aps[codigo], self.trafico[codigo]) for codigo in codigos]
+
+    def columnas_por_ap(self):
+        # MAC_AP, octetos, sesiones y error de cada AP para ResultadoAnalisis (el error es None: los totales son exactos)
+        return self.aps.valores, self.trafico, self.sesiones, None
+
+    def cotas(self):
+        return None
+
+    def combinar(self, otro):
+        # Suma otro acumulador (por ejemplo el de un proceso del modo paralelo) respetando el orden de aparición
+        for ap, trafico, sesiones in zip(otro.aps.valores, otro.trafico, otro.sesiones):
+            self.sumar(ap, trafico, sesiones)
+        self.filas_validas += otro.filas_validas
+        self.filas_erroneas += otro.filas_erroneas
+
+def nuevo_acumulador(memoria_top=None):
+    # AcumuladorTrafico exacto o, con un presupuesto de memoria en bytes, frecuentes.AcumuladorFrecuentes
+    if memoria_top is None:
+        return AcumuladorTrafico()
+    from frecuentes import AcumuladorFrecuentes
+    return AcumuladorFrecuentes(memoria_top)
+
+class EscritorFilas:
+    # Escribe en un CSV abierto los registros limpios (o los erróneos), con las dos columnas vacías al final
+    def __init__(self, archivo, erroneas=False, encabezado=False):
+        self.archivo = archivo
+        self.writer = csv.writer(archivo)
+        self.erroneas = erroneas
+        if encabezado:
+            self.writer.writerow(columnas + ['', ''])
+
+    def __call__(self, registro):
+        if registro.erroneo == self.erroneas:
+            self.writer.writerow(registro.campos + ['', ''])
+
+class FiltroFechas:
+    # Reenvía a los consumidores solo los registros con día en [desde, hasta] y los que no tienen día válido
+    def __init__(self, desde, hasta, *consumidores):
+        self.desde = date.fromisoformat(_fecha_iso(desde)) if desde is not None else None
+        self.hasta = date.fromisoformat(_fecha_iso(hasta)) if hasta is not None else None
+        self.consumidores = consumidores
+
+    def __call__(self, registro):
+        dia = registro.dia
+        if dia is not None and ((self.desde is not None and dia < self.desde)
+                                or (self.hasta is not None and dia > self.hasta)):
+            return
+        for consumidor in self.consumidores:
+            consumidor(registro)
+
+def consumir(registros, *consumidores):
+    for registro in registros:
+        for consumidor in consumidores:
+            consumidor(registro)
+
+class ResultadoAnalisis:
+    # Resultado de analizar_csv: totales y sesiones por AP, cantidad de filas y datos del análisis.
+    # 'aps' son las MAC_AP en orden de aparición y 'trafico' y 'sesiones' listas paralelas; los textos por
+    # AP se arman al mostrar o exportar.
+    # filas_erroneas es None cuando el resultado sale de la caché (las filas erróneas no se guardan ahí).
+    def __init__(self, aps, trafico, sesiones, filas_validas, filas_erroneas, archivo, fecha_inicio, fecha_fin,
+                 origen, segundos=None, metricas=None):
+        self.aps = aps
+        self.trafico = trafico
+        self.sesiones = sesiones
+        self.filas_validas = filas_validas
+        self.filas_erroneas = filas_erroneas
+        self.archivo = archivo
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.origen = origen  # 'csv', 'paralelo', 'indice', 'cache', 'memoria' o 'seguimiento'
+        self.segundos = segundos
+        self.errores = None  # Resumen de ReporteErrores.a_dict() (None si el resultado sale de la caché)
+        self.metricas = metricas  # Dict de metricas.Metricas.a_dict() si se pidieron, si no None
+        self.filas = None  # compacto.TablaRegistros con las filas limpias si se pidió retener_filas
+        self.analitica = None  # analitica.Analitica si se pidió analitica
+        self.error_trafico = None  # Con memoria_top, error máximo del tráfico de cada AP (paralela a 'aps')
+        self.cotas = None  # Con memoria_top, cotas de error del ranking aproximado (frecuentes.TraficoFrecuente.cotas())
+        self.duplicados = None  # Con deduplicar, sesiones descartadas y estado del filtro (duplicados.Deduplicador.a_dict())
+
+    @classmethod
+    def desde_acumulador(cls, acumulador, archivo, fecha_inicio, fecha_fin, origen, segundos=None, metricas=None):
+        aps, trafico, sesiones, error_trafico = acumulador.columnas_por_ap()
+        resultado = cls(aps, trafico, sesiones, acumulador.filas_validas, acumulador.filas_erroneas, archivo,
+                        fecha_inicio, fecha_fin, origen, segundos, metricas)
+        resultado.error_trafico = error_trafico
+        resultado.cotas = acumulador.cotas()
+        return resultado
+
+    @property
+    def ap_trafico(self):
+        return dict(zip(self.aps, self.trafico))
+
+    @property
+    def ap_sesiones(self):
+        return dict(zip(self.aps, self.sesiones))
+
+    def _orden(self, cantidad=None):
+        # Códigos de AP de mayor a menor tráfico (a igual tráfico, en orden de aparición). Con 'cantidad' solo
+        # los primeros, elegidos con un montículo en lugar de ordenar todas las AP.
+        codigos = range(len(self.trafico))
+        if cantidad is None or cantidad >= len(codigos):
+            return sorted(codigos, key=self.trafico.__getitem__, reverse=True)
+        return heapq.nlargest(cantidad, codigos, key=self.trafico.__getitem__)
+
+    def ranking(self, top=None, desde=0):
+        # Lista de (MAC_AP, octetos) de mayor a menor tráfico; con 'top', la página de 'top' AP a partir de 'desde'
+        orden = self._orden(None if top is None else desde + top)
+        return [(self.aps[codigo], self.trafico[codigo]) for codigo in orden[desde:]]
+
+    def por_ap(self, top=None, desde=0):
+        # (MAC_AP, octetos, sesiones) de mayor a menor tráfico, más el error máximo si el ranking es aproximado;
+        # con 'top', la página de 'top' AP a partir de 'desde'
+        orden = self._orden(None if top is None else desde + top)[desde:]
+        if self.error_trafico is None:
+            return [(self.aps[codigo], self.trafico[codigo], self.sesiones[codigo]) for codigo in orden]
+        return [(self.aps[codigo], self.trafico[codigo], self.sesiones[codigo], self.error_trafico[codigo])
+                for codigo in orden]
+
+    def a_dict(self, top=None):
+        # Resumen serializable (por ejemplo a JSON), con las AP de mayor a menor tráfico
+        claves = ['mac_ap', 'octetos', 'sesiones', 'error_maximo']
+        aps = [dict(zip(claves, fila)) for fila in self.por_ap(top)]
+        return {
+            'archivo': self.archivo,
+            'fecha_inicio': _fecha_iso(self.fecha_inicio),
+            'fecha_fin': _fecha_iso(self.fecha_fin),
+            'origen': self.origen,
+            'segundos': self.segundos,
+            'filas_validas': self.filas_validas,
+            'filas_erroneas': self.filas_erroneas,
+            'errores': self.errores,
+            'metricas': self.metricas,
+            'analitica': self.analitica.a_dict(top) if self.analitica is not None else None,
+            'cotas': self.cotas,
+            'duplicados': self.duplicados,
+            'aps': aps,
+        }
+
+    def __str__(self):
+        return formatear_resultado(self)
+
+def formatear_resultado(resultado, top=None, desde=0):
+    # Texto del informe que se muestra en la interfaz; con 'top' solo la página de 'top' AP desde la posición 'desde'
+    texto = "Análisis completado.\n\n"
+    texto += "AP con más tráfico en el rango de fechas especificado:\n"
+    filas = resultado.por_ap(top, desde)
+    for fila in filas:
+        texto += f"{fila[0]}: {fila[1]} octetos" + (f" (error <= {fila[3]})\n" if len(fila) > 3 else "\n")
+    if top is not None:
+        texto += f"(AP {desde + 1 if filas else desde}-{desde + len(filas)} de {len(resultado.aps)})\n"
+    if resultado.cotas is not None:
+        cotas = resultado.cotas
+        texto += (f"Ranking aproximado en {cotas['memoria']} bytes ({cotas['contadores']} contadores): toda AP con más de "
+                  f"{cotas['total'] // cotas['contadores']} octetos está en la lista y cada total sobrestima el real en "
+                  f"a lo sumo el error indicado (<= {cotas['error_space_saving']}; Count-Min: "
+                  f"<= {cotas['error_count_min']} con probabilidad {cotas['probabilidad_count_min']:.2f})\n")
+    if resultado.duplicados is not None:
+        duplicados = resultado.duplicados
+        texto += (f"Sesiones repetidas descartadas: {duplicados['descartadas']} ({duplicados['sesiones']} sesiones "
+                  f"vistas, filtro {duplicados['modo']} de {duplicados['bytes']} bytes"
+                  + (f", probabilidad de falso positivo {duplicados['tasa_falsos']:.2g})\n"
+                     if duplicados['modo'] == 'bloom' else ")\n"))
+    if resultado.analitica is not None:
+        texto += resultado.analitica.texto()
+    return texto
+
+def _metricas_finales(medidas, acumulador, archivo_metricas):
+    if medidas is None:
+        return None
+    from metricas import escribir_prometheus
+    if acumulador is not None:
+        medidas.contar_filas(acumulador)
+    resumen = medidas.a_dict()
+    if archivo_metricas is not None:
+        escribir_prometheus(resumen, archivo_metricas)
+    return resumen
+
+def analizar_csv(file_path, fecha_inicio, fecha_fin, workers=1, usar_cache=False, usar_indice=False,
+                 al_avanzar=None, cancelado=None, archivo_temporal='temporal.csv', archivo_errores='errores.csv',
+                 metricas=False, archivo_metricas=None, limite_errores_consola=100, copias_errores=1, motor='python',
+                 retener_filas=False, analitica=None, memoria_top=None, comprimir_salida=None, memorizar=False,
+                 deduplicar=None, en_etapas=False):
+    # Devuelve un ResultadoAnalisis; el texto del informe se obtiene con formatear_resultado().
+    # al_avanzar(progreso) recibe cada tanto un Progreso con los bytes y filas leídos y el tráfico parcial;
+    # si cancelado() devuelve True el análisis se corta con AnalisisCancelado (temporal.csv queda incompleto).
+    # Con metricas=True el resultado trae en .metricas los tiempos por etapa y los contadores de filas,
+    # reparaciones y errores por columna; con archivo_metricas además se escriben en formato Prometheus.
+    # Los campos inválidos se muestran en consola hasta limite_errores_consola (None: todos) y el
+    # errores.csv anterior se conserva como errores.csv.1 (copias_errores=0 lo descarta).
+    # motor='numpy' valida y suma por bloques con numpy (ver motor_numpy); solo para el recorrido secuencial.
+    # Con retener_filas=True las filas limpias del rango quedan en resultado.filas (compacto.TablaRegistros).
+    # analitica=True (o una lista de analitica.DIMENSIONES) calcula en la misma pasada el tráfico por usuario y
+    # por cliente, el histograma por hora y demás; queda en resultado.analitica.
+    # Con memoria_top (bytes) los rankings por AP, usuario y cliente son aproximados y de memoria fija (ver
+    # frecuentes); las cotas de error quedan en resultado.cotas y resultado.error_trafico.
+    # El CSV puede estar comprimido (gzip, bz2 o xz, ver comprimido). Con comprimir_salida ('gzip', 'bz2' o 'xz')
+    # temporal.csv y errores.csv se escriben comprimidos, con la extensión agregada al nombre.
+    # Con memorizar=True la primera pasada guarda en memoria resúmenes por día (ver resumen_diario) y los
+    # análisis siguientes del mismo archivo, con cualquier rango, se calculan con ellos sin leer el CSV
+    # (temporal.csv y errores.csv quedan como los dejó la primera pasada).
+    # deduplicar (un duplicados.Deduplicador, o True para uno nuevo) descarta antes de sumar las filas válidas
+    # cuya sesión (ID_Conexión_unico e ID_Sesion) ya se vio en este análisis o, si el Deduplicador se comparte,
+    # en los anteriores; el resumen queda en resultado.duplicados.
+    # Con en_etapas=True la lectura y la escritura de temporal.csv y errores.csv van en hilos aparte unidos por
+    # colas acotadas (ver etapas), para que la espera del disco no frene la validación; las salidas son las mismas.
+    inicio = time.perf_counter()
+
+    # Validar el formato de las fechas recibidas
+    datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    datetime.strptime(fecha_fin, '%Y-%m-%d')
+
+    if motor not in ('python', 'numpy'):
+        raise ValueError(f"Motor desconocido: {motor}")
+    if motor == 'numpy':
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise ValueError("El motor 'numpy' necesita numpy, que es opcional: pip install numpy "
+                             "(ver requirements.txt)") from None
+    if motor == 'numpy' and (workers > 1 or usar_cache or usar_indice or metricas or archivo_metricas is not None):
+        raise ValueError("El motor 'numpy' no se combina con workers, caché, índice ni métricas")
+    if retener_filas and (motor == 'numpy' or workers > 1 or usar_cache):
+        raise ValueError("retener_filas no se combina con el motor 'numpy', workers ni caché")
+    if analitica and (motor == 'numpy' or usar_cache):
+        raise ValueError("La analítica no se combina con el motor 'numpy' ni con la caché")
+    if memoria_top is not None and (motor == 'numpy' or usar_cache):
+        raise ValueError("memoria_top no se combina con el motor 'numpy' ni con la caché")
+    if memorizar and (motor == 'numpy' or workers > 1 or usar_indice or retener_filas or analitica
+                      or memoria_top is not None):
+        raise ValueError("memorizar no se combina con el motor 'numpy', workers, índice, retener_filas, "
+                         "analítica ni memoria_top")
+    if deduplicar and (motor == 'numpy' or workers > 1 or usar_cache or memorizar):
+        raise ValueError("deduplicar no se combina con el motor 'numpy', workers, caché ni memorizar")
+    if en_etapas and (motor == 'numpy' or workers > 1 or usar_indice or memorizar):
+        raise ValueError("en_etapas no se combina con el motor 'numpy', workers, índice ni memorizar")
+    if comprimir_salida is not None and comprimir_salida not in FORMATOS:
+        raise ValueError(f"Formato de compresión desconocido: {comprimir_salida}")
+    archivo_temporal = ruta_salida(archivo_temporal, comprimir_salida)
+    archivo_errores = ruta_salida(archivo_errores, comprimir_salida)
+    dimensiones = None
+    if analitica:
+        from analitica import DIMENSIONES, Analitica
+        dimensiones = DIMENSIONES if analitica is True else list(analitica)
+        Analitica(dimensiones, memoria_top)  # Valida las dimensiones antes de leer el archivo
+
+    deduplicador = None
+    if deduplicar is True:
+        from duplicados import Deduplicador
+        deduplicador = Deduplicador()
+    elif deduplicar:
+        deduplicador = deduplicar
+    descartadas = deduplicador.descartadas if deduplicador is not None else 0
+
+    progreso = None
+    if al_avanzar is not None or cancelado is not None:
+        progreso = Progreso(os.path.getsize(file_path), al_avanzar, cancelado)
+
+    medidas = None
+    if metricas or archivo_metricas is not None:
+        from metricas import Metricas
+        medidas = Metricas()
+
+    resumen = None
+    if memorizar:
+        from resumen_diario import ResumenDiario, resumenes
+        memorizado = resumenes.buscar(file_path)
+        if memorizado is not None:
+            if medidas is not None:
+                medidas.etapas['agregacion'] = time.perf_counter() - inicio
+            resultado = memorizado.resultado(fecha_inicio, fecha_fin, limite_errores_consola)
+            resultado.segundos = time.perf_counter() - inicio
+            resultado.metricas = _metricas_finales(medidas, resultado, archivo_metricas)
+            return resultado
+        resumen = ResumenDiario(file_path)
+
+    constructor = None
+    if usar_cache:
+        # Con caché válida el resultado sale de las columnas guardadas, sin leer el CSV
+        # (temporal.csv y errores.csv quedan como los dejó el análisis que creó la caché)
+        from cache_columnar import ConstructorCache, cargar_cache
+        cache = cargar_cache(file_path)
+        if cache is not None:
+            with cache:
+                aps, trafico, sesiones = cache.resumen_por_ap(fecha_inicio, fecha_fin)
+            if medidas is not None:
+                medidas.etapas['agregacion'] = time.perf_counter() - inicio
+                medidas.filas_validas = sum(sesiones)
+            return ResultadoAnalisis(aps, trafico, sesiones, sum(sesiones), None, file_path,
+                                     fecha_inicio, fecha_fin, 'cache', time.perf_counter() - inicio,
+                                     _metricas_finales(medidas, None, archivo_metricas))
+        constructor = ConstructorCache(file_path)
+
+    if workers > 1 and constructor is None and not usar_indice:
+        # Modo paralelo: el archivo se divide en rangos de bytes que se procesan en varios procesos
+        from paralelo import analizar_en_paralelo
+        rotar_archivo(archivo_errores, copias_errores)
+        reporte = ReporteErrores(limite_errores_consola)
+        acumulador, calculo = analizar_en_paralelo(file_path, fecha_inicio, fecha_fin, workers,
+                                                  archivo_temporal, archivo_errores, progreso, medidas, reporte,
+                                                  dimensiones, memoria_top, comprimir_salida)
+        reporte.imprimir_resumen()
+        resultado = ResultadoAnalisis.desde_acumulador(acumulador, file_path, fecha_inicio, fecha_fin, 'paralelo',
+                                                       time.perf_counter() - inicio,
+                                                       _metricas_finales(medidas, acumulador, archivo_metricas))
+        resultado.errores = reporte.a_dict()
+        resultado.analitica = calculo
+        return resultado
+
+    # Las filas se procesan en streaming: solo se conservan (compactas) con retener_filas. Las salidas usan un búfer
+    # grande para escribir en bloques y errores.csv empieza de cero en cada análisis.
+    rotar_archivo(archivo_errores, copias_errores)
+    reporte = ReporteErrores(limite_errores_consola)
+    leer = iter_registros
+    with abrir_salida(archivo_temporal, comprimir_salida, TAMANO_BUFER) as temporalfile, \
+            abrir_salida(archivo_errores, comprimir_salida, TAMANO_BUFER) as errfile, ExitStack() as etapas:
+        if en_etapas:
+            # Los escritores terminan (y vacían sus colas) antes de que se cierren los archivos
+            from etapas import SalidaEnLotes, iter_registros_en_etapas
+            temporalfile = etapas.enter_context(SalidaEnLotes(temporalfile))
+            errfile = etapas.enter_context(SalidaEnLotes(errfile))
+            leer = iter_registros_en_etapas
+        acumulador = nuevo_acumulador(memoria_top)
+        if progreso is not None:
+            progreso.acumulador = acumulador
+        consumidores = [acumulador,
+                        EscritorFilas(temporalfile, encabezado=True),
+                        EscritorFilas(errfile, erroneas=True, encabezado=True)]
+        if medidas is not None:
+            from metricas import cronometrar_consumidores
+            consumidores = cronometrar_consumidores(medidas, consumidores[0], consumidores[1:])
+        filas = None
+        if retener_filas:
+            from compacto import TablaRegistros
+            filas = TablaRegistros()
+            consumidores.append(filas)
+        calculo = None
+        if dimensiones is not None:
+            calculo = Analitica(dimensiones, memoria_top)
+            consumidores.append(calculo if medidas is None else medidas.cronometrar('agregacion', calculo))
+        if deduplicador is not None:
+            # Las sesiones repetidas no llegan a la suma, a temporal.csv ni a la analítica
+            from duplicados import FiltroDuplicados
+            consumidores = [FiltroDuplicados(deduplicador, *consumidores)]
+        if constructor is None and resumen is None:
+            if motor == 'numpy':
+                # Validación y suma por bloques; escribe en los mismos EscritorFilas
+                from motor_numpy import procesar_csv
+                procesar_csv(file_path, fecha_inicio, fecha_fin, *consumidores, reportar_error=reporte,
+                             progreso=progreso)
+            else:
+                if usar_indice:
+                    # Con el índice de fechas solo se leen los tramos del archivo que pueden caer en el rango
+                    from indice_fechas import iter_registros_indexados
+                    registros = iter_registros_indexados(file_path, fecha_inicio, fecha_fin, reportar_error=reporte,
+                                                         progreso=progreso, metricas=medidas)
                 else:
-                    # Escribir la fila errónea en el archivo de errores
-                    filtered_row = {k: row[k] for k in columnas if k in row}
-                    filtered_row.update({'': '', '': ''})
-                    error_writer.writerow(filtered_row)
-
-    # No reemplazar el archivo original con el archivo temporal, solo cerrar los archivos
-    temporalfile.close()
-    errfile.close()
-
-    # Preparar el resultado a retornar
-    resultado = "Análisis completado.\n\n"
-    resultado += "AP con más tráfico en el rango de fechas especificado:\n"
-    for ap, trafico in sorted(ap_trafico.items(), key=lambda item: item[1], reverse=True):
-        resultado += f"{ap}: {trafico} octetos\n"
-    return resultado
+                    registros = leer(file_path, fecha_inicio, fecha_fin, reportar_error=reporte, progreso=progreso,
+                                     metricas=medidas)
+                consumir(registros, *consumidores)
+        else:
+            # Para armar la caché o los resúmenes por día se leen todas las fechas y el rango se aplica después
+            previos = []
+            if constructor is not None:
+                previos.append(constructor if medidas is None else medidas.cronometrar('escritura', constructor))
+            if resumen is None:
+                # Los errores se informan como en un análisis del rango, no los de todas las fechas
+                registros = leer(file_path, reportar_error=reporte, progreso=progreso, metricas=medidas,
+                                 rango_errores=(fecha_inicio, fecha_fin))
+            else:
+                registros = resumen.registros(fecha_inicio, fecha_fin, reporte, progreso, medidas)
+                previos.append(resumen if medidas is None else medidas.cronometrar('agregacion', resumen))
+            try:
+                consumir(registros, *previos, FiltroFechas(fecha_inicio, fecha_fin, *consumidores))
+            except BaseException:
+                if constructor is not None:
+                    constructor.descartar()
+                raise
+            if constructor is not None:
+                constructor.guardar()
+            if resumen is not None:
+                resumenes.guardar(resumen)
 
+    reporte.imprimir_resumen()
+    resultado = ResultadoAnalisis.desde_acumulador(acumulador, file_path, fecha_inicio, fecha_fin,
+                                                   'indice' if usar_indice and constructor is None else 'csv',
+                                                   time.perf_counter() - inicio,
+                                                   _metricas_finales(medidas, acumulador, archivo_metricas))
+    resultado.errores = reporte.a_dict()
+    resultado.filas = filas
+    resultado.analitica = calculo
+    if deduplicador is not None:
+        resultado.duplicados = deduplicador.a_dict()
+        resultado.duplicados['descartadas'] -= descartadas  # Solo las de este análisis
+    return resultado
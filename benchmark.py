@@ -0,0 +1,866 @@
+import csv
+import filecmp
+import heapq
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from automatas import analizar_csv, columnas, consumir, iter_registros, regex_patterns, verificar_y_ordenar_fila
+from cli import escribir_json
+from generador import PERFILES, escribir_csv_radius
+
+# Implementación original (una regex por columna y búsqueda en toda la fila al fallar),
+# se mantiene aquí como referencia para comparar resultados y velocidad.
+def comprobar_columnas_original(columna, row):
+    for i in range(len(row) - 1):
+        if regex_patterns[columna].match(row[columnas[i]]):
+            return row[columnas[i]]
+    return None
+
+def verificar_y_ordenar_fila_original(row, row_num):
+    fila_corregida = {}
+    fila_erronea = False
+    for columna in columnas:
+        if columna in row and regex_patterns[columna].match(row[columna]):
+            fila_corregida[columna] = row[columna]
+        else:
+            valor = comprobar_columnas_original(columna, row)
+            if valor is not None:
+                fila_corregida[columna] = valor
+            else:
+                print(f"Error en columna '{columna}': {row.get(columna, '')}, En la linea: {row_num}")
+                fila_corregida[columna] = ""
+                fila_erronea = True
+    return fila_corregida, fila_erronea
+
+# Generación de filas sintéticas con el formato de las columnas
+def _mac(rng):
+    return '-'.join(f"{rng.randrange(256):02X}" for _ in range(6))
+
+_aps = [_mac(random.Random(i)) + ':HCDD' for i in range(200)]  # Cantidad acotada de AP, como en un despliegue real
+
+def fila_sintetica(rng, indice):
+    dia = f"2019-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    hora = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+    valores = [
+        str(100000 + indice),
+        ''.join(rng.choice('0123456789ABCDEF') for _ in range(8)) + '-' + ''.join(rng.choice('0123456789ABCDEF') for _ in range(8)),
+        ''.join(rng.choice('0123456789abcdef') for _ in range(16)),
+        f"usuario{rng.randrange(500)}",
+        f"192.168.{rng.randrange(256)}.{rng.randrange(256)}",
+        'Wireless-802.11',
+        dia, hora, dia, hora,
+        str(rng.randrange(100000)),
+        str(rng.randrange(10 ** 7)),
+        str(rng.randrange(10 ** 8)),
+        rng.choice(_aps),
+        _mac(rng),
+        rng.choice(['User-Request', 'Stale-Session', 'Session-Timeout', 'NAS-Reboot', 'Admin-Reboot', '']),
+    ]
+    fila = dict(zip(columnas, valores))
+    fila[''] = ''
+    return fila
+
+def filas_desordenadas(filas, rng):
+    # Intercambia dos columnas al azar en cada fila para forzar la reparación
+    resultado = []
+    for fila in filas:
+        fila = dict(fila)
+        a, b = rng.sample(columnas, 2)
+        fila[a], fila[b] = fila[b], fila[a]
+        resultado.append(fila)
+    return resultado
+
+def filas_desplazadas(filas, rng):
+    # Elimina un campo al azar y corre los siguientes una columna a la izquierda
+    resultado = []
+    for fila in filas:
+        valores = [fila[columna] for columna in columnas]
+        del valores[rng.randrange(len(columnas))]
+        fila = dict(zip(columnas, valores + ['']))
+        fila[''] = ''
+        resultado.append(fila)
+    return resultado
+
+def filas_corruptas(filas, rng, campos=6):
+    # Reemplaza varios campos por basura que no cumple ningún formato
+    resultado = []
+    for fila in filas:
+        fila = dict(fila)
+        for columna in rng.sample(columnas, campos):
+            fila[columna] = '#' * rng.randint(1, 20)
+        resultado.append(fila)
+    return resultado
+
+def medir(funcion, filas, repeticiones=3):
+    # Filas por segundo de la mejor de varias repeticiones
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            resultados = [funcion(fila, num) for num, fila in enumerate(filas, start=1)]
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultados, len(filas) / mejor
+
+def benchmark_clasificador(cantidad=20000, semilla=1):
+    rng = random.Random(semilla)
+    limpias = [fila_sintetica(rng, i) for i in range(cantidad)]
+    perfiles = {
+        'limpio': limpias,
+        'desordenado': filas_desordenadas(limpias, rng),
+        'desplazado': filas_desplazadas(limpias, rng),
+        'corrupto': filas_corruptas(limpias, rng),
+    }
+    for nombre, filas in perfiles.items():
+        esperado, original = medir(verificar_y_ordenar_fila_original, filas)
+        obtenido, nuevo = medir(verificar_y_ordenar_fila, filas)
+        assert obtenido == esperado, f"Resultados distintos en el perfil '{nombre}'"
+        print(f"{nombre:12} original: {original:10.0f} filas/s   clasificador: {nuevo:10.0f} filas/s   x{nuevo / original:.1f}")
+
+def escribir_csv_sintetico(path, cantidad, semilla=1):
+    # CSV con el encabezado esperado; una de cada 20 filas trae dos columnas intercambiadas
+    escribir_csv_radius(path, cantidad, tasa_intercambiadas=0.05, semilla=semilla)
+
+def benchmark_paralelo(cantidad=400000, semilla=1):
+    # Tiempo de analizar_csv con 1, 2, 4... procesos sobre el mismo archivo; las salidas deben ser idénticas
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        try:
+            escribir_csv_sintetico('datos.csv', cantidad, semilla)
+            print(f"Archivo sintético: {cantidad} filas, {os.path.getsize('datos.csv') / 2**20:.1f} MiB")
+            cantidades = [1]
+            while cantidades[-1] * 2 <= (os.cpu_count() or 1):
+                cantidades.append(cantidades[-1] * 2)
+            base = None
+            for workers in cantidades:
+                if os.path.exists('errores.csv'):
+                    os.remove('errores.csv')
+                inicio = time.perf_counter()
+                with redirect_stdout(io.StringIO()) as salida:
+                    resultado = analizar_csv('datos.csv', '2019-01-01', '2019-12-31', workers=workers)
+                segundos = time.perf_counter() - inicio
+                if base is None:
+                    base = (segundos, resultado, salida.getvalue())
+                    os.replace('temporal.csv', 'temporal_1.csv')
+                    os.replace('errores.csv', 'errores_1.csv')
+                else:
+                    assert (resultado.ap_trafico, salida.getvalue()) == (base[1].ap_trafico, base[2]), f"Resultado distinto con {workers} procesos"
+                    assert filecmp.cmp('temporal.csv', 'temporal_1.csv', shallow=False)
+                    assert filecmp.cmp('errores.csv', 'errores_1.csv', shallow=False)
+                print(f"{workers:3} procesos: {segundos:7.2f} s   {cantidad / segundos:10.0f} filas/s   x{base[0] / segundos:.2f}")
+        finally:
+            os.chdir(directorio_original)
+
+def _pico_rss(path):
+    # Ejecuta analizar_csv en un proceso aparte y devuelve su pico de memoria residente en MiB.
+    # Se prefiere VmHWM de /proc: ru_maxrss conserva el pico del proceso padre a través del fork.
+    codigo = (
+        "import io, resource, sys\n"
+        "from contextlib import redirect_stdout\n"
+        "from automatas import analizar_csv\n"
+        "with redirect_stdout(io.StringIO()):\n"
+        "    analizar_csv(sys.argv[1], '2019-01-01', '2019-12-31')\n"
+        "try:\n"
+        "    with open('/proc/self/status') as estado:\n"
+        "        print(next(l.split()[1] for l in estado if l.startswith('VmHWM:')))\n"
+        "except (OSError, StopIteration):\n"
+        "    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    entorno = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    salida = subprocess.run([sys.executable, '-c', codigo, path], capture_output=True, text=True, check=True, env=entorno)
+    return int(salida.stdout.split()[-1]) / 1024  # Ambos valores están en KiB en Linux
+
+def benchmark_memoria(cantidades=(20000, 200000), semilla=1):
+    # El pico de memoria debe ser el mismo con archivos de distinto tamaño
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        try:
+            for cantidad in cantidades:
+                escribir_csv_sintetico('datos.csv', cantidad, semilla)
+                tamano = os.path.getsize('datos.csv') / 2**20
+                print(f"{cantidad:9} filas ({tamano:7.1f} MiB): pico RSS {_pico_rss('datos.csv'):6.1f} MiB")
+        finally:
+            os.chdir(directorio_original)
+
+ARCHIVO_RESULTADOS = 'resultados_benchmark.jsonl'  # Un JSON por perfil y ejecución, para comparar corridas
+
+def _cronometrar(funcion):
+    inicio = time.perf_counter()
+    funcion()
+    return time.perf_counter() - inicio
+
+def _version_git():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return salida.stdout.strip() or None
+    except OSError:
+        return None
+
+def _exportar(resultado, directorio):
+    # Camino de exportación sin interfaz: resumen JSON y, si openpyxl está instalado, los dos Excel
+    tiempos = {}
+    with open(os.path.join(directorio, 'resumen.json'), 'w', encoding='utf-8') as salida:
+        tiempos['exportar_json'] = _cronometrar(lambda: escribir_json([resultado.a_dict()], salida))
+    try:
+        from exportar import exportar_filas_excel, exportar_trafico_excel
+    except ImportError:
+        return tiempos
+    tiempos['exportar_excel_ap'] = _cronometrar(
+        lambda: exportar_trafico_excel(resultado, os.path.join(directorio, 'trafico.xlsx')))
+    tiempos['exportar_excel_filas'] = _cronometrar(
+        lambda: exportar_filas_excel(resultado, os.path.join(directorio, 'filas.xlsx')))
+    return tiempos
+
+def medir_perfil(nombre, filas, directorio, desde='2019-01-01', hasta='2019-12-31', semilla=1):
+    # Tiempos por etapa de un análisis completo sobre un archivo generado con el perfil.
+    # Cada etapa se obtiene como diferencia entre recorridos que van sumando trabajo:
+    # lectura (csv.reader), + validación y filtro (iter_registros), + agregación y escritura (analizar_csv).
+    path = os.path.join(directorio, f'{nombre}.csv')
+    escribir_csv_radius(path, filas, semilla=semilla, **PERFILES[nombre])
+
+    def leer():
+        with open(path, newline='', encoding='utf-8') as archivo:
+            for _ in csv.reader(archivo):
+                pass
+
+    def validar():
+        for _ in iter_registros(path, desde, hasta):
+            pass
+
+    resultado = None
+
+    def analizar():
+        nonlocal resultado
+        if os.path.exists('errores.csv'):
+            os.remove('errores.csv')
+        resultado = analizar_csv(path, desde, hasta)
+
+    with redirect_stdout(io.StringIO()):
+        lectura = _cronometrar(leer)
+        validacion = _cronometrar(validar)
+        analisis = _cronometrar(analizar)
+    etapas = {
+        'lectura': lectura,
+        'validacion': max(validacion - lectura, 0.0),
+        'agregacion_escritura': max(analisis - validacion, 0.0),
+    }
+    etapas.update(_exportar(resultado, directorio))
+    return {
+        'perfil': nombre,
+        'filas': filas,
+        'mib': os.path.getsize(path) / 2**20,
+        'segundos': analisis,
+        'filas_por_segundo': filas / analisis,
+        'pico_rss_mib': _pico_rss(path),
+        'etapas': etapas,
+        'filas_validas': resultado.filas_validas,
+        'filas_erroneas': resultado.filas_erroneas,
+    }
+
+def _anteriores(path):
+    # Última medición guardada de cada (perfil, filas)
+    anteriores = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as archivo:
+            for linea in archivo:
+                try:
+                    medicion = json.loads(linea)
+                    anteriores[(medicion['perfil'], medicion['filas'])] = medicion
+                except (ValueError, KeyError):
+                    continue
+    return anteriores
+
+def benchmark_analisis(filas=200000, perfiles=None, semilla=1):
+    # analizar_csv sobre cada perfil del generador: filas/s, pico de memoria y tiempo por etapa.
+    # Los resultados se agregan a ARCHIVO_RESULTADOS y se comparan con la corrida anterior.
+    destino = os.path.abspath(ARCHIVO_RESULTADOS)
+    anteriores = _anteriores(destino)
+    comun = {'fecha': datetime.now().isoformat(timespec='seconds'), 'version': _version_git(),
+             'python': sys.version.split()[0]}
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        try:
+            for nombre in perfiles or PERFILES:
+                medicion = dict(comun, **medir_perfil(nombre, filas, directorio, semilla=semilla))
+                etapas = '  '.join(f"{etapa} {segundos:.2f}s" for etapa, segundos in medicion['etapas'].items())
+                linea = (f"{nombre:11} {filas} filas ({medicion['mib']:.1f} MiB): {medicion['filas_por_segundo']:9.0f} filas/s"
+                         f"   pico RSS {medicion['pico_rss_mib']:6.1f} MiB")
+                anterior = anteriores.get((nombre, filas))
+                if anterior is not None:
+                    linea += (f"   x{medicion['filas_por_segundo'] / anterior['filas_por_segundo']:.2f}"
+                              f" respecto de {anterior.get('version') or anterior.get('fecha')}")
+                print(linea)
+                print(f"{'':11} {etapas}")
+                with open(destino, 'a', encoding='utf-8') as salida:
+                    salida.write(json.dumps(medicion) + '\n')
+        finally:
+            os.chdir(directorio_original)
+
+def benchmark_errores(filas=200000, semilla=1):
+    # Archivo con muchos campos inválidos: todos los errores en consola (como antes) contra el límite
+    # por defecto con resumen. La consola es un pipe leído por este proceso; una terminal real es más lenta.
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'sucio.csv')
+        escribir_csv_radius(path, filas, tasa_errores=0.5, semilla=semilla)
+        tiempos = {}
+        for nombre, limite in (('todos', None), ('limitado', 100)):
+            codigo = ("import sys\nfrom automatas import analizar_csv\n"
+                      f"analizar_csv(sys.argv[1], '2019-01-01', '2019-12-31', limite_errores_consola={limite!r})\n")
+            tiempos[nombre] = _tiempo_proceso(['-c', codigo, path], repeticiones=1, directorio=directorio)
+        print(f"{filas} filas, la mitad con un campo inválido")
+        print(f"errores en consola: todos {tiempos['todos']:.2f} s   limitado {tiempos['limitado']:.2f} s"
+              f"   x{tiempos['todos'] / tiempos['limitado']:.2f}")
+
+def _tiempo_proceso(argumentos, repeticiones=5, directorio=None):
+    # Mejor tiempo de pared de un proceso de Python nuevo (None si falla, por ejemplo sin tkinter o PIL)
+    entorno = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = subprocess.run([sys.executable] + argumentos, capture_output=True, env=entorno, cwd=directorio)
+        if salida.returncode != 0:
+            return None
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def benchmark_arranque(cantidad=10, semilla=1):
+    # Arranque en frío del modo consola sobre un archivo mínimo, comparado con solo importar la interfaz
+    aqui = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_sintetico(path, cantidad, semilla)
+        vacio = _tiempo_proceso(['-c', 'pass'])
+        consola = _tiempo_proceso([os.path.join(aqui, 'cli.py'), path, '--desde', '2019-01-01',
+                                   '--hasta', '2019-12-31', '-q', '-o', os.path.join(directorio, 'resumen.json')])
+        interfaz = _tiempo_proceso(['-c', 'import main'])
+    print(f"intérprete vacío:        {vacio * 1000:7.1f} ms")
+    print(f"cli.py ({cantidad} filas):     {consola * 1000:7.1f} ms")
+    if interfaz is None:
+        print("import main (interfaz):  no disponible (faltan tkinter, PIL u openpyxl)")
+    else:
+        print(f"import main (interfaz):  {interfaz * 1000:7.1f} ms")
+
+def benchmark_numpy(filas=200000, perfiles=('limpio', 'sucio'), semilla=1):
+    # Motor vectorizado (motor='numpy') contra el recorrido fila a fila; los resultados y los
+    # archivos de salida tienen que ser idénticos
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("numpy no está instalado")
+        return
+    with tempfile.TemporaryDirectory() as directorio:
+        for perfil in perfiles:
+            path = os.path.join(directorio, perfil + '.csv')
+            escribir_csv_radius(path, filas, semilla=semilla, **PERFILES[perfil])
+            tiempos = {}
+            salidas = {}
+            for motor in ('python', 'numpy'):
+                temporal = os.path.join(directorio, f'temporal_{motor}.csv')
+                errores = os.path.join(directorio, f'errores_{motor}.csv')
+                with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+                    inicio = time.perf_counter()
+                    resultado = analizar_csv(path, '2019-01-01', '2019-12-31', archivo_temporal=temporal,
+                                             archivo_errores=errores, copias_errores=0, motor=motor)
+                    tiempos[motor] = time.perf_counter() - inicio
+                with open(temporal, 'rb') as t, open(errores, 'rb') as e:
+                    salidas[motor] = (str(resultado), resultado.ap_sesiones, t.read(), e.read())
+            assert salidas['python'] == salidas['numpy'], perfil
+            print(f"{perfil:>10}: python {tiempos['python']:.2f} s ({filas / tiempos['python']:,.0f} filas/s)"
+                  f"   numpy {tiempos['numpy']:.2f} s ({filas / tiempos['numpy']:,.0f} filas/s)"
+                  f"   x{tiempos['python'] / tiempos['numpy']:.2f}")
+
+def _memoria_retenida(construir):
+    # Bytes que quedan asignados después de construir() (lo que devuelve se mantiene vivo mientras se mide)
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        retenido = construir()
+        return tracemalloc.get_traced_memory()[0] - antes, retenido
+    finally:
+        tracemalloc.stop()
+
+def benchmark_compacto(cantidades=(20000, 200000), semilla=1):
+    # Memoria por fila retenida: dicts como los de csv.DictReader contra compacto.TablaRegistros
+    from compacto import TablaRegistros
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        for cantidad in cantidades:
+            escribir_csv_radius(path, cantidad, semilla=semilla)
+            registros = [registro for registro in iter_registros(path) if not registro.erroneo]
+            como_dict, _ = _memoria_retenida(lambda: [dict(zip(columnas, [valor.encode().decode() for valor in
+                                                                          registro.campos]))
+                                                      for registro in registros])
+            compacta, tabla = _memoria_retenida(lambda: _tabla(registros, TablaRegistros()))
+            inicio = time.perf_counter()
+            decodificadas = sum(1 for _ in tabla)
+            segundos = time.perf_counter() - inicio
+            assert list(tabla) == [registro.campos for registro in registros]
+            print(f"{cantidad:9} filas: dict {como_dict / cantidad:7.1f} B/fila   compacta {compacta / cantidad:6.1f} B/fila"
+                  f"   x{como_dict / compacta:.1f}   decodificación {decodificadas / segundos:,.0f} filas/s")
+
+def _tabla(registros, tabla):
+    for registro in registros:
+        tabla(registro)
+    return tabla
+
+def benchmark_analitica(filas=200000, perfil='campus', semilla=1):
+    # Una pasada con toda la analítica contra el análisis por AP más un recorrido extra por cada pregunta,
+    # y el error de los bocetos (HyperLogLog y cuantiles) respecto de los valores exactos
+    from analitica import CUANTILES, DIMENSIONES, Analitica
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(path, filas, semilla=semilla, **PERFILES[perfil])
+        opciones = {'archivo_temporal': os.path.join(directorio, 'temporal.csv'),
+                    'archivo_errores': os.path.join(directorio, 'errores.csv'), 'limite_errores_consola': 0}
+        with redirect_stdout(io.StringIO()):
+            solo_ap = _cronometrar(lambda: analizar_csv(path, '2019-01-01', '2019-12-31', **opciones))
+            resultado = None
+
+            def una_pasada():
+                nonlocal resultado
+                resultado = analizar_csv(path, '2019-01-01', '2019-12-31', analitica=True, **opciones)
+            conjunta = _cronometrar(una_pasada)
+            separadas = solo_ap + sum(_cronometrar(lambda: consumir(iter_registros(path), Analitica([dimension])))
+                                      for dimension in DIMENSIONES)
+        print(f"{perfil} {filas} filas: solo AP {solo_ap:.2f} s   una pasada con analítica {conjunta:.2f} s"
+              f"   AP + {len(DIMENSIONES)} recorridos {separadas:.2f} s (x{separadas / conjunta:.2f})")
+
+        usuarios, clientes, session_time, octetos = {}, {}, [], []
+        for registro in iter_registros(path):
+            if not registro.erroneo:
+                usuarios.setdefault(registro.mac_ap, set()).add(registro.campos[columnas.index('Usuario')])
+                clientes.setdefault(registro.mac_ap, set()).add(registro.campos[columnas.index('MAC_Cliente')])
+                session_time.append(registro.session_time)
+                octetos.append(registro.input_octetos + registro.output_octetos)
+        errores = [abs(boceto.estimar() - len(exactos[ap])) / len(exactos[ap])
+                   for ap, bocetos in resultado.analitica.unicos.items()
+                   for boceto, exactos in zip(bocetos, (usuarios, clientes))]
+        print(f"  únicos por AP ({len(errores)} bocetos, {resultado.analitica.bytes_ocupados() / 2**20:.1f} MiB):"
+              f" error medio {sum(errores) / len(errores):.2%}   máximo {max(errores):.2%}")
+        for nombre, boceto, valores in (('Session_Time', resultado.analitica.session_time, session_time),
+                                        ('octetos', resultado.analitica.octetos, octetos)):
+            valores.sort()
+            errores = [abs(boceto.cuantil(q) - valores[int(q * (len(valores) - 1))])
+                       / max(valores[int(q * (len(valores) - 1))], 1) for q in CUANTILES]
+            print(f"  cuantiles de {nombre} ({len(boceto.cubetas)} cubetas): error relativo máximo {max(errores):.2%}")
+
+def benchmark_top(filas=200000, eventos=1000000, valores=1000000, memoria=1 << 20, top=50, semilla=1):
+    # Informe completo contra la página de las 'top' AP, y ranking exacto (un contador por valor) contra
+    # frecuentes.TraficoFrecuente con 'memoria' bytes sobre un flujo sesgado con muchos valores distintos
+    from frecuentes import TraficoFrecuente
+    from automatas import formatear_resultado
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(path, filas, semilla=semilla, **PERFILES['campus'])
+        with redirect_stdout(io.StringIO()):
+            resultado = analizar_csv(path, '2019-01-01', '2019-12-31',
+                                     archivo_temporal=os.path.join(directorio, 'temporal.csv'),
+                                     archivo_errores=os.path.join(directorio, 'errores.csv'), limite_errores_consola=0)
+    completo = _cronometrar(lambda: formatear_resultado(resultado))
+    pagina = _cronometrar(lambda: formatear_resultado(resultado, top))
+    print(f"informe de {len(resultado.aps)} AP: completo {completo * 1000:.1f} ms ({len(formatear_resultado(resultado))} caracteres)"
+          f"   top {top} {pagina * 1000:.1f} ms ({len(formatear_resultado(resultado, top))} caracteres)")
+
+    rng = random.Random(semilla)
+    flujo = [(f"usuario{int(valores * rng.random() ** 4)}", rng.randrange(1, 10**8)) for _ in range(eventos)]
+
+    def exacto():
+        pesos = {}
+        for valor, peso in flujo:
+            pesos[valor] = pesos.get(valor, 0) + peso
+        return pesos
+
+    def aproximado():
+        trafico = TraficoFrecuente(memoria)
+        for valor, peso in flujo:
+            trafico.sumar(valor, peso)
+        return trafico
+
+    # Los tiempos se toman sin tracemalloc, que hace mucho más lenta la asignación de memoria
+    segundos_exacto, segundos_aproximado = _cronometrar(exacto), _cronometrar(aproximado)
+    memoria_exacta, pesos = _memoria_retenida(exacto)
+    memoria_aproximada, trafico = _memoria_retenida(aproximado)
+    mejores = {valor for valor, _ in heapq.nlargest(top, pesos.items(), key=lambda item: item[1])}
+    filas_top = trafico.ranking_con_error(top)
+    cotas = trafico.cotas()
+    errores = [estimado - pesos[valor] for valor, estimado, _, _ in filas_top]
+    fuera = sum(not (estimado - error <= pesos[valor] <= estimado) for valor, estimado, _, error in filas_top)
+    print(f"{eventos} eventos, {len(pesos)} valores: exacto {memoria_exacta / 2**20:.1f} MiB {segundos_exacto:.2f} s"
+          f"   aproximado {memoria_aproximada / 2**20:.1f} MiB {segundos_aproximado:.2f} s ({cotas['contadores']} contadores)")
+    print(f"  top {top}: {len(mejores & {fila[0] for fila in filas_top})}/{top} coinciden, error real máximo {max(errores)}"
+          f" (cota Space-Saving {cotas['error_space_saving']}, Count-Min {cotas['error_count_min']}), {fuera} fuera de su cota")
+
+def benchmark_comprimido(filas=200000, workers=4, semilla=1):
+    # Mismo CSV sin comprimir y en gzip, bz2 y xz, leído en streaming (secuencial y paralelo); los resultados y
+    # temporal.csv tienen que ser idénticos. Después, el costo de escribir las salidas comprimidas.
+    from comprimido import EXTENSIONES, abrir_binario
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(base, filas, semilla=semilla, **PERFILES['sucio'])
+        temporal = os.path.join(directorio, 'temporal.csv')
+        errores = os.path.join(directorio, 'errores.csv')
+
+        def analizar(path, **opciones):
+            with redirect_stdout(io.StringIO()):
+                return analizar_csv(path, '2019-01-01', '2019-12-31', archivo_temporal=temporal, archivo_errores=errores,
+                                    copias_errores=0, limite_errores_consola=0, **opciones)
+
+        referencia = None
+        for formato in [None] + list(EXTENSIONES):
+            path = base if formato is None else base + EXTENSIONES[formato]
+            if formato is not None:
+                escribir_csv_radius(path, filas, semilla=semilla, **PERFILES['sucio'])
+            tiempos = []
+            for opciones in ({}, {'workers': workers}):
+                inicio = time.perf_counter()
+                resultado = analizar(path, **opciones)
+                tiempos.append(time.perf_counter() - inicio)
+                with abrir_binario(temporal) as (archivo, _):
+                    salida = (resultado.ap_trafico, resultado.ap_sesiones, archivo.read())
+                if referencia is None:
+                    referencia = salida
+                assert salida == referencia, (formato, opciones)
+            print(f"{formato or 'sin comprimir':>13}: {os.path.getsize(path) / 2**20:6.1f} MiB"
+                  f"   secuencial {tiempos[0]:.2f} s ({filas / tiempos[0]:,.0f} filas/s)"
+                  f"   {workers} procesos {tiempos[1]:.2f} s")
+
+        for formato in [None] + list(EXTENSIONES):
+            inicio = time.perf_counter()
+            analizar(base, comprimir_salida=formato)
+            segundos = time.perf_counter() - inicio
+            tamano = sum(os.path.getsize(path) for path in (temporal, errores)) if formato is None else \
+                sum(os.path.getsize(path + EXTENSIONES[formato]) for path in (temporal, errores))
+            print(f"salida {formato or 'sin comprimir':>13}: {segundos:.2f} s   {tamano / 2**20:6.1f} MiB")
+
+def benchmark_resumenes(filas=200000, consultas=10, semilla=1):
+    # Varios análisis del mismo archivo con rangos distintos: releyendo el CSV cada vez contra los resúmenes por
+    # día en memoria (memorizar=True); los resultados tienen que ser idénticos
+    from resumen_diario import resumenes
+    rng = random.Random(semilla)
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(path, filas, semilla=semilla, **PERFILES['sucio'])
+
+        def analizar(desde, hasta, **opciones):
+            with redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                resultado = analizar_csv(path, desde, hasta, archivo_temporal=os.path.join(directorio, 'temporal.csv'),
+                                         archivo_errores=os.path.join(directorio, 'errores.csv'), copias_errores=0,
+                                         **opciones)
+                return resultado, time.perf_counter() - inicio
+
+        resumenes.vaciar()
+        _, primera = analizar('2019-01-01', '2019-12-31', memorizar=True)
+        _, sin_memoria = analizar('2019-01-01', '2019-12-31')
+        print(f"primera pasada: {primera:.2f} s con resúmenes, {sin_memoria:.2f} s sin ellos"
+              f"   ({resumenes.bytes_ocupados() / 2**20:.1f} MiB estimados)")
+        releyendo = memorizado = 0.0
+        for _ in range(consultas):
+            dias = sorted(rng.sample(range(365), 2))
+            desde, hasta = (datetime(2019, 1, 1) + timedelta(days=dia) for dia in dias)
+            desde, hasta = desde.strftime('%Y-%m-%d'), hasta.strftime('%Y-%m-%d')
+            esperado, segundos = analizar(desde, hasta)
+            releyendo += segundos
+            resultado, segundos = analizar(desde, hasta, memorizar=True)
+            memorizado += segundos
+            assert resultado.origen == 'memoria'
+            assert ((resultado.aps, resultado.trafico, resultado.sesiones, resultado.filas_erroneas, resultado.errores)
+                    == (esperado.aps, esperado.trafico, esperado.sesiones, esperado.filas_erroneas, esperado.errores))
+        print(f"{consultas} rangos: releyendo el CSV {releyendo / consultas:.2f} s por consulta"
+              f"   con resúmenes {memorizado / consultas * 1000:.1f} ms por consulta")
+
+def benchmark_posicional(filas=200000, perfiles=('limpio', 'desplazado'), semilla=1):
+    # Lectura y validación con los dicts de csv.DictReader contra las listas de csv.reader ubicadas con la
+    # Disposicion del encabezado; los registros y errores tienen que ser idénticos
+    from automatas import _filas_csv, _registros_de_filas
+    with tempfile.TemporaryDirectory() as directorio:
+        for perfil in perfiles:
+            path = os.path.join(directorio, perfil + '.csv')
+            escribir_csv_radius(path, filas, semilla=semilla, **PERFILES[perfil])
+
+            def por_nombre():
+                errores = []
+                with open(path, newline='', encoding='utf-8') as archivo:
+                    filas_dict = enumerate(csv.DictReader(archivo), start=1)
+                    registros = list(_registros_de_filas(filas_dict, '2019-01-01', '2019-12-31',
+                                                         lambda *error: errores.append(error)))
+                return registros, errores
+
+            def posicional():
+                errores = []
+                with open(path, newline='', encoding='utf-8') as archivo:
+                    listas, disposicion = _filas_csv(archivo)
+                    registros = list(_registros_de_filas(enumerate(listas, start=1), '2019-01-01', '2019-12-31',
+                                                         lambda *error: errores.append(error), None, disposicion))
+                return registros, errores
+
+            assert por_nombre() == posicional(), perfil
+            antes, despues = _cronometrar(por_nombre), _cronometrar(posicional)
+            print(f"{perfil:>10}: DictReader {antes:.2f} s ({filas / antes:,.0f} filas/s)"
+                  f"   posicional {despues:.2f} s ({filas / despues:,.0f} filas/s)   x{antes / despues:.2f}")
+
+def benchmark_duplicados(filas=200000, claves=1000000, proyeccion=100_000_000, semilla=1):
+    # Dos exportaciones solapadas del mismo archivo (la primera además repite algunas sesiones): con un
+    # Deduplicador compartido la suma de ambas tiene que ser el análisis del original. Después, memoria y
+    # velocidad del set exacto y del filtro de Bloom, proyectadas a 'proyeccion' sesiones.
+    from duplicados import BYTES_POR_CLAVE, TASA_FALSOS, Deduplicador, dimensionar
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(path, filas, semilla=semilla)
+        with open(path, encoding='utf-8') as archivo:
+            encabezado, *lineas = archivo.readlines()
+        corte_a, corte_b = filas * 6 // 10, filas * 4 // 10
+        partes = {'a.csv': lineas[:corte_a] + lineas[:filas // 20], 'b.csv': lineas[corte_b:]}
+        for nombre, contenido in partes.items():
+            with open(os.path.join(directorio, nombre), 'w', encoding='utf-8') as archivo:
+                archivo.write(encabezado)
+                archivo.writelines(contenido)
+        repetidas = filas // 20 + (corte_a - corte_b)
+
+        def analizar(nombre, **opciones):
+            with redirect_stdout(io.StringIO()):
+                return analizar_csv(os.path.join(directorio, nombre), '2019-01-01', '2019-12-31',
+                                    archivo_temporal=os.path.join(directorio, 'temporal.csv'),
+                                    archivo_errores=os.path.join(directorio, 'errores.csv'), copias_errores=0,
+                                    **opciones)
+
+        def sumar(*resultados):
+            total = {}
+            for resultado in resultados:
+                for mac, octetos in resultado.ap_trafico.items():
+                    total[mac] = total.get(mac, 0) + octetos
+            return total
+
+        esperado = analizar('datos.csv').ap_trafico
+        sin_filtro = sumar(analizar('a.csv'), analizar('b.csv'))
+        print(f"sin deduplicar: {sum(sin_filtro.values()) - sum(esperado.values()):,} octetos contados de más")
+        deduplicador = Deduplicador()
+        inicio = time.perf_counter()
+        total = sumar(analizar('a.csv', deduplicar=deduplicador), analizar('b.csv', deduplicar=deduplicador))
+        segundos = time.perf_counter() - inicio
+        assert total == esperado and deduplicador.descartadas == repetidas
+        print(f"exacto: {deduplicador.descartadas:,} sesiones repetidas descartadas, suma igual al original"
+              f"   ({segundos:.2f} s)")
+
+        # Filtro guardado: el segundo archivo se analiza en otra corrida con las sesiones del primero
+        sesiones = os.path.join(directorio, 'sesiones.bin')
+        for memoria in (Deduplicador().memoria_exacta, 0):
+            primero = Deduplicador(memoria, filas, TASA_FALSOS)
+            analizar('a.csv', deduplicar=primero)
+            primero.guardar(sesiones)
+            segundo = Deduplicador.cargar(sesiones, memoria, filas, TASA_FALSOS)
+            total = sumar(analizar('a.csv', deduplicar=Deduplicador(memoria, filas, TASA_FALSOS)),
+                          analizar('b.csv', deduplicar=segundo))
+            falsos = primero.descartadas + segundo.descartadas - repetidas
+            modo = segundo.a_dict()['modo']
+            assert modo == 'exacto' and total == esperado or modo == 'bloom' and falsos >= 0
+            print(f"{modo:>6} guardado en {os.path.getsize(sesiones) / 2**20:.1f} MiB: {falsos} sesiones nuevas "
+                  f"descartadas por error de {filas - repetidas:,}")
+
+    rng = random.Random(semilla)
+    nuevas = ['%016x/%08X-%08X' % (rng.getrandbits(64), rng.getrandbits(32), rng.getrandbits(32))
+              for _ in range(claves)]
+    exacto = Deduplicador(memoria_exacta=float('inf'))
+    bloom = Deduplicador(memoria_exacta=0, capacidad=claves)
+    for deduplicador in (exacto, bloom):
+        campos = [''] * len(columnas)
+        inicio = time.perf_counter()
+        for clave in nuevas:
+            campos[2], campos[1] = clave.split('/')
+            deduplicador.repetida(campos)
+        segundos = time.perf_counter() - inicio
+        resumen = deduplicador.a_dict()
+        if resumen['modo'] == 'exacto':
+            por_sesion = BYTES_POR_CLAVE
+        else:
+            por_sesion = dimensionar(proyeccion, TASA_FALSOS)[0] / 8 / proyeccion
+        print(f"{resumen['modo']:>6}: {claves / segundos:,.0f} sesiones/s, {resumen['bytes'] / 2**20:.1f} MiB para "
+              f"{claves:,}   {proyeccion:,} sesiones: ~{por_sesion * proyeccion / 2**30:.2f} GiB, "
+              f"~{proyeccion * segundos / claves / 60:.0f} min de filtro")
+
+class _ArchivoLento(io.RawIOBase):
+    # Archivo en disco que espera 'latencia' segundos más el tiempo de transferencia en cada lectura o escritura,
+    # como un almacenamiento en red
+    def __init__(self, path, modo, latencia, ancho_de_banda):
+        self.archivo = open(path, modo + 'b', buffering=0)
+        self.modo = modo
+        self.latencia = latencia
+        self.ancho_de_banda = ancho_de_banda
+
+    def readable(self):
+        return self.modo == 'r'
+
+    def writable(self):
+        return self.modo == 'w'
+
+    def readinto(self, destino):
+        time.sleep(self.latencia + len(destino) / self.ancho_de_banda)
+        return self.archivo.readinto(destino)
+
+    def write(self, datos):
+        time.sleep(self.latencia + len(datos) / self.ancho_de_banda)
+        return self.archivo.write(datos)
+
+    def tell(self):
+        return self.archivo.tell()
+
+    def close(self):
+        self.archivo.close()
+        super().close()
+
+def benchmark_etapas(filas=200000, latencia=0.002, ancho_de_banda=25 << 20, semilla=1):
+    # Lectura, validación y escritura de temporal.csv / errores.csv sobre archivos con latencia simulada:
+    # todo en un hilo (con el búfer de lectura por defecto y con bloques de 1 MiB) contra las etapas con
+    # colas acotadas (etapas). Las salidas tienen que ser idénticas byte a byte.
+    from automatas import TAMANO_BUFER, EscritorFilas, _filas_csv, _registros_de_filas, nuevo_acumulador
+    from etapas import TAMANO_BLOQUE, LectorEnBloques, SalidaEnLotes
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, 'datos.csv')
+        escribir_csv_radius(path, filas, semilla=semilla, **PERFILES['sucio'])
+
+        def lento(nombre, modo):
+            return _ArchivoLento(os.path.join(directorio, nombre), modo, latencia, ancho_de_banda)
+
+        def salida(nombre):
+            return io.TextIOWrapper(io.BufferedWriter(lento(nombre, 'w'), TAMANO_BUFER), encoding='utf-8',
+                                    newline='')
+
+        def analizar(lineas, temporal, errores):
+            acumulador = nuevo_acumulador()
+            filas_csv, disposicion = _filas_csv(lineas)
+            consumir(_registros_de_filas(enumerate(filas_csv, start=1), '2019-01-01', '2019-12-31', None, None,
+                                         disposicion),
+                     acumulador, EscritorFilas(temporal, encabezado=True),
+                     EscritorFilas(errores, erroneas=True, encabezado=True))
+            return acumulador.columnas_por_ap()
+
+        def secuencial(tamano):
+            def ejecutar():
+                with io.TextIOWrapper(lento('datos.csv', 'r'), encoding='utf-8', newline='') as lineas, \
+                        salida('temporal.csv') as temporal, salida('errores.csv') as errores:
+                    lineas._CHUNK_SIZE = tamano  # Bytes que TextIOWrapper pide al archivo en cada lectura
+                    return analizar(lineas, temporal, errores)
+            return ejecutar
+
+        def en_etapas():
+            with lento('datos.csv', 'r') as entrada, LectorEnBloques(entrada, entrada.tell) as lector, \
+                    salida('temporal.csv') as temporal, salida('errores.csv') as errores, \
+                    SalidaEnLotes(temporal) as temporal_en_lotes, SalidaEnLotes(errores) as errores_en_lotes:
+                return analizar(lector, temporal_en_lotes, errores_en_lotes)
+
+        referencia = None
+        print(f"latencia {latencia * 1000:.0f} ms por operación, {ancho_de_banda / 2**20:.0f} MiB/s, "
+              f"{os.path.getsize(path) / 2**20:.1f} MiB")
+        for nombre, ejecutar in ((f"un hilo, lecturas de {io.DEFAULT_BUFFER_SIZE // 1024} KiB",
+                                  secuencial(io.DEFAULT_BUFFER_SIZE)),
+                                 (f"un hilo, lecturas de {TAMANO_BLOQUE >> 20} MiB", secuencial(TAMANO_BLOQUE)),
+                                 ("en etapas", en_etapas)):
+            inicio = time.perf_counter()
+            resultado = ejecutar()
+            segundos = time.perf_counter() - inicio
+            salidas = [open(os.path.join(directorio, nombre_salida), 'rb').read()
+                       for nombre_salida in ('temporal.csv', 'errores.csv')]
+            if referencia is None:
+                referencia = (resultado, salidas)
+            assert (resultado, salidas) == referencia, nombre
+            print(f"{nombre:>26}: {segundos:.2f} s ({filas / segundos:,.0f} filas/s)")
+
+def benchmark_servicio(filas=100000, subidas=4, top=10, semilla=1):
+    # Varias subidas a la vez al servicio (socket Unix, todo local) mientras otra tarea consulta el ranking sin
+    # parar: el resultado final tiene que ser la suma de analizar_csv sobre cada archivo, y se miden las filas
+    # por segundo de la ingesta y la latencia de las consultas durante la carga
+    import asyncio
+    from servicio import Servicio, consultar, pedir, subir
+    with tempfile.TemporaryDirectory() as directorio:
+        archivos = [os.path.join(directorio, f'datos{indice}.csv') for indice in range(subidas)]
+        for indice, path in enumerate(archivos):
+            escribir_csv_radius(path, filas, semilla=semilla + indice, **PERFILES['sucio'])
+        direccion = os.path.join(directorio, 'servicio.sock')
+
+        async def ejecutar():
+            servicio = Servicio()
+            servidor = await servicio.iniciar(direccion)
+            latencias = []
+            terminado = asyncio.Event()
+
+            async def consultar_sin_parar():
+                while not terminado.is_set():
+                    inicio = time.perf_counter()
+                    estado, _ = await consultar(direccion, '2019-03-01', '2019-09-30', top)
+                    latencias.append(time.perf_counter() - inicio)
+                    assert estado == 200
+                    await asyncio.sleep(0.01)
+
+            try:
+                consultas = asyncio.ensure_future(consultar_sin_parar())
+                inicio = time.perf_counter()
+                respuestas = await asyncio.gather(*(subir(direccion, path) for path in archivos))
+                segundos = time.perf_counter() - inicio
+                terminado.set()
+                await consultas
+                rangos = [await consultar(direccion, desde, hasta) for desde, hasta in
+                          ((None, None), ('2019-03-01', '2019-09-30'))]
+                _, estado = await pedir(direccion, 'GET', '/estado')
+            finally:
+                servidor.close()
+                await servidor.wait_closed()
+                servicio.cerrar()
+            return respuestas, segundos, latencias, rangos, estado
+
+        respuestas, segundos, latencias, rangos, estado = asyncio.run(ejecutar())
+        assert all(codigo == 200 for codigo, _ in respuestas) and estado['subidas'] == subidas
+        for (desde, hasta), (_, respuesta) in zip((('2019-01-01', '2019-12-31'), ('2019-03-01', '2019-09-30')),
+                                                  rangos):
+            esperado = {}
+            erroneas = 0
+            for path in archivos:
+                with redirect_stdout(io.StringIO()):
+                    resultado = analizar_csv(path, desde, hasta, archivo_temporal=os.path.join(directorio, 't.csv'),
+                                             archivo_errores=os.path.join(directorio, 'e.csv'), copias_errores=0)
+                erroneas += resultado.filas_erroneas
+                for mac, octetos, sesiones in resultado.por_ap():
+                    anterior = esperado.get(mac, (0, 0))
+                    esperado[mac] = (anterior[0] + octetos, anterior[1] + sesiones)
+            assert {ap['mac_ap']: (ap['octetos'], ap['sesiones']) for ap in respuesta['aps']} == esperado
+            assert respuesta['filas_erroneas'] == erroneas
+        latencias.sort()
+        print(f"{subidas} subidas de {filas:,} filas a la vez: {segundos:.2f} s ({subidas * filas / segundos:,.0f} "
+              f"filas/s), resultado igual a analizar_csv")
+        print(f"{len(latencias)} consultas top {top} durante la carga: mediana {latencias[len(latencias) // 2] * 1000:.1f} ms"
+              f"   p99 {latencias[int(len(latencias) * 0.99)] * 1000:.1f} ms   máxima {latencias[-1] * 1000:.1f} ms")
+
+benchmarks = {
+    'clasificador': benchmark_clasificador,
+    'paralelo': benchmark_paralelo,
+    'memoria': benchmark_memoria,
+    'arranque': benchmark_arranque,
+    'analisis': benchmark_analisis,
+    'errores': benchmark_errores,
+    'numpy': benchmark_numpy,
+    'compacto': benchmark_compacto,
+    'analitica': benchmark_analitica,
+    'top': benchmark_top,
+    'comprimido': benchmark_comprimido,
+    'resumenes': benchmark_resumenes,
+    'posicional': benchmark_posicional,
+    'duplicados': benchmark_duplicados,
+    'etapas': benchmark_etapas,
+    'servicio': benchmark_servicio,
+}
+
+if __name__ == "__main__":
+    for nombre in sys.argv[1:] or benchmarks:
+        print(f"== {nombre} ==")
+        benchmarks[nombre]()
@@ -0,0 +1,326 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from automatas import Diccionario
+
+# Caché columnar de las filas válidas de un CSV, guardada junto al archivo ('<archivo>.cache').
+# Formato: MAGIA, longitud del encabezado (uint64), encabezado JSON y luego las columnas como
+# arreglos binarios alineados a 8 bytes, que se leen con mmap sin copiarlos. Además de las columnas por
+# fila se guardan los totales por día y AP, así una consulta suma días y no filas. Cada columna tiene su
+# CRC32, que se verifica la primera vez que se usa.
+MAGIA = b'AUTCACH1'
+VERSION = 2
+FILAS_POR_BLOQUE = 65536  # Filas acumuladas en memoria antes de volcarlas a disco al construir
+
+# Columnas por fila: nombre y tipo del arreglo
+COLUMNAS_CACHE = [
+    ('dia', 'i'),          # date.toordinal() de Inicio_de_Conexión_Dia
+    ('trafico', 'q'),      # Input_Octects + Output_Octects
+    ('session_time', 'q'),
+    ('mac_ap', 'I'),       # Códigos de diccionario
+    ('usuario', 'I'),
+    ('mac_cliente', 'I'),
+]
+# Tramos de filas consecutivas con el mismo día, en el orden del archivo
+COLUMNAS_TRAMOS = [('tramo_dia', 'i'), ('tramo_inicio', 'q')]
+# Totales por día y AP, ordenados por día: cada día con su primer total, y cada total con la primera fila
+# en que aparece la AP ese día (para devolver las AP en orden de aparición)
+COLUMNAS_DIAS = [('total_dia', 'i'), ('total_inicio', 'q')]
+COLUMNAS_TOTALES = [
+    ('total_mac_ap', 'I'),
+    ('total_primera', 'q'),
+    ('total_trafico', 'q'),
+    ('total_sesiones', 'q'),
+]
+
+_MAXIMO_Q = 2 ** 63 - 1
+
+def ruta_cache(file_path):
+    return file_path + '.cache'
+
+def _huella(file_path):
+    # Tamaño y fecha de modificación del archivo de origen
+    estado = os.stat(file_path)
+    return {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+
+def _ordinal(fecha, por_defecto):
+    if fecha is None:
+        return por_defecto
+    if isinstance(fecha, str):
+        fecha = date.fromisoformat(fecha)
+    return fecha.toordinal()
+
+class ConstructorCache:
+    # Consumidor de registros (ver automatas.consumir) que arma la caché a partir de las filas válidas.
+    # Las columnas por fila se vuelcan por bloques a archivos temporales, así la memoria no crece con el
+    # archivo; los totales por día y AP se acumulan en memoria.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.huella = _huella(file_path)
+        self.directorio = tempfile.mkdtemp(prefix='automatas_cache_')
+        self.archivos = {nombre: open(os.path.join(self.directorio, nombre), 'wb') for nombre, _ in COLUMNAS_CACHE}
+        self.bloques = {nombre: array(tipo) for nombre, tipo in COLUMNAS_CACHE}
+        self.tramos = {nombre: array(tipo) for nombre, tipo in COLUMNAS_TRAMOS}
+        self.diccionarios = {'mac_ap': Diccionario(), 'usuario': Diccionario(), 'mac_cliente': Diccionario()}
+        self.por_dia = {}  # (día, código de MAC_AP) -> [primera fila, tráfico, sesiones]
+        self.filas = 0
+        self.valida = True  # Se descarta si algún valor no entra en 64 bits
+
+    def __call__(self, registro):
+        if registro.erroneo or not self.valida:
+            return
+        trafico = registro.input_octetos + registro.output_octetos
+        if trafico > _MAXIMO_Q or registro.session_time > _MAXIMO_Q:
+            self.valida = False
+            return
+        dia = registro.dia.toordinal()
+        if not self.tramos['tramo_dia'] or self.tramos['tramo_dia'][-1] != dia:
+            self.tramos['tramo_dia'].append(dia)
+            self.tramos['tramo_inicio'].append(self.filas)
+        bloques = self.bloques
+        codigo = self.diccionarios['mac_ap'].codigo(registro.mac_ap)
+        total = self.por_dia.get((dia, codigo))
+        if total is None:
+            self.por_dia[dia, codigo] = [self.filas, trafico, 1]
+        else:
+            total[1] += trafico
+            total[2] += 1
+        bloques['dia'].append(dia)
+        bloques['trafico'].append(trafico)
+        bloques['session_time'].append(registro.session_time)
+        bloques['mac_ap'].append(codigo)
+        bloques['usuario'].append(self.diccionarios['usuario'].codigo(registro.campos[3]))
+        bloques['mac_cliente'].append(self.diccionarios['mac_cliente'].codigo(registro.campos[14]))
+        self.filas += 1
+        if len(bloques['dia']) >= FILAS_POR_BLOQUE:
+            self._volcar()
+
+    def _totales(self):
+        # Columnas de los totales por día y AP; None si alguna suma no entra en 64 bits
+        columnas = {nombre: array(tipo) for nombre, tipo in COLUMNAS_DIAS + COLUMNAS_TOTALES}
+        for (dia, codigo), (primera, trafico, sesiones) in sorted(self.por_dia.items()):
+            if trafico > _MAXIMO_Q:
+                return None
+            if not columnas['total_dia'] or columnas['total_dia'][-1] != dia:
+                columnas['total_dia'].append(dia)
+                columnas['total_inicio'].append(len(columnas['total_mac_ap']))
+            columnas['total_mac_ap'].append(codigo)
+            columnas['total_primera'].append(primera)
+            columnas['total_trafico'].append(trafico)
+            columnas['total_sesiones'].append(sesiones)
+        return columnas
+
+    def _volcar(self):
+        for nombre, tipo in COLUMNAS_CACHE:
+            self.bloques[nombre].tofile(self.archivos[nombre])
+            self.bloques[nombre] = array(tipo)
+
+    def descartar(self):
+        # Análisis interrumpido: se borran los archivos temporales sin escribir la caché
+        for archivo in self.archivos.values():
+            archivo.close()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def guardar(self):
+        # Escribe la caché de forma atómica; no hace nada si el origen cambió durante el análisis
+        try:
+            self._volcar()
+            for archivo in self.archivos.values():
+                archivo.close()
+            estado = os.stat(self.file_path)
+            totales = self._totales() if self.valida else None
+            if (totales is None or estado.st_size != self.huella['tamano']
+                    or estado.st_mtime_ns != self.huella['mtime_ns']):
+                return False
+            en_memoria = dict(self.tramos, **totales)
+
+            # Las columnas por fila están en archivos temporales y los tramos y totales en memoria
+            def partes(nombre):
+                if nombre in self.bloques:
+                    with open(os.path.join(self.directorio, nombre), 'rb') as origen:
+                        yield from iter(lambda: origen.read(1 << 20), b'')
+                else:
+                    yield en_memoria[nombre].tobytes()
+
+            columnas = []
+            desplazamiento = 0
+            for nombre, tipo in COLUMNAS_CACHE + COLUMNAS_TRAMOS + COLUMNAS_DIAS + COLUMNAS_TOTALES:
+                tamano = crc = 0
+                for parte in partes(nombre):
+                    tamano += len(parte)
+                    crc = zlib.crc32(parte, crc)
+                columnas.append({'nombre': nombre, 'tipo': tipo, 'itemsize': array(tipo).itemsize,
+                                 'desplazamiento': desplazamiento, 'tamano': tamano, 'crc32': crc})
+                desplazamiento += tamano + (-tamano % 8)
+            encabezado = {
+                'version': VERSION,
+                'orden_bytes': sys.byteorder,
+                'origen': self.huella,
+                'filas': self.filas,
+                'tramos': len(self.tramos['tramo_dia']),
+                'columnas': columnas,
+                'diccionarios': {nombre: diccionario.valores for nombre, diccionario in self.diccionarios.items()},
+            }
+            texto = json.dumps(encabezado).encode('utf-8')
+            texto += b' ' * (-(len(MAGIA) + 8 + len(texto)) % 8)
+
+            destino = ruta_cache(self.file_path)
+            temporal = destino + '.tmp'
+            with open(temporal, 'wb') as salida:
+                salida.write(MAGIA + struct.pack('<Q', len(texto)) + texto)
+                for columna in columnas:
+                    for parte in partes(columna['nombre']):
+                        salida.write(parte)
+                    salida.write(b'\0' * (-columna['tamano'] % 8))
+            os.replace(temporal, destino)
+            return True
+        except OSError:
+            return False  # Directorio sin permisos de escritura u otro error: se sigue sin caché
+        finally:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+
+class CacheColumnar:
+    # Caché abierta con mmap; las columnas son memoryviews sobre el archivo
+    def __init__(self, archivo, mapa, encabezado, inicio_datos):
+        self.archivo = archivo
+        self.mapa = mapa
+        self.encabezado = encabezado
+        self.filas = encabezado['filas']
+        self.diccionarios = encabezado['diccionarios']
+        vista = memoryview(mapa)
+        self.vistas = [vista]
+        self.columnas = {}
+        self.crc = {}
+        for columna in encabezado['columnas']:
+            inicio = inicio_datos + columna['desplazamiento']
+            parcial = vista[inicio:inicio + columna['tamano']].cast(columna['tipo'])
+            self.vistas.append(parcial)
+            self.columnas[columna['nombre']] = parcial
+            self.crc[columna['nombre']] = columna['crc32']
+        self.totales = len(self.columnas['total_mac_ap'])
+
+    def columna(self, nombre):
+        # La columna, verificando su CRC32 la primera vez: una consulta solo lee las columnas que usa
+        crc = self.crc.pop(nombre, None)
+        if crc is not None and zlib.crc32(self.columnas[nombre]) != crc:
+            self.crc[nombre] = crc
+            raise ValueError(f"caché dañada (columna {nombre})")
+        return self.columnas[nombre]
+
+    def tramos(self, desde=None, hasta=None):
+        # Rangos [inicio, fin) de filas cuyo día está en [desde, hasta], en el orden del archivo
+        minimo = _ordinal(desde, -1)
+        maximo = _ordinal(hasta, 1 << 31)
+        dias = self.columna('tramo_dia')
+        inicios = self.columna('tramo_inicio')
+        for i, dia in enumerate(dias):
+            if minimo <= dia <= maximo:
+                yield inicios[i], inicios[i + 1] if i + 1 < len(inicios) else self.filas
+
+    def resumen_por_ap(self, desde=None, hasta=None):
+        # MAC_AP del rango en orden de primera aparición (como en analizar_csv) y, en listas paralelas,
+        # su tráfico total y cantidad de sesiones. Se suman los totales por día y AP de los días del rango
+        # y las AP se ordenan por la primera fila en que aparecen; las MAC se buscan al final.
+        dias = self.columna('total_dia')
+        inicios = self.columna('total_inicio')
+        primero = bisect_left(dias, _ordinal(desde, -1))
+        ultimo = bisect_right(dias, _ordinal(hasta, 1 << 31))
+        inicio = inicios[primero] if primero < len(dias) else self.totales
+        fin = inicios[ultimo] if ultimo < len(dias) else self.totales
+        por_ap = {}  # Código de la caché -> [primera fila, tráfico, sesiones]
+        for codigo, primera, octetos, cantidad in zip(self.columna('total_mac_ap')[inicio:fin],
+                                                      self.columna('total_primera')[inicio:fin],
+                                                      self.columna('total_trafico')[inicio:fin],
+                                                      self.columna('total_sesiones')[inicio:fin]):
+            total = por_ap.get(codigo)
+            if total is None:
+                por_ap[codigo] = [primera, octetos, cantidad]
+            else:
+                total[0] = min(total[0], primera)
+                total[1] += octetos
+                total[2] += cantidad
+        orden = sorted(por_ap.items(), key=lambda item: item[1][0])
+        aps = self.diccionarios['mac_ap']
+        return [aps[codigo] for codigo, _ in orden], [total[1] for _, total in orden], \
+            [total[2] for _, total in orden]
+
+    def trafico_por_ap(self, desde=None, hasta=None):
+        aps, sumas, _ = self.resumen_por_ap(desde, hasta)
+        return dict(zip(aps, sumas))
+
+    def cerrar(self):
+        for vista in reversed(self.vistas):
+            vista.release()
+        self.mapa.close()
+        self.archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+def _leer_encabezado(archivo, tamano_archivo):
+    if archivo.read(len(MAGIA)) != MAGIA:
+        return None, 0
+    (longitud,) = struct.unpack('<Q', archivo.read(8))
+    if longitud > tamano_archivo:
+        return None, 0
+    encabezado = json.loads(archivo.read(longitud))
+    return encabezado, len(MAGIA) + 8 + longitud
+
+def cargar_cache(file_path):
+    # Devuelve la caché del archivo si existe y es válida; una caché vieja o dañada se borra y se devuelve None
+    destino = ruta_cache(file_path)
+    if not os.path.exists(destino):
+        return None
+    archivo = None
+    try:
+        archivo = open(destino, 'rb')
+        tamano_cache = os.fstat(archivo.fileno()).st_size
+        encabezado, inicio_datos = _leer_encabezado(archivo, tamano_cache)
+        if (encabezado is None or encabezado.get('version') != VERSION
+                or encabezado.get('orden_bytes') != sys.byteorder):
+            raise ValueError('formato de caché desconocido')
+        for columna in encabezado['columnas']:
+            if array(columna['tipo']).itemsize != columna['itemsize']:
+                raise ValueError('tamaño de tipo distinto')
+            if inicio_datos + columna['desplazamiento'] + columna['tamano'] > tamano_cache:
+                raise ValueError('caché truncada')
+
+        # La caché corresponde al archivo solo si coinciden tamaño y fecha de modificación: un archivo
+        # reescrito con el mismo tamaño puede cambiar en cualquier parte, así que se rehace la caché
+        origen = encabezado['origen']
+        estado = os.stat(file_path)
+        if (estado.st_size, estado.st_mtime_ns) != (origen['tamano'], origen['mtime_ns']):
+            raise ValueError('origen modificado')
+
+        mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        cache = CacheColumnar(archivo, mapa, encabezado, inicio_datos)
+        try:
+            # Las columnas de las consultas (tramos y totales) son chicas: se verifican ahora, así una caché
+            # dañada se descarta aquí; las columnas por fila se verifican al usarlas
+            for nombre, _ in COLUMNAS_TRAMOS + COLUMNAS_DIAS + COLUMNAS_TOTALES:
+                cache.columna(nombre)
+        except ValueError:
+            cache.cerrar()
+            archivo = None
+            raise
+        return cache
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        if archivo is not None:
+            archivo.close()
+        try:
+            os.remove(destino)
+        except OSError:
+            pass
+        return None
@@ -0,0 +1,171 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from analitica import DIMENSIONES
+from automatas import analizar_csv
+
+# Modo consola, sin interfaz gráfica: analiza uno o varios CSV (o patrones glob) y escribe un resumen
+# en JSON o CSV. Solo importa automatas y analitica; tkinter, PIL y openpyxl no se cargan.
+#
+#   python3 cli.py datos/*.csv --desde 01-01-2019 --hasta 31-12-2019 --formato csv -o resumen.csv
+
+def fecha_argumento(texto):
+    # Acepta DD-MM-YYYY (como la interfaz) o YYYY-MM-DD y devuelve YYYY-MM-DD
+    for formato in ('%d-%m-%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"fecha inválida: {texto!r} (use DD-MM-YYYY o YYYY-MM-DD)")
+
+def expandir_archivos(patrones):
+    archivos = []
+    for patron in patrones:
+        coincidencias = sorted(glob.glob(patron)) if glob.has_magic(patron) else [patron]
+        if not coincidencias:
+            print(f"Sin archivos para el patrón: {patron}", file=sys.stderr)
+        for archivo in coincidencias:
+            if archivo not in archivos:
+                archivos.append(archivo)
+    return archivos
+
+def _analizar_archivo(tarea):
+    # Se ejecuta en un proceso aparte. Los mensajes de error de campos van a stderr (o se descartan),
+    # para que stdout quede libre para el resumen. Cada archivo escribe su propio temporal/errores.
+    file_path, desde, hasta, directorio, indice, top, silencioso, opciones = tarea
+    base = f"{indice:04d}_{os.path.splitext(os.path.basename(file_path))[0]}"
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo if silencioso else sys.stderr):
+        try:
+            resultado = analizar_csv(file_path, desde, hasta,
+                                     archivo_temporal=os.path.join(directorio, base + '.temporal.csv'),
+                                     archivo_errores=os.path.join(directorio, base + '.errores.csv'),
+                                     **opciones)
+            return resultado.a_dict(top), None
+        except Exception as e:
+            return None, f"{file_path}: {e}"
+
+def escribir_json(resumenes, salida):
+    json.dump(resumenes, salida, ensure_ascii=False, indent=2)
+    salida.write('\n')
+
+def escribir_csv(resumenes, salida):
+    writer = csv.writer(salida)
+    writer.writerow(['archivo', 'mac_ap', 'octetos', 'sesiones'])
+    for resumen in resumenes:
+        for ap in resumen['aps']:
+            writer.writerow([resumen['archivo'], ap['mac_ap'], ap['octetos'], ap['sesiones']])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analiza el tráfico por AP de uno o varios CSV sin interfaz gráfica.")
+    parser.add_argument('archivos', nargs='+', help="archivos CSV o patrones glob")
+    parser.add_argument('--desde', required=True, type=fecha_argumento, help="fecha de inicio (DD-MM-YYYY o YYYY-MM-DD)")
+    parser.add_argument('--hasta', required=True, type=fecha_argumento, help="fecha de fin (DD-MM-YYYY o YYYY-MM-DD)")
+    parser.add_argument('--formato', choices=['json', 'csv'], default='json')
+    parser.add_argument('-o', '--salida', help="archivo del resumen (por defecto stdout)")
+    parser.add_argument('--top', type=int, help="cantidad de AP por archivo en el resumen")
+    parser.add_argument('-j', '--procesos', type=int, default=os.cpu_count() or 1,
+                        help="archivos analizados a la vez")
+    parser.add_argument('--dir-salida', help="directorio para los temporal.csv / errores.csv de cada archivo "
+                                             "(por defecto se descartan)")
+    parser.add_argument('--cache', action='store_true', help="usar la caché columnar de cada archivo")
+    parser.add_argument('--indice', action='store_true', help="usar el índice de fechas de cada archivo")
+    parser.add_argument('--metricas', action='store_true', help="incluir tiempos por etapa y contadores en el resumen")
+    parser.add_argument('--motor', choices=['python', 'numpy'], default='python',
+                        help="motor de validación (numpy: vectorizado, requiere numpy)")
+    parser.add_argument('--analitica', nargs='*', choices=DIMENSIONES, metavar='DIMENSION',
+                        help="calcular en la misma pasada la analítica: todas las dimensiones o solo las indicadas "
+                             f"({', '.join(DIMENSIONES)})")
+    parser.add_argument('--memoria-top', type=float, metavar='MIB',
+                        help="rankings aproximados (Space-Saving y Count-Min) en esta memoria por ranking, con cotas de error")
+    parser.add_argument('--comprimir-salida', choices=['gzip', 'bz2', 'xz'],
+                        help="escribir los temporal.csv / errores.csv comprimidos (se agrega la extensión)")
+    parser.add_argument('--etapas', action='store_true',
+                        help="leer y escribir en hilos aparte con colas acotadas, para no frenar la validación "
+                             "cuando el disco o la red son lentos")
+    parser.add_argument('--deduplicar', action='store_true',
+                        help="descartar las sesiones repetidas entre todos los archivos (se analizan de a uno)")
+    parser.add_argument('--sesiones', metavar='ARCHIVO',
+                        help="archivo con las sesiones vistas: se carga al empezar y se guarda al terminar, para que "
+                             "los análisis siguientes también descarten esas sesiones (implica --deduplicar)")
+    parser.add_argument('--capacidad-sesiones', type=int, default=10_000_000, metavar='N',
+                        help="sesiones previstas para el filtro de Bloom que reemplaza al set exacto cuando este "
+                             "ocupa más de 64 MiB")
+    parser.add_argument('--falsos-positivos', type=float, default=0.001, metavar='P',
+                        help="probabilidad de descartar por error una sesión nueva con el filtro de Bloom")
+    parser.add_argument('-q', '--silencioso', action='store_true', help="no mostrar los errores de campos")
+    args = parser.parse_args(argv)
+
+    archivos = expandir_archivos(args.archivos)
+    if not archivos:
+        parser.error("no hay archivos para analizar")
+    opciones = {'usar_cache': args.cache, 'usar_indice': args.indice, 'metricas': args.metricas,
+                'motor': args.motor, 'analitica': args.analitica,
+                'memoria_top': None if args.memoria_top is None else int(args.memoria_top * 2**20),
+                'comprimir_salida': args.comprimir_salida, 'en_etapas': args.etapas}
+    if args.analitica == []:
+        opciones['analitica'] = True  # --analitica sin dimensiones: todas
+    deduplicador = None
+    if args.deduplicar or args.sesiones:
+        # Un solo Deduplicador para todos los archivos, en este proceso
+        from duplicados import MEMORIA_EXACTA, Deduplicador
+        if not 0 < args.falsos_positivos < 1 or args.capacidad_sesiones <= 0:
+            parser.error("--falsos-positivos debe estar entre 0 y 1 y --capacidad-sesiones ser positiva")
+        if args.sesiones:
+            try:
+                deduplicador = Deduplicador.cargar(args.sesiones, MEMORIA_EXACTA, args.capacidad_sesiones,
+                                                   args.falsos_positivos)
+            except (OSError, ValueError) as e:
+                parser.error(f"no se pudo leer {args.sesiones}: {e}")
+        else:
+            deduplicador = Deduplicador(MEMORIA_EXACTA, args.capacidad_sesiones, args.falsos_positivos)
+        opciones['deduplicar'] = deduplicador
+
+    temporal = None
+    directorio = args.dir_salida
+    if directorio is None:
+        temporal = tempfile.TemporaryDirectory(prefix='automatas_cli_')
+        directorio = temporal.name
+    else:
+        os.makedirs(directorio, exist_ok=True)
+
+    try:
+        tareas = [(archivo, args.desde, args.hasta, directorio, indice, args.top, args.silencioso, opciones)
+                  for indice, archivo in enumerate(archivos)]
+        if len(tareas) == 1 or args.procesos <= 1 or deduplicador is not None:
+            respuestas = [_analizar_archivo(tarea) for tarea in tareas]
+        else:
+            from concurrent.futures import ProcessPoolExecutor  # Solo hace falta con varios archivos
+            with ProcessPoolExecutor(max_workers=min(args.procesos, len(tareas))) as ejecutor:
+                respuestas = list(ejecutor.map(_analizar_archivo, tareas))
+    finally:
+        if temporal is not None:
+            temporal.cleanup()
+    if deduplicador is not None and args.sesiones:
+        deduplicador.guardar(args.sesiones)
+
+    resumenes = []
+    fallidos = 0
+    for resumen, error in respuestas:
+        if error is not None:
+            print(f"Error: {error}", file=sys.stderr)
+            fallidos += 1
+            continue
+        resumenes.append(resumen)
+
+    escribir = escribir_json if args.formato == 'json' else escribir_csv
+    if args.salida:
+        with open(args.salida, 'w', newline='', encoding='utf-8') as salida:
+            escribir(resumenes, salida)
+    else:
+        escribir(resumenes, sys.stdout)
+    return 1 if fallidos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
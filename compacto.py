@@ -0,0 +1,70 @@
+from array import array
+
+from automatas import Diccionario, columnas
+
+# Representación compacta de las filas limpias de un análisis, para conservarlas en memoria
+# (analizar_csv(..., retener_filas=True)). En lugar de un dict de 16 textos por fila:
+#  - las columnas con valores repetidos (usuario, IP, días, MAC, razón...) guardan un código de
+#    Diccionario por fila en un array de 32 bits, y cada texto distinto una sola vez;
+#  - las columnas de valores casi únicos (ID, ID_Sesion, ID_Conexión_unico, horas, Session_Time y
+#    octetos) se guardan juntas en un único buffer de bytes, separadas por '\x00' (ningún valor
+#    válido lo contiene), con la posición final de cada fila en un array.
+# Los textos se arman recién al leer una fila (campos(), iteración).
+CODIFICADAS = ['Usuario', 'IP_NAS_AP', 'Tipo__conexión', 'Inicio_de_Conexión_Dia', 'FIN_de_Conexión_Dia',
+               'MAC_AP', 'MAC_Cliente', 'Razon_de_Terminación_de_Sesión']
+EN_BUFFER = [columna for columna in columnas if columna not in CODIFICADAS]
+
+_I_CODIFICADAS = [columnas.index(columna) for columna in CODIFICADAS]
+_I_EN_BUFFER = [columnas.index(columna) for columna in EN_BUFFER]
+
+class TablaRegistros:
+    # Consumidor de registros (ver automatas.consumir) que conserva las filas limpias en columnas compactas
+    def __init__(self):
+        self.diccionarios = [Diccionario() for _ in CODIFICADAS]
+        self.codigos = [array('I') for _ in CODIFICADAS]
+        self.textos = bytearray()
+        self.finales = array('Q')
+
+    def __call__(self, registro):
+        if registro.erroneo:
+            return
+        self.agregar(registro.campos)
+
+    def agregar(self, campos):
+        # 'campos' son los 16 valores en el orden de 'columnas'
+        for i, diccionario, codigos in zip(_I_CODIFICADAS, self.diccionarios, self.codigos):
+            valor = campos[i]
+            codigo = diccionario.codigos.get(valor)
+            codigos.append(diccionario.codigo(valor) if codigo is None else codigo)
+        self.textos += '\x00'.join([campos[i] for i in _I_EN_BUFFER]).encode('utf-8')
+        self.finales.append(len(self.textos))
+
+    def __len__(self):
+        return len(self.finales)
+
+    def campos(self, fila):
+        # Los 16 textos de la fila en el orden de 'columnas'
+        valores = [None] * len(columnas)
+        for i, diccionario, codigos in zip(_I_CODIFICADAS, self.diccionarios, self.codigos):
+            valores[i] = diccionario.valores[codigos[fila]]
+        inicio = self.finales[fila - 1] if fila else 0
+        for i, valor in zip(_I_EN_BUFFER, self.textos[inicio:self.finales[fila]].decode('utf-8').split('\x00')):
+            valores[i] = valor
+        return valores
+
+    def __iter__(self):
+        for fila in range(len(self)):
+            yield self.campos(fila)
+
+    def columna(self, nombre):
+        # Valores de una columna codificada como (textos distintos, código de cada fila), sin decodificar
+        indice = CODIFICADAS.index(nombre)
+        return self.diccionarios[indice].valores, self.codigos[indice]
+
+    def bytes_ocupados(self):
+        # Memoria aproximada de las columnas y de los textos de los diccionarios
+        total = len(self.textos) + self.finales.itemsize * len(self.finales)
+        for diccionario, codigos in zip(self.diccionarios, self.codigos):
+            total += codigos.itemsize * len(codigos)
+            total += sum(len(valor) + 49 for valor in diccionario.valores)  # Texto y tamaño base de un str
+        return total
@@ -0,0 +1,84 @@
+import io
+import os
+from contextlib import contextmanager
+
+# Entrada y salida comprimidas con gzip, bz2 o xz. El formato de entrada se reconoce por la extensión
+# o, si no la tiene, por los primeros bytes, y los datos se descomprimen en streaming a medida que se
+# leen, sin escribir nunca el archivo descomprimido. gzip, bz2 y lzma se importan solo si hacen falta.
+FORMATOS = ['gzip', 'bz2', 'xz']
+EXTENSIONES = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+_POR_EXTENSION = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+_FIRMAS = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+NIVEL_GZIP = 6  # El 9 por defecto de gzip comprime apenas un poco más y tarda bastante más
+NIVEL_XZ = 1  # El 6 por defecto de xz tarda unas 5 veces más en un CSV como este y ahorra poco
+
+def _modulo(formato):
+    if formato == 'gzip':
+        import gzip
+        return gzip
+    if formato == 'bz2':
+        import bz2
+        return bz2
+    if formato == 'xz':
+        import lzma
+        return lzma
+    raise ValueError(f"Formato de compresión desconocido: {formato}")
+
+def formato_por_extension(path):
+    return _POR_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+def formato_de(path, cabecera=None):
+    # 'gzip', 'bz2', 'xz' o None (sin comprimir); 'cabecera' son los primeros bytes si ya se leyeron
+    formato = formato_por_extension(path)
+    if formato is not None:
+        return formato
+    if cabecera is None:
+        with open(path, 'rb') as archivo:
+            cabecera = archivo.read(6)
+    for firma, formato in _FIRMAS:
+        if cabecera.startswith(firma):
+            return formato
+    return None
+
+@contextmanager
+def abrir_binario(path):
+    # Produce (archivo, posicion): 'archivo' lee los bytes descomprimidos y posicion() es la posición en el
+    # archivo en disco (comprimido), para informar el avance contra os.path.getsize(path)
+    with open(path, 'rb') as crudo:
+        formato = formato_de(path, crudo.peek(6)[:6])
+        if formato is None:
+            yield crudo, crudo.tell
+            return
+        with _modulo(formato).open(crudo, 'rb') as archivo:
+            yield archivo, crudo.tell
+
+@contextmanager
+def abrir_texto(path):
+    # Como abrir_binario pero con el texto UTF-8 sin traducir los fines de línea (como open(..., newline=''))
+    with abrir_binario(path) as (archivo, posicion):
+        yield io.TextIOWrapper(archivo, encoding='utf-8', newline=''), posicion
+
+def ruta_salida(path, formato=None):
+    # Nombre del archivo de salida: con compresión se agrega la extensión si no la tiene
+    if formato is None or path.endswith(EXTENSIONES[formato]):
+        return path
+    return path + EXTENSIONES[formato]
+
+def abrir_salida(path, formato=None, buffering=-1, binario=False):
+    # Archivo de salida (texto UTF-8 con newline='' para csv.writer, o binario), comprimido si se pide.
+    # El compresor recibe las escrituras en bloques de 'buffering' bytes.
+    if formato is None:
+        if binario:
+            return open(path, 'wb', buffering=buffering)
+        return open(path, 'w', newline='', encoding='utf-8', buffering=buffering)
+    modulo = _modulo(formato)
+    if formato == 'gzip':
+        comprimido = modulo.open(path, 'wb', compresslevel=NIVEL_GZIP)
+    elif formato == 'xz':
+        comprimido = modulo.open(path, 'wb', preset=NIVEL_XZ)
+    else:
+        comprimido = modulo.open(path, 'wb')
+    archivo = io.BufferedWriter(comprimido, buffer_size=buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+    if binario:
+        return archivo
+    return io.TextIOWrapper(archivo, encoding='utf-8', newline='', write_through=True)
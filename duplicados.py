@@ -0,0 +1,181 @@
+import hashlib
+import json
+import math
+import os
+import struct
+
+from automatas import columnas
+
+# Descarte de sesiones repetidas (analizar_csv(..., deduplicar=...)): exportaciones solapadas de varios
+# controladores repiten la misma sesión, identificada por ID_Conexión_unico e ID_Sesion, y su tráfico se
+# contaba dos veces. Mientras las sesiones vistas entran en 'memoria_exacta' se guardan en un set (sin
+# errores); después pasan a un filtro de Bloom dimensionado para 'capacidad' sesiones con una tasa de falsos
+# positivos 'tasa_falsos': una sesión nueva puede descartarse por error con esa probabilidad, una repetida
+# nunca se cuenta dos veces. Las sesiones vistas se pueden guardar en un archivo para los análisis siguientes.
+MAGIA = b'AUTSES02'
+BYTES_POR_CLAVE = 120  # str de la clave y su lugar en el set (medido con tracemalloc)
+MEMORIA_EXACTA = 64 << 20
+CAPACIDAD = 10_000_000
+TASA_FALSOS = 0.001
+
+_I_UNICO = columnas.index('ID_Conexión_unico')
+_I_SESION = columnas.index('ID_Sesion')
+
+def clave_sesion(campos):
+    return campos[_I_UNICO] + '/' + campos[_I_SESION]
+
+def dimensionar(capacidad, tasa_falsos):
+    # Bits y funciones de hash de un filtro de Bloom para 'capacidad' claves con esa tasa de falsos positivos
+    bits = max(8, math.ceil(-capacidad * math.log(tasa_falsos) / math.log(2) ** 2))
+    return bits, max(1, round(bits / capacidad * math.log(2)))
+
+class FiltroBloom:
+    # 'bits' bits y 'funciones' posiciones por clave, calculadas con doble hashing (h1 + i * h2) sobre un
+    # blake2b de 128 bits
+    def __init__(self, capacidad=CAPACIDAD, tasa_falsos=TASA_FALSOS, bits=None, funciones=None, datos=None):
+        self.capacidad = capacidad
+        self.tasa_falsos = tasa_falsos
+        if bits is None:
+            bits, funciones = dimensionar(capacidad, tasa_falsos)
+        self.bits = bits
+        self.funciones = funciones
+        self.datos = bytearray((bits + 7) // 8) if datos is None else datos
+        self.elementos = 0
+
+    def agregar(self, clave):
+        # Agrega la clave y devuelve True si ya estaba (o es un falso positivo)
+        resumen = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).digest()
+        posicion = int.from_bytes(resumen[:8], 'little')
+        paso = int.from_bytes(resumen[8:], 'little') | 1
+        datos, bits = self.datos, self.bits
+        presente = True
+        for _ in range(self.funciones):
+            indice = posicion % bits
+            mascara = 1 << (indice & 7)
+            if not datos[indice >> 3] & mascara:
+                datos[indice >> 3] |= mascara
+                presente = False
+            posicion += paso
+        if not presente:
+            self.elementos += 1
+        return presente
+
+    def tasa_estimada(self):
+        # Probabilidad de falso positivo con los elementos agregados hasta ahora
+        return (1 - math.exp(-self.funciones * self.elementos / self.bits)) ** self.funciones
+
+    def bytes_ocupados(self):
+        return len(self.datos)
+
+class Deduplicador:
+    def __init__(self, memoria_exacta=MEMORIA_EXACTA, capacidad=CAPACIDAD, tasa_falsos=TASA_FALSOS):
+        self.memoria_exacta = memoria_exacta
+        self.capacidad = capacidad
+        self.tasa_falsos = tasa_falsos
+        self.vistas = set()
+        self.bloom = None
+        self.descartadas = 0
+
+    def repetida(self, campos):
+        # True si la sesión de la fila ya se vio (y entonces se descarta); si no, la registra
+        clave = clave_sesion(campos)
+        if self.bloom is not None:
+            repetida = self.bloom.agregar(clave)
+        else:
+            repetida = clave in self.vistas
+            if not repetida:
+                self.vistas.add(clave)
+                if len(self.vistas) * BYTES_POR_CLAVE > self.memoria_exacta:
+                    self._pasar_a_bloom()
+        self.descartadas += repetida
+        return repetida
+
+    def _pasar_a_bloom(self):
+        self.bloom = FiltroBloom(max(self.capacidad, 2 * len(self.vistas)), self.tasa_falsos)
+        for clave in self.vistas:
+            self.bloom.agregar(clave)
+        self.vistas = set()
+
+    def bytes_ocupados(self):
+        return self.bloom.bytes_ocupados() if self.bloom is not None else len(self.vistas) * BYTES_POR_CLAVE
+
+    def a_dict(self):
+        return {
+            'descartadas': self.descartadas,
+            'modo': 'exacto' if self.bloom is None else 'bloom',
+            'sesiones': len(self.vistas) if self.bloom is None else self.bloom.elementos,
+            'bytes': self.bytes_ocupados(),
+            'tasa_falsos': 0.0 if self.bloom is None else self.bloom.tasa_estimada(),
+        }
+
+    def guardar(self, path):
+        # MAGIA, longitud del encabezado (uint64), encabezado JSON y las claves o los bits del filtro. Cada clave
+        # va precedida por su longitud en bytes (uint32): los valores validados pueden terminar en '\n' (el '$'
+        # de las regex acepta un salto de línea final), así que no hay un separador seguro.
+        # Se escribe de forma atómica.
+        if self.bloom is None:
+            encabezado = {'modo': 'exacto', 'capacidad': self.capacidad, 'tasa_falsos': self.tasa_falsos}
+            partes = []
+            for clave in self.vistas:
+                clave = clave.encode('utf-8')
+                partes.append(struct.pack('<I', len(clave)))
+                partes.append(clave)
+            datos = b''.join(partes)
+        else:
+            bloom = self.bloom
+            encabezado = {'modo': 'bloom', 'capacidad': bloom.capacidad, 'tasa_falsos': bloom.tasa_falsos,
+                          'bits': bloom.bits, 'funciones': bloom.funciones, 'elementos': bloom.elementos}
+            datos = bloom.datos
+        texto = json.dumps(encabezado).encode('utf-8')
+        temporal = path + '.tmp'
+        with open(temporal, 'wb') as salida:
+            salida.write(MAGIA + struct.pack('<Q', len(texto)) + texto)
+            salida.write(datos)
+        os.replace(temporal, path)
+
+    @classmethod
+    def cargar(cls, path, memoria_exacta=MEMORIA_EXACTA, capacidad=CAPACIDAD, tasa_falsos=TASA_FALSOS):
+        # Sesiones vistas guardadas con guardar(); si el archivo no existe se empieza de cero
+        deduplicador = cls(memoria_exacta, capacidad, tasa_falsos)
+        if not os.path.exists(path):
+            return deduplicador
+        with open(path, 'rb') as entrada:
+            if entrada.read(len(MAGIA)) != MAGIA:
+                raise ValueError(f"{path} no es un archivo de sesiones vistas")
+            (longitud,) = struct.unpack('<Q', entrada.read(8))
+            encabezado = json.loads(entrada.read(longitud))
+            datos = entrada.read()
+        if encabezado['modo'] == 'exacto':
+            vistas = deduplicador.vistas
+            posicion = 0
+            while posicion < len(datos):
+                if posicion + 4 > len(datos):
+                    raise ValueError(f"{path} está truncado")
+                (largo,) = struct.unpack_from('<I', datos, posicion)
+                posicion += 4
+                if posicion + largo > len(datos):
+                    raise ValueError(f"{path} está truncado")
+                vistas.add(datos[posicion:posicion + largo].decode('utf-8'))
+                posicion += largo
+            if len(deduplicador.vistas) * BYTES_POR_CLAVE > memoria_exacta:
+                deduplicador._pasar_a_bloom()
+        else:
+            bloom = FiltroBloom(encabezado['capacidad'], encabezado['tasa_falsos'], encabezado['bits'],
+                                encabezado['funciones'], bytearray(datos))
+            if len(bloom.datos) != (bloom.bits + 7) // 8:
+                raise ValueError(f"{path} está truncado")
+            bloom.elementos = encabezado['elementos']
+            deduplicador.bloom = bloom
+        return deduplicador
+
+class FiltroDuplicados:
+    # Reenvía a los consumidores las filas erróneas y las válidas cuya sesión no se vio antes
+    def __init__(self, deduplicador, *consumidores):
+        self.deduplicador = deduplicador
+        self.consumidores = consumidores
+
+    def __call__(self, registro):
+        if not registro.erroneo and self.deduplicador.repetida(registro.campos):
+            return
+        for consumidor in self.consumidores:
+            consumidor(registro)
@@ -0,0 +1,146 @@
+import io
+import queue
+import threading
+
+from automatas import _filas_csv, _registros_de_filas
+from comprimido import abrir_binario
+
+# Lectura y escritura en etapas (analizar_csv(..., en_etapas=True)): un hilo lee el archivo en bloques
+# grandes (y lo descomprime), el hilo del análisis valida y suma, y un hilo por salida escribe temporal.csv
+# y errores.csv en lotes grandes. Las etapas se pasan los bloques por colas acotadas: si una se atrasa, la
+# anterior espera (contrapresión) y en curso nunca hay más de EN_COLA bloques por cola. Cada salida tiene
+# un solo hilo que escribe los lotes en el orden en que se armaron, así que los archivos quedan idénticos a
+# los del recorrido secuencial. Sirve cuando la E/S tarda (discos lentos o almacenamiento en red): mientras
+# un hilo espera al disco el análisis sigue. La validación queda en un solo hilo porque en CPython el GIL
+# la serializaría igual; para repartirla entre procesos está workers.
+TAMANO_BLOQUE = 1 << 20  # Bytes por lectura
+TAMANO_LOTE = 1 << 20    # Caracteres por escritura
+EN_COLA = 4              # Bloques o lotes por cola
+_ESPERA = 0.1            # Segundos entre comprobaciones de que la otra etapa sigue activa
+
+def _poner(cola, elemento, activa):
+    # cola.put que espera mientras la cola está llena, salvo que la etapa que la vacía haya terminado
+    while True:
+        try:
+            cola.put(elemento, timeout=_ESPERA)
+            return True
+        except queue.Full:
+            if not activa():
+                return False
+
+class LectorEnBloques:
+    # Itera las líneas de 'archivo' (binario, UTF-8) leídas por un hilo en bloques de 'tamano' bytes. Los
+    # bloques se cortan en el último '\n' y las líneas se separan como con open(..., newline='').
+    # posicion() es la de 'posicion_archivo' al leer el último bloque entregado, para el progreso.
+    def __init__(self, archivo, posicion_archivo, tamano=TAMANO_BLOQUE):
+        self.archivo = archivo
+        self.posicion_archivo = posicion_archivo
+        self.tamano = tamano
+        self.cola = queue.Queue(EN_COLA)
+        self.error = None
+        self.entregado = 0
+        self._detener = threading.Event()
+        self.hilo = threading.Thread(target=self._leer, name='lector', daemon=True)
+
+    def __enter__(self):
+        self.hilo.start()
+        return self
+
+    def __exit__(self, *excepcion):
+        self._detener.set()
+        self.hilo.join()
+        return False
+
+    def _activo(self):
+        return not self._detener.is_set()
+
+    def _leer(self):
+        try:
+            resto = b''
+            while self._activo():
+                bloque = self.archivo.read(self.tamano)
+                if not bloque:
+                    break
+                datos = resto + bloque
+                corte = datos.rfind(b'\n') + 1
+                resto = datos[corte:]
+                if corte and not _poner(self.cola, (datos[:corte].decode('utf-8'), self.posicion_archivo()),
+                                        self._activo):
+                    return
+            if resto:
+                _poner(self.cola, (resto.decode('utf-8'), self.posicion_archivo()), self._activo)
+        except BaseException as e:
+            self.error = e
+        finally:
+            _poner(self.cola, None, self._activo)
+
+    def __iter__(self):
+        while True:
+            elemento = self.cola.get()
+            if elemento is None:
+                break
+            texto, self.entregado = elemento
+            yield from io.StringIO(texto, newline='')
+        if self.error is not None:
+            raise self.error
+
+    def posicion(self):
+        return self.entregado
+
+class SalidaEnLotes:
+    # Archivo de texto para csv.writer que junta lo escrito en lotes de 'tamano' caracteres y un hilo escribe
+    # en 'archivo', en el mismo orden. Como context manager: al salir escribe lo que quede y espera al hilo.
+    def __init__(self, archivo, tamano=TAMANO_LOTE):
+        self.archivo = archivo
+        self.tamano = tamano
+        self.partes = []
+        self.pendiente = 0
+        self.cola = queue.Queue(EN_COLA)
+        self.error = None
+        self.hilo = threading.Thread(target=self._escribir, name='escritor', daemon=True)
+
+    def __enter__(self):
+        self.hilo.start()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if self.partes:
+            _poner(self.cola, ''.join(self.partes), self.hilo.is_alive)
+            self.partes = []
+        _poner(self.cola, None, self.hilo.is_alive)
+        self.hilo.join()
+        if self.error is not None and tipo is None:
+            raise self.error
+        return False
+
+    def _escribir(self):
+        try:
+            while True:
+                lote = self.cola.get()
+                if lote is None:
+                    break
+                self.archivo.write(lote)
+        except BaseException as e:
+            self.error = e
+
+    def write(self, texto):
+        self.partes.append(texto)
+        self.pendiente += len(texto)
+        if self.pendiente >= self.tamano:
+            lote = ''.join(self.partes)
+            self.partes = []
+            self.pendiente = 0
+            if not _poner(self.cola, lote, self.hilo.is_alive):
+                raise self.error or RuntimeError("El hilo de escritura terminó antes de tiempo")
+        return len(texto)
+
+def iter_registros_en_etapas(path, desde=None, hasta=None, reportar_error=None, progreso=None, metricas=None,
+                             rango_errores=None):
+    # Como automatas.iter_registros, con la lectura (y la descompresión) en un LectorEnBloques
+    with abrir_binario(path) as (archivo, posicion), LectorEnBloques(archivo, posicion) as lector:
+        filas, disposicion = _filas_csv(lector)
+        filas = enumerate(filas, start=1)
+        if progreso is not None:
+            filas = progreso.seguir(filas, lector.posicion)
+        yield from _registros_de_filas(filas, desde, hasta, reportar_error, metricas, disposicion,
+                                       rango_errores)
@@ -0,0 +1,59 @@
+from openpyxl import Workbook
+
+from automatas import columnas, iter_registros
+
+# Exportación a Excel con openpyxl en modo write-only: cada fila se escribe a disco al agregarla,
+# así la memoria no depende de la cantidad de filas exportadas.
+MAX_FILAS_HOJA = 1048576  # Límite de filas de una hoja de Excel (incluye el encabezado)
+COLUMNAS_NUMERICAS = {'Session_Time', 'Input_Octects', 'Output_Octects'}
+
+def exportar_trafico_excel(resultado, nombre_archivo, top=None):
+    # Tráfico y cantidad de sesiones por AP, de mayor a menor tráfico, y la analítica si se calculó.
+    # Con 'top' solo las primeras AP (y los primeros de cada ranking de la analítica).
+    # En un ranking aproximado (memoria_top) se agrega el error máximo de cada AP.
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Datos")
+    hoja.append(['MAC_AP', 'Octetos', 'Sesiones'] + (['Error máximo'] if resultado.error_trafico is not None else []))
+    for fila in resultado.por_ap(top):
+        hoja.append(list(fila))
+    if resultado.analitica is not None:
+        # Una hoja por dimensión de la analítica (usuarios, clientes, horas, razones...)
+        for nombre, encabezado, filas in resultado.analitica.tablas(top):
+            hoja = libro.create_sheet(nombre)
+            hoja.append(encabezado)
+            for fila in filas:
+                hoja.append(list(fila))
+    libro.save(nombre_archivo)
+
+def _fila_tipada(campos):
+    return [int(valor) if columna in COLUMNAS_NUMERICAS else valor
+            for columna, valor in zip(columnas, campos)]
+
+def _filas_limpias(resultado):
+    # Las filas que el análisis conservó (retener_filas) o, si no, las releídas del CSV en streaming
+    if resultado.filas is not None:
+        yield from resultado.filas
+        return
+    for registro in iter_registros(resultado.archivo, resultado.fecha_inicio, resultado.fecha_fin):
+        if not registro.erroneo:
+            yield registro.campos
+
+def exportar_filas_excel(resultado, nombre_archivo):
+    # Todas las filas limpias del rango del análisis.
+    # Si no entran en una hoja se continúa en "Filas 2", "Filas 3", etc.
+    libro = Workbook(write_only=True)
+    hoja = None
+    filas_hoja = MAX_FILAS_HOJA
+    cantidad = 0
+    for campos in _filas_limpias(resultado):
+        if filas_hoja >= MAX_FILAS_HOJA:
+            hoja = libro.create_sheet("Filas" if hoja is None else f"Filas {len(libro.worksheets) + 1}")
+            hoja.append(columnas)
+            filas_hoja = 1
+        hoja.append(_fila_tipada(campos))
+        filas_hoja += 1
+        cantidad += 1
+    if hoja is None:
+        libro.create_sheet("Filas").append(columnas)
+    libro.save(nombre_archivo)
+    return cantidad
@@ -0,0 +1,184 @@
+import heapq
+import math
+from array import array
+
+from analitica import _hash64
+
+# Rankings aproximados con memoria fija (analizar_csv(..., memoria_top=bytes)), para despliegues con decenas
+# de miles de AP o millones de usuarios donde un contador por valor no entra en memoria:
+#  - Space-Saving (Metwally et al.) sigue a lo sumo 'capacidad' valores; uno nuevo reemplaza al de menor
+#    peso y hereda ese peso como error. Todo valor con más de total / capacidad octetos está seguido, y el
+#    peso informado sobrestima el real en a lo sumo su error.
+#  - Count-Min estima el peso de cualquier valor sobrestimando a lo sumo e / ancho * total con
+#    probabilidad 1 - e**-profundidad; se usa para acotar mejor el peso de los valores seguidos.
+# La mitad del presupuesto va a cada estructura.
+BYTES_POR_CONTADOR = 250  # Entrada del dict, lista [peso, error, sesiones] y tupla del montículo (medido con tracemalloc)
+PROFUNDIDAD_COUNT_MIN = 4
+
+class SpaceSaving:
+    def __init__(self, capacidad):
+        self.capacidad = max(1, capacidad)
+        self.contadores = {}  # valor -> [peso, error, sesiones]
+        self._monticulo = []  # (peso, valor) de cada valor seguido; el peso puede haber quedado viejo (solo crece)
+        self.total = 0
+
+    def sumar(self, valor, peso, sesiones=1):
+        self.total += peso
+        contador = self.contadores.get(valor)
+        if contador is not None:
+            contador[0] += peso
+            contador[2] += sesiones
+            return
+        if len(self.contadores) < self.capacidad:
+            self.contadores[valor] = [peso, 0, sesiones]
+            heapq.heappush(self._monticulo, (peso, valor))
+            return
+        minimo = self._quitar_minimo()
+        self.contadores[valor] = [minimo + peso, minimo, sesiones]
+        heapq.heappush(self._monticulo, (minimo + peso, valor))
+
+    def _quitar_minimo(self):
+        # Saca el valor de menor peso; las entradas viejas del montículo se actualizan al llegar arriba
+        monticulo = self._monticulo
+        while True:
+            peso, valor = monticulo[0]
+            actual = self.contadores[valor][0]
+            if actual == peso:
+                heapq.heappop(monticulo)
+                del self.contadores[valor]
+                return peso
+            heapq.heapreplace(monticulo, (actual, valor))
+
+    def error_maximo(self):
+        # Cota del error de cualquier valor: el menor peso seguido cuando la capacidad está llena
+        if len(self.contadores) < self.capacidad:
+            return 0
+        return min(contador[0] for contador in self.contadores.values())
+
+    def combinar(self, otro):
+        # Unión de dos resúmenes (Agarwal et al.): a un valor que falta en uno se le suma la cota de error
+        # de ese resumen, y se conservan los 'capacidad' de mayor peso
+        propio, ajeno = self.error_maximo(), otro.error_maximo()
+        unidos = {}
+        for valor in self.contadores.keys() | otro.contadores.keys():
+            peso_a, error_a, sesiones_a = self.contadores.get(valor, (propio, propio, 0))
+            peso_b, error_b, sesiones_b = otro.contadores.get(valor, (ajeno, ajeno, 0))
+            unidos[valor] = [peso_a + peso_b, error_a + error_b, sesiones_a + sesiones_b]
+        if len(unidos) > self.capacidad:
+            unidos = dict(heapq.nlargest(self.capacidad, unidos.items(), key=lambda item: item[1][0]))
+        self.contadores = unidos
+        self._monticulo = [(contador[0], valor) for valor, contador in unidos.items()]
+        heapq.heapify(self._monticulo)
+        self.total += otro.total
+
+class CountMin:
+    def __init__(self, ancho, profundidad=PROFUNDIDAD_COUNT_MIN):
+        self.ancho = max(1, ancho)
+        self.tabla = [array('Q', bytes(8 * self.ancho)) for _ in range(profundidad)]
+        self.total = 0
+
+    def sumar(self, valor, peso):
+        # La columna de cada fila de la tabla sale de un solo hash: h1 + i * h2
+        self.total += peso
+        h = _hash64(valor)
+        columna, paso = h & 0xFFFFFFFF, (h >> 32) | 1
+        for fila in self.tabla:
+            fila[columna % self.ancho] += peso
+            columna += paso
+
+    def estimar(self, valor):
+        h = _hash64(valor)
+        columna, paso = h & 0xFFFFFFFF, (h >> 32) | 1
+        estimado = None
+        for fila in self.tabla:
+            peso = fila[columna % self.ancho]
+            if estimado is None or peso < estimado:
+                estimado = peso
+            columna += paso
+        return estimado
+
+    def error_maximo(self):
+        return math.ceil(math.e / self.ancho * self.total)
+
+    def probabilidad(self):
+        return 1 - math.exp(-len(self.tabla))
+
+    def combinar(self, otro):
+        for fila, otra in zip(self.tabla, otro.tabla):
+            for columna, peso in enumerate(otra):
+                if peso:
+                    fila[columna] += peso
+        self.total += otro.total
+
+class TraficoFrecuente:
+    # Como analitica.TraficoPor (octetos y sesiones por valor) pero con memoria fija: solo los valores de más
+    # tráfico, con su error. Las sesiones de un valor son las contadas desde que empezó a seguirse.
+    def __init__(self, memoria):
+        self.memoria = memoria
+        self.resumen = SpaceSaving(memoria // 2 // BYTES_POR_CONTADOR)
+        self.count_min = CountMin(memoria // 2 // (8 * PROFUNDIDAD_COUNT_MIN))
+
+    def sumar(self, valor, trafico, sesiones=1):
+        self.resumen.sumar(valor, trafico, sesiones)
+        self.count_min.sumar(valor, trafico)
+
+    def combinar(self, otro):
+        self.resumen.combinar(otro.resumen)
+        self.count_min.combinar(otro.count_min)
+
+    def ranking_con_error(self, top=None):
+        # (valor, octetos, sesiones, error) de mayor a menor tráfico; el real está en [octetos - error, octetos]
+        filas = []
+        for valor, (peso, error, sesiones) in self.resumen.contadores.items():
+            estimado = min(peso, self.count_min.estimar(valor))
+            filas.append((valor, estimado, sesiones, estimado - (peso - error)))
+        filas.sort(key=lambda fila: fila[1], reverse=True)
+        return filas if top is None else filas[:top]
+
+    def ranking(self, top=None):
+        return [fila[:3] for fila in self.ranking_con_error(top)]
+
+    def cotas(self):
+        return {
+            'memoria': self.memoria,
+            'contadores': self.resumen.capacidad,
+            'total': self.resumen.total,
+            'error_space_saving': self.resumen.error_maximo(),
+            'ancho_count_min': self.count_min.ancho,
+            'error_count_min': self.count_min.error_maximo(),
+            'probabilidad_count_min': self.count_min.probabilidad(),
+        }
+
+class AcumuladorFrecuentes:
+    # Reemplaza a automatas.AcumuladorTrafico cuando se pide memoria_top: mismas filas contadas, pero el
+    # tráfico por AP queda en un TraficoFrecuente
+    def __init__(self, memoria):
+        self.por_ap = TraficoFrecuente(memoria)
+        self.filas_validas = 0
+        self.filas_erroneas = 0
+
+    def __call__(self, registro):
+        if registro.erroneo:
+            self.filas_erroneas += 1
+            return
+        self.por_ap.sumar(registro.mac_ap, registro.input_octetos + registro.output_octetos)
+        self.filas_validas += 1
+
+    def sumar(self, ap, trafico, sesiones):
+        self.por_ap.sumar(ap, trafico, sesiones)
+
+    def combinar(self, otro):
+        self.por_ap.combinar(otro.por_ap)
+        self.filas_validas += otro.filas_validas
+        self.filas_erroneas += otro.filas_erroneas
+
+    def top(self, cantidad):
+        return [(ap, trafico) for ap, trafico, _ in self.por_ap.ranking(cantidad)]
+
+    def columnas_por_ap(self):
+        filas = self.por_ap.ranking_con_error()
+        return ([fila[0] for fila in filas], [fila[1] for fila in filas], [fila[2] for fila in filas],
+                [fila[3] for fila in filas])
+
+    def cotas(self):
+        return self.por_ap.cotas()
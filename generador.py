@@ -0,0 +1,122 @@
+import argparse
+import csv
+import random
+from datetime import date, datetime, timedelta
+
+from automatas import columnas
+from comprimido import abrir_salida, formato_por_extension
+
+# Generador de CSV sintéticos con el formato del registro de accounting RADIUS que lee analizar_csv.
+# Las sesiones son coherentes (fin = inicio + Session_Time, octetos proporcionales a la duración),
+# el uso de AP y usuarios está sesgado como en un despliegue real y se pueden inyectar filas con
+# campos inválidos, corridas una columna o con dos columnas intercambiadas.
+
+RAZONES = ['User-Request', 'Stale-Session', 'Session-Timeout', 'NAS-Reboot', 'Admin-Reboot', '']
+PESOS_RAZONES = [60, 15, 15, 2, 3, 5]
+
+# Perfiles usados por los benchmarks: argumentos de escribir_csv_radius
+PERFILES = {
+    'limpio': {},
+    'sucio': {'tasa_errores': 0.05},
+    'desplazado': {'tasa_desplazadas': 0.10, 'tasa_intercambiadas': 0.10},
+    'campus': {'aps': 20000, 'usuarios': 200000, 'dias': 30, 'tasa_errores': 0.01},
+}
+
+def _mac(rng):
+    return '-'.join(f"{rng.randrange(256):02X}" for _ in range(6))
+
+def _hexa(rng, digitos, cantidad):
+    return ''.join(rng.choice(digitos) for _ in range(cantidad))
+
+def _sesgado(rng, cantidad):
+    # Índice en [0, cantidad) con más peso en los primeros (pocos AP y usuarios concentran el tráfico)
+    return int(cantidad * rng.random() ** 3)
+
+class GeneradorRadius:
+    def __init__(self, aps=200, usuarios=500, desde='2019-01-01', dias=365, semilla=1):
+        self.rng = random.Random(semilla)
+        nombres = random.Random(semilla + 1)
+        self.aps = [_mac(nombres) + ':HCDD' for _ in range(aps)]
+        self.ips_ap = [f"10.{nombres.randrange(256)}.{nombres.randrange(256)}.{nombres.randrange(1, 255)}"
+                       for _ in range(aps)]
+        self.usuarios = [f"usuario{i}" for i in range(usuarios)]
+        self.clientes = [_mac(nombres) for _ in range(usuarios)]  # Un dispositivo habitual por usuario
+        self.inicio = datetime.combine(date.fromisoformat(desde), datetime.min.time())
+        self.segundos_rango = dias * 86400
+
+    def fila(self, indice):
+        # Valores de las 16 columnas, en el orden de 'columnas'
+        rng = self.rng
+        ap = _sesgado(rng, len(self.aps))
+        usuario = _sesgado(rng, len(self.usuarios))
+        inicio = self.inicio + timedelta(seconds=rng.randrange(self.segundos_rango))
+        duracion = int(rng.expovariate(1 / 1800))
+        fin = inicio + timedelta(seconds=duracion)
+        return [
+            str(100000 + indice % 9900000),
+            _hexa(rng, '0123456789ABCDEF', 8) + '-' + _hexa(rng, '0123456789ABCDEF', 8),
+            _hexa(rng, '0123456789abcdef', 16),
+            self.usuarios[usuario],
+            self.ips_ap[ap],
+            'Wireless-802.11',
+            inicio.strftime('%Y-%m-%d'), inicio.strftime('%H:%M:%S'),
+            fin.strftime('%Y-%m-%d'), fin.strftime('%H:%M:%S'),
+            str(duracion),
+            str(duracion * rng.randrange(1, 2000)),
+            str(duracion * rng.randrange(1, 20000)),
+            self.aps[ap],
+            self.clientes[usuario] if rng.random() < 0.9 else _mac(rng),
+            rng.choices(RAZONES, PESOS_RAZONES)[0],
+        ]
+
+    def corromper(self, valores, tasa_errores=0.0, tasa_desplazadas=0.0, tasa_intercambiadas=0.0):
+        rng = self.rng
+        sorteo = rng.random()
+        if sorteo < tasa_errores:
+            # Un campo con basura que no cumple ningún formato
+            valores[rng.randrange(len(valores))] = '#' * rng.randint(1, 12)
+        elif sorteo < tasa_errores + tasa_desplazadas:
+            # Falta un campo y los siguientes quedan corridos una columna a la izquierda
+            del valores[rng.randrange(len(valores))]
+            valores.append('')
+        elif sorteo < tasa_errores + tasa_desplazadas + tasa_intercambiadas:
+            a, b = rng.sample(range(len(valores)), 2)
+            valores[a], valores[b] = valores[b], valores[a]
+        return valores
+
+def escribir_csv_radius(path, filas, aps=200, usuarios=500, desde='2019-01-01', dias=365, tasa_errores=0.0,
+                        tasa_desplazadas=0.0, tasa_intercambiadas=0.0, semilla=1):
+    # CSV con el encabezado esperado (16 columnas y las dos vacías del final); comprimido si 'path'
+    # termina en .gz, .bz2 o .xz
+    generador = GeneradorRadius(aps, usuarios, desde, dias, semilla)
+    with abrir_salida(path, formato_por_extension(path)) as archivo:
+        writer = csv.writer(archivo)
+        writer.writerow(columnas + ['', ''])
+        for indice in range(filas):
+            valores = generador.corromper(generador.fila(indice), tasa_errores, tasa_desplazadas,
+                                          tasa_intercambiadas)
+            writer.writerow(valores + ['', ''])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un CSV sintético de accounting RADIUS.")
+    parser.add_argument('salida')
+    parser.add_argument('--filas', type=int, default=100000)
+    parser.add_argument('--perfil', choices=sorted(PERFILES), help="valores por defecto de un perfil de benchmark")
+    parser.add_argument('--aps', type=int)
+    parser.add_argument('--usuarios', type=int)
+    parser.add_argument('--desde', help="primer día (YYYY-MM-DD)")
+    parser.add_argument('--dias', type=int, help="cantidad de días sobre los que se reparten las sesiones")
+    parser.add_argument('--tasa-errores', type=float, help="fracción de filas con un campo inválido")
+    parser.add_argument('--tasa-desplazadas', type=float, help="fracción de filas corridas una columna")
+    parser.add_argument('--tasa-intercambiadas', type=float, help="fracción de filas con dos columnas intercambiadas")
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    opciones = dict(PERFILES[args.perfil]) if args.perfil else {}
+    for nombre in ('aps', 'usuarios', 'desde', 'dias', 'tasa_errores', 'tasa_desplazadas', 'tasa_intercambiadas'):
+        if getattr(args, nombre) is not None:
+            opciones[nombre] = getattr(args, nombre)
+    escribir_csv_radius(args.salida, args.filas, semilla=args.semilla, **opciones)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import csv
+import hashlib
+import io
+import json
+import os
+
+from automatas import _fecha_iso, _fecha_valida, _filas_csv, _registros_de_filas
+from comprimido import abrir_binario, formato_de
+from paralelo import lineas_del_rango, registros_crudos
+
+# Índice de fechas guardado junto al CSV ('<archivo>.indice'): para cada día de inicio, los tramos
+# de bytes [inicio, fin) de filas consecutivas de ese día y el número de la primera fila del tramo.
+# Las filas cuyo día crudo no tiene formato válido (la reparación podría darle cualquier fecha)
+# van a un grupo aparte que se lee en todas las consultas.
+# En un CSV comprimido las posiciones son de los datos descomprimidos; como no se puede leer solo la
+# parte agregada, el índice se reusa mientras el archivo en disco no cambie (tamaño y fecha) y si no se rehace.
+# En un CSV sin comprimir, si cambió el tamaño o la fecha se compara el hash de toda la parte ya indexada:
+# si es igual el archivo solo creció (o solo cambió la fecha) y se indexa lo nuevo; si no, se rehace.
+# Los registros se separan con paralelo.FinesDeRegistro, con las mismas reglas de comillas que csv.reader.
+VERSION = 3
+SIN_FECHA = ''     # Clave del grupo de filas sin día válido
+
+def ruta_indice(file_path):
+    return file_path + '.indice'
+
+def _huella(file_path):
+    info = os.stat(file_path)
+    return [info.st_size, info.st_mtime_ns]
+
+def _muestra(archivo, tamano):
+    # Hash de los primeros 'tamano' bytes del archivo
+    sha = hashlib.sha256()
+    archivo.seek(0)
+    while tamano > 0:
+        bloque = archivo.read(min(1 << 20, tamano))
+        if not bloque:
+            break
+        sha.update(bloque)
+        tamano -= len(bloque)
+    return sha.hexdigest()
+
+class IndiceFechas:
+    def __init__(self, datos):
+        self.datos = datos
+
+    @classmethod
+    def nuevo(cls):
+        return cls({'version': VERSION, 'encabezado': None, 'inicio_datos': 0, 'indexado': 0,
+                    'muestra': None, 'filas': 0, 'dias': {}})
+
+    def _agregar(self, dia, inicio, fin, fila):
+        tramos = self.datos['dias'].setdefault(dia, [])
+        if tramos and tramos[-1][1] == inicio:
+            tramos[-1][1] = fin  # La fila sigue al tramo anterior del mismo día
+        else:
+            tramos.append([inicio, fin, fila])
+
+    def actualizar(self, archivo, muestra=True):
+        # Indexa los registros completos desde la última posición indexada hasta el final del archivo.
+        # Sin 'muestra' no se guarda el hash de la parte indexada (en un comprimido obligaría a releerlo).
+        datos = self.datos
+        if datos['encabezado'] is None:
+            primero = next(registros_crudos(archivo, 0), None)
+            if primero is None:
+                return
+            datos['encabezado'] = next(csv.reader(io.StringIO(primero[2].decode('utf-8'))), [])
+            datos['inicio_datos'] = datos['indexado'] = primero[1]
+        encabezado = datos['encabezado']
+        posicion_dia = encabezado.index('Inicio_de_Conexión_Dia') if 'Inicio_de_Conexión_Dia' in encabezado else None
+        # Con nombres repetidos en el encabezado DictReader se queda con el último valor
+        if posicion_dia is not None and encabezado.count('Inicio_de_Conexión_Dia') > 1:
+            posicion_dia = len(encabezado) - 1 - encabezado[::-1].index('Inicio_de_Conexión_Dia')
+
+        for inicio, fin, registro in registros_crudos(archivo, datos['indexado']):
+            if b'"' in registro or b'\r' in registro.rstrip(b'\r\n'):
+                # Como en la lectura secuencial (newline=''), un '\r' suelto fuera de comillas corta la fila
+                filas = [fila for fila in csv.reader(io.StringIO(registro.decode('utf-8'), newline='')) if fila]
+            else:
+                filas = [registro.rstrip(b'\r\n').decode('utf-8').split(',')] if registro.strip(b'\r\n') else []
+            datos['indexado'] = fin
+            if not filas:
+                continue  # DictReader salta las líneas vacías y no las cuenta
+            datos['filas'] += len(filas)
+            campos = filas[0]
+            dia = campos[posicion_dia] if posicion_dia is not None and posicion_dia < len(campos) else None
+            if len(filas) > 1 or dia is None or not _fecha_valida(dia):
+                dia = SIN_FECHA  # Un registro partido en varias filas se lee en todas las consultas
+            self._agregar(dia, inicio, fin, datos['filas'] - len(filas) + 1)
+        if muestra:
+            datos['muestra'] = _muestra(archivo, datos['indexado'])
+
+    def rangos(self, desde=None, hasta=None):
+        # Tramos (inicio, fin, primera fila) a leer para el rango, en el orden del archivo y unidos si son contiguos
+        desde, hasta = _fecha_iso(desde), _fecha_iso(hasta)
+        tramos = []
+        for dia, tramos_dia in self.datos['dias'].items():
+            if dia == SIN_FECHA or ((desde is None or dia >= desde) and (hasta is None or dia <= hasta)):
+                tramos.extend(tramos_dia)
+        tramos.sort()
+        unidos = []
+        for inicio, fin, fila in tramos:
+            if unidos and unidos[-1][1] == inicio:
+                unidos[-1][1] = fin
+            else:
+                unidos.append([inicio, fin, fila])
+        return unidos
+
+    def guardar(self, file_path):
+        temporal = ruta_indice(file_path) + '.tmp'
+        try:
+            with open(temporal, 'w', encoding='utf-8') as salida:
+                json.dump(self.datos, salida)
+            os.replace(temporal, ruta_indice(file_path))
+        except OSError:
+            pass  # Sin permisos de escritura: el índice se usa solo en memoria
+
+def actualizar_indice(file_path):
+    # Carga el índice del archivo y lo pone al día. Si el archivo solo creció se indexa la parte nueva;
+    # si cambió la parte ya indexada (o el índice no existe o está dañado) se indexa todo de nuevo.
+    huella = _huella(file_path)  # Antes de leer: si el archivo cambia mientras se indexa, no va a coincidir
+    tamano = huella[0]
+    comprimido = formato_de(file_path) is not None
+    indice = None
+    try:
+        with open(ruta_indice(file_path), encoding='utf-8') as entrada:
+            indice = IndiceFechas(json.load(entrada))
+        if indice.datos.get('version') != VERSION:
+            indice = None
+    except (OSError, ValueError):
+        indice = None
+
+    with abrir_binario(file_path) as (archivo, _):
+        if indice is not None:
+            indexado = indice.datos['indexado']
+            if comprimido:
+                if indice.datos.get('comprimido') == huella:
+                    return indice
+                indice = None
+            elif indice.datos.get('huella') == huella:
+                return indice
+            elif tamano < indexado or _muestra(archivo, indexado) != indice.datos['muestra']:
+                indice = None
+        if indice is None:
+            indice = IndiceFechas.nuevo()
+        indice.actualizar(archivo, muestra=not comprimido)
+    indice.datos['comprimido' if comprimido else 'huella'] = huella
+    indice.guardar(file_path)
+    return indice
+
+def iter_registros_indexados(file_path, desde=None, hasta=None, reportar_error=None, progreso=None, metricas=None):
+    # Como automatas.iter_registros, pero leyendo solo los tramos del índice que pueden caer en el rango
+    # (más la cola del archivo todavía no indexada)
+    indice = actualizar_indice(file_path)
+    encabezado = indice.datos['encabezado']
+    if encabezado is None:
+        return
+    tamano = os.path.getsize(file_path)
+    tramos = indice.rangos(desde, hasta)
+    if 'comprimido' not in indice.datos and tamano > indice.datos['indexado']:
+        tramos.append([indice.datos['indexado'], tamano, indice.datos['filas'] + 1])
+    with abrir_binario(file_path) as (archivo, posicion):
+        for inicio, fin, fila in tramos:
+            filas, disposicion = _filas_csv(lineas_del_rango(archivo, inicio, fin), encabezado)
+            filas = enumerate(filas, start=fila)
+            if progreso is not None:
+                filas = progreso.seguir(filas, posicion)
+            yield from _registros_de_filas(filas, desde, hasta, reportar_error, metricas, disposicion)
@@ -1,19 +1,26 @@
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from datetime import datetime
-from openpyxl import Workbook
-from automatas import analizar_csv
+from automatas import AnalisisCancelado, analizar_csv, formatear_resultado
 from PIL import Image, ImageTk  # Necesario para manejar el logo de Excel
 
-# Variable global para almacenar los datos a exportar
-datos_exportacion = []
+# Variable global para almacenar el último resultado (ResultadoAnalisis) a exportar
+datos_exportacion = None
+
+# Evento de cancelación del análisis en curso (None si no hay ninguno)
+cancelacion = None
+TOP_PARCIAL = 20  # AP mostradas mientras el análisis avanza
+TOP_INFORME = 50  # AP por página del informe; la exportación incluye hasta la página mostrada
+pagina_desde = 0  # Posición de la primera AP de la página mostrada
 
 # Función para convertir fechas de DD-MM-YYYY a YYYY-MM-DD
 def convertir_fecha(fecha):
     return datetime.strptime(fecha, '%d-%m-%Y').strftime('%Y-%m-%d')
 
 def seleccionar_archivo(entry_file):
-    file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+    file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv *.csv.gz *.csv.bz2 *.csv.xz")])
     if file_path:
         entry_file.delete(0, tk.END)
         entry_file.insert(0, file_path)
@@ -24,61 +31,120 @@ def mostrar_resultados(resultados, text_widget):
     text_widget.insert(tk.END, resultados)  # Insertar resultados
     text_widget.config(state=tk.DISABLED)  # Deshabilitar edición
 
-def iniciar_analisis(entry_file, entry_inicio, entry_fin, text_widget):
-    global datos_exportacion
+def formatear_parcial(top, filas):
+    texto = f"Análisis en curso... {filas} filas leídas.\n\n"
+    texto += "AP con más tráfico hasta el momento:\n"
+    for ap, trafico in top:
+        texto += f"{ap}: {trafico} octetos\n"
+    return texto
+
+def trabajo_analisis(cola, evento, file_path, fecha_inicio, fecha_fin, analitica=False):
+    # Se ejecuta en un hilo aparte; solo se comunica con la interfaz a través de la cola
+    def al_avanzar(progreso):
+        cola.put(('progreso', progreso.bytes_leidos, progreso.total_bytes, progreso.filas,
+                  progreso.filas_por_segundo(), progreso.acumulador.top(TOP_PARCIAL)))
+    try:
+        # La caché y los resúmenes por día solo guardan el tráfico por AP: con la analítica se lee el CSV completo.
+        # Con los resúmenes en memoria, volver a analizar el mismo archivo con otras fechas no lo relee.
+        resultados = analizar_csv(file_path, fecha_inicio, fecha_fin, usar_cache=not analitica,
+                                  memorizar=not analitica, al_avanzar=al_avanzar, cancelado=evento.is_set,
+                                  analitica=analitica)
+        cola.put(('fin', resultados))
+    except AnalisisCancelado:
+        cola.put(('cancelado',))
+    except Exception as e:
+        cola.put(('error', e))
+
+def revisar_cola(cola, controles):
+    # Sondeo desde el hilo de Tk: aplica los mensajes del hilo de análisis y se reprograma hasta que termine
+    global datos_exportacion, cancelacion, pagina_desde
+    text_widget, barra, etiqueta_estado, btn_analizar, btn_cancelar = controles
+    try:
+        while True:
+            mensaje = cola.get_nowait()
+            if mensaje[0] == 'progreso':
+                _, leidos, total, filas, velocidad, top = mensaje
+                barra['value'] = 100 * leidos / total if total else 100
+                etiqueta_estado.config(text=f"{filas} filas - {velocidad:,.0f} filas/s")
+                mostrar_resultados(formatear_parcial(top, filas), text_widget)
+                continue
+            # Mensaje final: 'fin', 'cancelado' o 'error'
+            cancelacion = None
+            btn_analizar.config(state=tk.NORMAL)
+            btn_cancelar.config(state=tk.DISABLED)
+            if mensaje[0] == 'fin':
+                resultados = mensaje[1]
+                datos_exportacion = resultados  # Almacenar los datos para la exportación
+                pagina_desde = 0
+                barra['value'] = 100
+                etiqueta_estado.config(text=f"{resultados.filas_validas} filas válidas en {resultados.segundos:.1f} s")
+                mostrar_resultados(formatear_resultado(resultados, TOP_INFORME), text_widget)
+            elif mensaje[0] == 'cancelado':
+                etiqueta_estado.config(text="Análisis cancelado.")
+            else:
+                etiqueta_estado.config(text="")
+                messagebox.showerror("Error", f"Ocurrió un error al analizar el archivo: {mensaje[1]}")
+            return
+    except queue.Empty:
+        pass
+    text_widget.after(100, revisar_cola, cola, controles)
+
+def iniciar_analisis(entry_file, entry_inicio, entry_fin, controles, analitica=False):
+    global cancelacion
+    if cancelacion is not None:
+        return  # Ya hay un análisis en curso
     file_path = entry_file.get()
     fecha_inicio = entry_inicio.get()
     fecha_fin = entry_fin.get()
-    fecha_inicio_dt = convertir_fecha(fecha_inicio)
-    fecha_fin_dt = convertir_fecha(fecha_fin)
-    
+
     if file_path and fecha_inicio and fecha_fin: # Verificar que todos los campos estén completos
         try:
-            resultados = analizar_csv(file_path, fecha_inicio_dt, fecha_fin_dt)
-            datos_exportacion = resultados  # Almacenar los datos para la exportación
-            mostrar_resultados(resultados, text_widget)
-        except Exception as e:
-            messagebox.showerror("Error", f"Ocurrió un error al analizar el archivo: {e}")
+            fecha_inicio_dt = convertir_fecha(fecha_inicio)
+            fecha_fin_dt = convertir_fecha(fecha_fin)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Fecha inválida: {e}")
+            return
+        # El análisis corre en un hilo aparte para que la ventana siga respondiendo
+        text_widget, barra, etiqueta_estado, btn_analizar, btn_cancelar = controles
+        cancelacion = threading.Event()
+        cola = queue.Queue()
+        barra['value'] = 0
+        etiqueta_estado.config(text="Analizando...")
+        btn_analizar.config(state=tk.DISABLED)
+        btn_cancelar.config(state=tk.NORMAL)
+        threading.Thread(target=trabajo_analisis, args=(cola, cancelacion, file_path, fecha_inicio_dt, fecha_fin_dt, analitica),
+                         daemon=True).start()
+        revisar_cola(cola, controles)
     else:
         messagebox.showerror("Error", "Por favor, complete todos los campos.")
 
-def procesar_datos_exportacion(texto):
-    lineas = texto.strip().split('\n')  # Dividir el texto en líneas y eliminar espacios en blanco al inicio y final
-    datos = []
-    
-    for linea in lineas[1:]:  # Recorrer cada línea, omitiendo la primera que es el encabezado
-        partes = linea.split(': ')
-        if len(partes) == 2:
-            mac_ap, octetos = partes[0], partes[1].replace(' octetos', '')  # Separar la MAC_AP y los octetos
-            datos.append({'MAC_AP': mac_ap, 'Octetos': int(octetos)})  # Agregar los datos a la lista
-    
-    return datos  # Devolver los datos procesados como una lista de diccionarios
-
-
-def exportar_a_excel():
+def cambiar_pagina(text_widget, paginas):
+    # Avanza (o retrocede) 'paginas' páginas del informe del último análisis
+    global pagina_desde
+    if datos_exportacion is None:
+        return
+    desde = pagina_desde + paginas * TOP_INFORME
+    if desde < 0 or desde >= len(datos_exportacion.aps):
+        return
+    pagina_desde = desde
+    mostrar_resultados(formatear_resultado(datos_exportacion, TOP_INFORME, pagina_desde), text_widget)
+
+def cancelar_analisis():
+    if cancelacion is not None:
+        cancelacion.set()
+
+def exportar_a_excel(exportador=None):
     global datos_exportacion
     if datos_exportacion:
         nombre_archivo_excel = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
         if nombre_archivo_excel:
             try:
-                # Procesar los datos de exportación
-                datos_procesados = procesar_datos_exportacion(datos_exportacion)
-                
-                # Crear un libro de trabajo y una hoja
-                libro = Workbook()
-                hoja = libro.active
-                hoja.title = "Datos"
-                
-                # Agregar los encabezados
-                encabezados = ['MAC_AP', 'Octetos']
-                hoja.append(encabezados)
-
-                # Agregar las filas de datos
-                for fila in datos_procesados:
-                    hoja.append([fila['MAC_AP'], fila['Octetos']])
-
-                # Guardar el archivo Excel
-                libro.save(nombre_archivo_excel)
+                # openpyxl se importa recién al exportar
+                from exportar import exportar_trafico_excel
+                if exportador is None:
+                    exportar_trafico_excel(datos_exportacion, nombre_archivo_excel, top=pagina_desde + TOP_INFORME)
+                else:
+                    exportador(datos_exportacion, nombre_archivo_excel)
                 messagebox.showinfo("Éxito", f"Datos exportados exitosamente a {nombre_archivo_excel}")
             except Exception as e:
                 messagebox.showerror("Error", f"Ocurrió un error al exportar los datos: {e}")
@@ -87,6 +153,11 @@ def exportar_a_excel():
     else:
         messagebox.showerror("Error", "No hay datos disponibles para exportar. Realice el análisis primero.")
 
+def exportar_filas_a_excel():
+    # Exporta todas las filas limpias del rango analizado, no solo el resumen por AP
+    from exportar import exportar_filas_excel
+    exportar_a_excel(exportar_filas_excel)
+
 # Función principal para configurar y ejecutar la interfaz gráfica
 def main():
     root = tk.Tk()  # Crear la ventana principal de la aplicación
@@ -129,9 +200,34 @@ def main():
     text_resultados.grid(row=4, column=0, columnspan=3, padx=10, pady=5)
     text_resultados.config(state=tk.DISABLED)  # Hacer que el widget de texto sea solo de lectura
 
-    btn_analizar = tk.Button(root, text="Iniciar Análisis", command=lambda: iniciar_analisis(entry_file, entry_inicio, entry_fin, text_resultados), **button_style)
+    # Analítica por usuario, cliente, hora, razón de terminación, únicos por AP y cuantiles (sin caché)
+    var_analitica = tk.BooleanVar(value=False)
+    tk.Checkbutton(root, text="Analítica completa", variable=var_analitica, selectcolor="black",
+                   activebackground="black", activeforeground="white", **label_style).grid(row=2, column=2, padx=10, pady=5)
+
+    btn_analizar = tk.Button(root, text="Iniciar Análisis", command=lambda: iniciar_analisis(entry_file, entry_inicio, entry_fin, controles, var_analitica.get()), **button_style)
     round_button(btn_analizar)
-    btn_analizar.grid(row=3, column=0, columnspan=3, padx=10, pady=20)
+    btn_analizar.grid(row=3, column=0, columnspan=2, padx=10, pady=20)
+
+    btn_cancelar = tk.Button(root, text="Cancelar", command=cancelar_analisis, state=tk.DISABLED, **button_style)
+    round_button(btn_cancelar)
+    btn_cancelar.grid(row=3, column=2, padx=10, pady=20)
+
+    # Avance del análisis: barra por bytes leídos y filas por segundo
+    barra_progreso = ttk.Progressbar(root, orient="horizontal", length=400, mode="determinate", maximum=100)
+    barra_progreso.grid(row=8, column=0, columnspan=2, padx=10, pady=5)
+    etiqueta_estado = tk.Label(root, text="", **label_style)
+    etiqueta_estado.grid(row=8, column=2, padx=10, pady=5)
+
+    # Páginas del informe: TOP_INFORME AP por vez
+    btn_anteriores = tk.Button(root, text="< Anteriores", command=lambda: cambiar_pagina(text_resultados, -1), **button_style)
+    round_button(btn_anteriores)
+    btn_anteriores.grid(row=9, column=0, padx=10, pady=5)
+    btn_siguientes = tk.Button(root, text="Siguientes >", command=lambda: cambiar_pagina(text_resultados, 1), **button_style)
+    round_button(btn_siguientes)
+    btn_siguientes.grid(row=9, column=2, padx=10, pady=5)
+
+    controles = (text_resultados, barra_progreso, etiqueta_estado, btn_analizar, btn_cancelar)
 
     # Agregar el logo de Excel encima del botón de exportar
     btn_exportar_logo = tk.Label(root, image=excel_logo, bg="black")
@@ -142,6 +238,10 @@ def main():
     round_button(btn_exportar)
     btn_exportar.grid(row=6, column=0, columnspan=3, padx=10, pady=10)
 
+    btn_exportar_filas = tk.Button(root, text="Exportar filas a Excel", command=lambda: exportar_filas_a_excel(), **button_style)
+    round_button(btn_exportar_filas)
+    btn_exportar_filas.grid(row=7, column=0, columnspan=3, padx=10, pady=10)
+
     root.mainloop()  # Ejecutar el bucle principal de la aplicación
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+import os
+import time
+
+from automatas import columnas, fuera_de_rango
+
+# Métricas opcionales de un análisis: tiempo por etapa y contadores de filas, reparaciones y errores
+# por columna. Solo se crean cuando se piden (analizar_csv(..., metricas=True)); sin ellas el
+# recorrido de las filas no cambia.
+ETAPAS = ['lectura', 'validacion', 'reparacion', 'filtro', 'agregacion', 'escritura']
+
+class Metricas:
+    def __init__(self):
+        self.etapas = dict.fromkeys(ETAPAS, 0.0)
+        self.filas_leidas = 0
+        self.filas_fuera_de_rango = 0
+        self.filas_reparadas = 0
+        self.filas_validas = 0
+        self.filas_erroneas = 0
+        self.reparadas_por_columna = dict.fromkeys(columnas, 0)
+        self.errores_por_columna = dict.fromkeys(columnas, 0)
+
+    def leer(self, filas):
+        # Envuelve el iterador de (número, fila) y mide el tiempo de lectura y parseo de cada fila
+        iterador = iter(filas)
+        reloj = time.perf_counter
+        while True:
+            inicio = reloj()
+            try:
+                fila = next(iterador)
+            except StopIteration:
+                self.etapas['lectura'] += reloj() - inicio
+                return
+            self.etapas['lectura'] += reloj() - inicio
+            self.filas_leidas += 1
+            yield fila
+
+    def prefiltro(self, dia, desde, hasta):
+        inicio = time.perf_counter()
+        descartar = fuera_de_rango(dia, desde, hasta)
+        self.etapas['filtro'] += time.perf_counter() - inicio
+        return descartar
+
+    def verificar(self, row, disposicion):
+        # Como disposicion.verificar (ver automatas.Disposicion); las filas limpias cuentan como validación y las
+        # demás como reparación
+        inicio = time.perf_counter()
+        valores, fila_erronea, errores = disposicion.verificar(row)
+        segundos = time.perf_counter() - inicio
+        originales = disposicion.valores(row)
+        if not errores and valores == originales:
+            self.etapas['validacion'] += segundos
+            return valores, fila_erronea, errores
+        self.etapas['reparacion'] += segundos
+        con_error = {columna for columna, _ in errores}
+        reparadas = False
+        for columna, valor, original in zip(columnas, valores, originales):
+            if columna in con_error:
+                self.errores_por_columna[columna] += 1
+            elif valor != original:
+                self.reparadas_por_columna[columna] += 1
+                reparadas = True
+        self.filas_reparadas += reparadas
+        return valores, fila_erronea, errores
+
+    def contar_fuera_de_rango(self):
+        self.filas_fuera_de_rango += 1
+
+    def contar_filas(self, acumulador):
+        # Las filas válidas y erróneas del análisis son las que contó el AcumuladorTrafico
+        self.filas_validas = acumulador.filas_validas
+        self.filas_erroneas = acumulador.filas_erroneas
+
+    def cronometrar(self, etapa, consumidor):
+        # Consumidor de registros (ver automatas.consumir) que suma a 'etapa' el tiempo del consumidor envuelto
+        reloj = time.perf_counter
+        etapas = self.etapas
+
+        def medido(registro):
+            inicio = reloj()
+            consumidor(registro)
+            etapas[etapa] += reloj() - inicio
+        return medido
+
+    def combinar(self, otra):
+        # Suma las métricas de otro análisis parcial (por ejemplo un rango del modo paralelo)
+        for etapa, segundos in otra.etapas.items():
+            self.etapas[etapa] = self.etapas.get(etapa, 0.0) + segundos
+        for nombre in ('filas_leidas', 'filas_fuera_de_rango', 'filas_reparadas', 'filas_validas', 'filas_erroneas'):
+            setattr(self, nombre, getattr(self, nombre) + getattr(otra, nombre))
+        for columna in columnas:
+            self.reparadas_por_columna[columna] += otra.reparadas_por_columna[columna]
+            self.errores_por_columna[columna] += otra.errores_por_columna[columna]
+
+    def a_dict(self):
+        return {
+            'etapas': dict(self.etapas),
+            'filas_leidas': self.filas_leidas,
+            'filas_fuera_de_rango': self.filas_fuera_de_rango,
+            'filas_reparadas': self.filas_reparadas,
+            'filas_validas': self.filas_validas,
+            'filas_erroneas': self.filas_erroneas,
+            'reparadas_por_columna': dict(self.reparadas_por_columna),
+            'errores_por_columna': dict(self.errores_por_columna),
+        }
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def cronometrar_consumidores(metricas, acumulador, escritores):
+    # Consumidores de analizar_csv con el tiempo de la agregación y de la escritura medidos
+    return ([metricas.cronometrar('agregacion', acumulador)]
+            + [metricas.cronometrar('escritura', escritor) for escritor in escritores])
+
+def escribir_prometheus(metricas, path):
+    # Escribe el dict de métricas (Metricas.a_dict()) en el formato de texto de Prometheus,
+    # por ejemplo para el textfile collector de node_exporter
+    lineas = [
+        '# HELP automatas_etapa_segundos Tiempo acumulado por etapa del análisis.',
+        '# TYPE automatas_etapa_segundos gauge',
+    ]
+    lineas += [f'automatas_etapa_segundos{{etapa="{etapa}"}} {segundos:.6f}' for etapa, segundos in metricas['etapas'].items()]
+    lineas += ['# HELP automatas_filas Filas del último análisis por tipo.', '# TYPE automatas_filas gauge']
+    for tipo in ('leidas', 'fuera_de_rango', 'reparadas', 'validas', 'erroneas'):
+        lineas.append(f'automatas_filas{{tipo="{tipo}"}} {metricas["filas_" + tipo]}')
+    lineas += ['# HELP automatas_reparaciones Filas reparadas por columna.', '# TYPE automatas_reparaciones gauge']
+    lineas += [f'automatas_reparaciones{{columna="{_etiqueta(columna)}"}} {cantidad}'
+               for columna, cantidad in metricas['reparadas_por_columna'].items()]
+    lineas += ['# HELP automatas_errores Campos inválidos sin reparación por columna.', '# TYPE automatas_errores gauge']
+    lineas += [f'automatas_errores{{columna="{_etiqueta(columna)}"}} {cantidad}'
+               for columna, cantidad in metricas['errores_por_columna'].items()]
+    temporal = path + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as salida:
+        salida.write('\n'.join(lineas) + '\n')
+    os.replace(temporal, path)
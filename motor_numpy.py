@@ -0,0 +1,436 @@
+import csv
+import io
+import string
+from collections import deque
+from datetime import date
+
+import numpy as np
+
+from automatas import Disposicion, _fecha_iso, _registros_de_filas, columnas, regex_patterns
+from comprimido import abrir_binario
+
+# Motor alternativo de analizar_csv (motor='numpy'): lee el CSV en binario por bloques y, para las
+# líneas simples (ASCII, sin comillas ni '\r' sueltos y con un campo por columna del encabezado),
+# separa los campos y valida las columnas en forma vectorizada sobre los bytes del bloque, sin crear
+# un objeto por campo. Los chequeos rápidos solo aceptan valores que la expresión regular de la columna
+# también acepta. Las demás líneas se leen con csv.reader y, como las filas que no pasan los chequeos,
+# siguen el camino de siempre (_registros_de_filas); así el resultado, temporal.csv, errores.csv y los
+# errores informados son los mismos que con el motor de Python.
+BYTES_POR_BLOQUE = 1 << 22
+LARGO_MAXIMO = 64  # Ningún formato de las columnas con chequeo por posición admite campos más largos
+MAXIMO_DIGITOS = 12  # Octetos y Session_Time más largos van por el camino normal (sumas en int64 sin desborde)
+_COMA, _COMILLA, _CR, _LF = b',"\r\n'
+_FIN_TEMPORAL = b',,\r\n'  # Las dos columnas vacías y el fin de línea de csv.writer
+
+def _tabla(caracteres, relleno):
+    # Tabla de pertenencia por código ASCII; el 0 es el relleno después del final del campo
+    tabla = np.zeros(128, dtype=bool)
+    for caracter in caracteres:
+        tabla[ord(caracter)] = True
+    tabla[0] = relleno
+    return tabla
+
+_DIGITOS = string.digits
+_T_DIGITOS = _tabla(_DIGITOS, True)
+_T_DIGITO = _tabla(_DIGITOS, False)
+_T_1_9 = _tabla('123456789', False)
+_T_0_1 = _tabla('01', False)
+_T_0_3 = _tabla('0123', False)
+_T_0_5 = _tabla('012345', False)
+_T_ID_SESION = _tabla(string.ascii_uppercase + _DIGITOS + '-', True)
+_T_ID_CONEXION = _tabla(string.ascii_lowercase + _DIGITOS, True)
+_T_USUARIO = _tabla(string.ascii_letters + _DIGITOS + '_.-', True)
+_T_IP = _tabla(_DIGITOS + '.', True)
+_T_MAC = _tabla('0123456789ABCDEF-', True)
+_GUION, _PUNTO, _DOS_PUNTOS, _CERO = ord('-'), ord('.'), ord(':'), ord('0')
+
+def _codigos(datos, inicios, finales, ancho):
+    # Matriz (filas x caracteres) con los bytes de cada campo [inicio, fin) del bloque, rellena con 0
+    # después del final del campo y con al menos 'ancho' columnas, y el largo de cada campo. Los campos
+    # de más de LARGO_MAXIMO bytes quedan truncados; su largo real no pasa ningún chequeo.
+    largo = finales - inicios
+    posiciones = np.arange(max(min(int(largo.max(initial=0)), LARGO_MAXIMO), ancho))
+    dentro = posiciones < largo[:, None]
+    codigos = np.where(dentro, datos[np.where(dentro, inicios[:, None] + posiciones, 0)], 0).astype(np.uint8)
+    return codigos, largo
+
+def _valor_entero(c, largo):
+    # Valor de campos de solo dígitos (hasta MAXIMO_DIGITOS) a partir de la matriz de códigos
+    c = c[:, :MAXIMO_DIGITOS].astype(np.int64)
+    exponentes = largo[:, None] - 1 - np.arange(c.shape[1])
+    digitos = np.where(exponentes >= 0, c - _CERO, 0)
+    return (digitos * 10 ** np.maximum(exponentes, 0)).sum(axis=1)
+
+def _id(c, largo):
+    return (largo >= 6) & (largo <= 7) & _T_DIGITOS[c].all(axis=1) & _T_1_9[c[:, 0]]
+
+def _id_sesion(c, largo):
+    guiones = (c == _GUION).sum(axis=1)
+    return _T_ID_SESION[c].all(axis=1) & (((largo == 16) & (guiones == 0))
+                                          | ((largo == 17) & (guiones == 1) & (c[:, 8] == _GUION)))
+
+def _id_conexion(c, largo):
+    return (largo == 16) & _T_ID_CONEXION[c].all(axis=1)
+
+def _usuario(c, largo):
+    return (largo >= 1) & (largo <= 50) & _T_USUARIO[c].all(axis=1)
+
+def _ip(c, largo):
+    digito = _T_DIGITO[c]
+    ultimo = c[np.arange(len(c)), np.clip(largo - 1, 0, c.shape[1] - 1)]
+    cuatro_digitos = (digito[:, :-3] & digito[:, 1:-2] & digito[:, 2:-1] & digito[:, 3:]).any(axis=1)
+    puntos_seguidos = ((c[:, :-1] == _PUNTO) & (c[:, 1:] == _PUNTO)).any(axis=1)
+    return ((largo >= 7) & (largo <= 15) & _T_IP[c].all(axis=1) & ((c == _PUNTO).sum(axis=1) == 3)
+            & digito[:, 0] & _T_DIGITO[ultimo] & ~cuatro_digitos & ~puntos_seguidos)
+
+def _hora(c, largo):
+    return ((largo == 8) & (c[:, 2] == _DOS_PUNTOS) & (c[:, 5] == _DOS_PUNTOS)
+            & ((_T_0_1[c[:, 0]] & _T_DIGITO[c[:, 1]]) | ((c[:, 0] == ord('2')) & _T_0_3[c[:, 1]]))
+            & _T_0_5[c[:, 3]] & _T_DIGITO[c[:, 4]] & _T_0_5[c[:, 6]] & _T_DIGITO[c[:, 7]])
+
+def _entero(c, largo):
+    return (largo >= 1) & (largo <= MAXIMO_DIGITOS) & _T_DIGITOS[c].all(axis=1)
+
+def _session_time(c, largo):
+    return _entero(c, largo) & ((largo == 1) | (c[:, 0] != _CERO))
+
+def _mac_cliente(c, largo):
+    guiones = c[:, [2, 5, 8, 11, 14]] == _GUION
+    return (largo == 17) & _T_MAC[c].all(axis=1) & ((c == _GUION).sum(axis=1) == 5) & guiones.all(axis=1)
+
+# Chequeos por posición para las columnas de muchos valores distintos: (función, ancho mínimo de la matriz)
+_CHEQUEOS = {
+    'ID': (_id, 1),
+    'ID_Sesion': (_id_sesion, 9),
+    'ID_Conexión_unico': (_id_conexion, 1),
+    'Usuario': (_usuario, 1),
+    'IP_NAS_AP': (_ip, 4),
+    'Inicio_de_Conexión_Hora': (_hora, 8),
+    'FIN_de_Conexión_Hora': (_hora, 8),
+    'Session_Time': (_session_time, 1),
+    'Input_Octects': (_entero, 1),
+    'Output_Octects': (_entero, 1),
+    'MAC_Cliente': (_mac_cliente, 15),
+}
+# Columnas con pocos valores distintos: se codifican con un diccionario y se valida cada valor una sola vez
+# con la expresión regular de la columna
+_POR_DICCIONARIO = ['Tipo__conexión', 'Inicio_de_Conexión_Dia', 'FIN_de_Conexión_Dia', 'MAC_AP',
+                    'Razon_de_Terminación_de_Sesión']
+
+def _factorizar(bloque, inicios, finales):
+    # Valores distintos de los campos [inicio, fin) del bloque, en orden de aparición y como texto,
+    # y el índice de cada campo en esa lista
+    valores = [bloque[inicio:fin] for inicio, fin in zip(inicios.tolist(), finales.tolist())]
+    distintos = list(dict.fromkeys(valores))
+    indices = {valor: indice for indice, valor in enumerate(distintos)}
+    codigos = np.fromiter(map(indices.__getitem__, valores), dtype=np.int64, count=len(valores))
+    return [valor.decode('ascii') for valor in distintos], codigos
+
+def _contar(posiciones, inicios, finales):
+    # Cantidad de 'posiciones' (ordenadas) dentro de cada intervalo [inicio, fin)
+    return np.searchsorted(posiciones, finales) - np.searchsorted(posiciones, inicios)
+
+def _lineas_temporal(lineas):
+    return (_FIN_TEMPORAL.join(lineas) + _FIN_TEMPORAL).decode('ascii')
+
+class _Texto:
+    # Líneas de texto para csv.reader, separadas como en open(..., newline=''): las líneas del bloque
+    # desde 'siguiente' y, si un registro entre comillas sigue después del bloque, las del archivo.
+    # 'pendientes' son las partes que quedan de una línea cortada por un '\r' suelto.
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.lineas = []
+        self.siguiente = 0
+        self.pendientes = deque()
+        self.reader = csv.reader(self._lineas())
+
+    def _lineas(self):
+        while True:
+            while self.pendientes:
+                yield self.pendientes.popleft()
+            if self.siguiente < len(self.lineas):
+                linea = self.lineas[self.siguiente]
+                self.siguiente += 1
+            else:
+                linea = self.archivo.readline()
+                if not linea:
+                    return
+            self.pendientes.extend(io.StringIO(linea.decode('utf-8'), newline=''))
+
+    def leer(self, lineas=(), simples=(), desde=0):
+        # Filas de csv.reader desde la línea 'desde' del bloque hasta quedar al comienzo de una línea
+        # simple o al final del bloque. Devuelve las filas no vacías (csv.DictReader salta las vacías)
+        # y la línea del bloque donde hay que seguir.
+        self.lineas = lineas
+        self.siguiente = desde
+        filas = []
+        while True:
+            fila = next(self.reader, None)
+            if fila is None:
+                break
+            if fila:
+                filas.append(fila)
+            if not self.pendientes and (self.siguiente >= len(lineas) or simples[self.siguiente]):
+                break
+        return filas, self.siguiente
+
+class _Motor:
+    def __init__(self, encabezado, desde, hasta, acumulador, escritor_temporal, escritor_errores, reportar_error):
+        self.encabezado = encabezado
+        self.desde, self.hasta = desde, hasta
+        self.acumulador = acumulador
+        self.archivo_temporal = escritor_temporal.archivo
+        self.temporal = escritor_temporal.writer
+        self.errores = escritor_errores.writer
+        self.reportar_error = reportar_error
+        self.numero = 0  # Filas numeradas hasta ahora (como enumerate sobre csv.DictReader)
+        # Posición de cada columna en el encabezado (la última si se repite, como en DictReader)
+        posiciones = {nombre: indice for indice, nombre in enumerate(encabezado)}
+        self.posiciones = [posiciones.get(columna) for columna in columnas]
+        self.completo = None not in self.posiciones
+        # Con las columnas en el orden de salida, la línea de temporal.csv es el comienzo de la línea leída
+        self.en_orden = self.posiciones == list(range(len(columnas)))
+        self.disposicion = Disposicion(encabezado)  # Para las filas que van por el camino normal
+        self.dias = {}  # Día de inicio -> (formato válido, en rango, fecha del calendario válida)
+
+    def _dia(self, valor):
+        info = self.dias.get(valor)
+        if info is None:
+            formato = regex_patterns['Inicio_de_Conexión_Dia'].match(valor) is not None
+            en_rango = (self.desde is None or valor >= self.desde) and (self.hasta is None or valor <= self.hasta)
+            try:
+                date.fromisoformat(valor)
+                calendario = True
+            except ValueError:
+                calendario = False
+            info = self.dias[valor] = (formato, en_rango, calendario)
+        return info
+
+    def procesar(self, bloque, texto):
+        # Procesa un bloque de líneas completas del archivo (en bytes)
+        datos = np.frombuffer(bloque, dtype=np.uint8)
+        saltos = np.flatnonzero(datos == _LF)
+        finales = saltos if bloque.endswith(b'\n') else np.append(saltos, len(datos))
+        inicios = np.concatenate(([0], saltos + 1))[:len(finales)]
+        con_cr = (finales > inicios) & (datos[np.maximum(finales - 1, 0)] == _CR)
+        contenidos = finales - con_cr  # Fin de cada línea sin el '\r\n' o '\n'
+        raros = np.flatnonzero((datos == _COMILLA) | (datos == _CR) | (datos == 0))
+        simples = _contar(raros, inicios, contenidos) == 0
+        comas = np.flatnonzero(datos == _COMA)
+        if self.completo:
+            candidatas = (simples & (_contar(comas, inicios, contenidos) == len(self.encabezado) - 1)
+                          & (_contar(np.flatnonzero(datos >= 128), inicios, contenidos) == 0))
+        else:
+            candidatas = np.zeros(len(finales), dtype=bool)
+
+        # Filas del bloque en orden: el número de línea de las candidatas a los chequeos rápidos o los
+        # campos de las demás (separados por comas si la línea es simple y con csv.reader si no)
+        otras = np.flatnonzero(~candidatas).tolist()
+        if not otras:
+            self._procesar_filas(bloque, datos, inicios, contenidos, comas, None, np.arange(len(finales)))
+            return
+        orden = []
+        lineas_bloque = None
+        siguiente = 0
+        for j in otras:
+            if j < siguiente:
+                continue  # Parte de un registro que ya leyó csv.reader
+            orden.extend(range(siguiente, j))
+            if simples[j]:
+                linea = bloque[inicios[j]:contenidos[j]].decode('utf-8')
+                if linea:
+                    orden.append(linea.split(','))
+                siguiente = j + 1
+            else:
+                if lineas_bloque is None:
+                    lineas_bloque = [bloque[inicio:fin + 1] for inicio, fin in zip(inicios.tolist(), finales.tolist())]
+                filas, siguiente = texto.leer(lineas_bloque, simples, j)
+                orden.extend(filas)
+        orden.extend(range(siguiente, len(finales)))
+        lineas = np.array([fila for fila in orden if type(fila) is int], dtype=np.int64)
+        self._procesar_filas(bloque, datos, inicios, contenidos, comas, orden, lineas)
+
+    def _procesar_filas(self, bloque, datos, inicios, contenidos, comas, orden, lineas):
+        # 'orden' es la lista de filas del bloque (None si todas son líneas candidatas) y 'lineas' el
+        # número de línea de cada candidata
+        if orden is None:
+            n = len(lineas)
+            filas = [None] * n
+            pos_candidatas = lineas
+        else:
+            n = len(orden)
+            filas = orden
+            pos_candidatas = np.flatnonzero(np.fromiter((type(fila) is int for fila in orden), dtype=bool, count=n))
+        numeros = range(self.numero + 1, self.numero + n + 1)
+        self.numero += n
+
+        rapidas = np.zeros(n, dtype=bool)
+        descartadas = np.zeros(n, dtype=bool)
+        ap_codigos = np.zeros(n, dtype=np.int64)
+        octetos = np.zeros(n, dtype=np.int64)
+        ap_valores = []
+        if len(lineas):
+            campos = self._campos(inicios, contenidos, comas, lineas)
+            pasan, fuera, ap_valores, codigos_ap, suma = self._chequear(bloque, datos, campos)
+            rapidas[pos_candidatas] = pasan
+            descartadas[pos_candidatas] = fuera
+            ap_codigos[pos_candidatas] = codigos_ap
+            octetos[pos_candidatas] = suma
+            # Las candidatas que no pasan los chequeos siguen el camino normal con sus campos como texto
+            for posicion, linea in zip(pos_candidatas[~pasan].tolist(), lineas[~pasan].tolist()):
+                filas[posicion] = bloque[inicios[linea]:contenidos[linea]].decode('ascii').split(',')
+
+        emitidas = np.flatnonzero(rapidas & ~descartadas)
+        lentas = np.flatnonzero(~rapidas).tolist()
+        temporal = [None] * n if lentas else None
+        self._lentas(filas, numeros, lentas, temporal, emitidas, ap_valores, ap_codigos, octetos)
+        if not len(emitidas):
+            if temporal is not None:
+                self.temporal.writerows([fila for fila in temporal if fila is not None])
+            return
+
+        # Líneas de temporal.csv de las filas rápidas en rango, como las escribe csv.writer: sus campos
+        # no tienen comas, comillas ni saltos de línea, así que no van entre comillas
+        emitidas_candidatas = np.searchsorted(pos_candidatas, emitidas)
+        if self.en_orden:
+            desde = campos[0][0][emitidas_candidatas].tolist()
+            hasta = campos[-1][1][emitidas_candidatas].tolist()
+            salida = [bloque[inicio:fin] for inicio, fin in zip(desde, hasta)]
+        else:
+            valores = [[bloque[inicio:fin] for inicio, fin in zip(inicio_campo[emitidas_candidatas].tolist(),
+                                                                  fin_campo[emitidas_candidatas].tolist())]
+                       for inicio_campo, fin_campo in campos]
+            salida = [b','.join(fila) for fila in zip(*valores)]
+        if temporal is None:
+            self.archivo_temporal.write(_lineas_temporal(salida))
+            return
+        for posicion, linea in zip(emitidas.tolist(), salida):
+            temporal[posicion] = linea
+        seguidas = []  # Las líneas rápidas consecutivas se escriben juntas
+        for fila in temporal:
+            if fila is None:
+                continue
+            if type(fila) is bytes:
+                seguidas.append(fila)
+                continue
+            if seguidas:
+                self.archivo_temporal.write(_lineas_temporal(seguidas))
+                seguidas = []
+            self.temporal.writerow(fila)
+        if seguidas:
+            self.archivo_temporal.write(_lineas_temporal(seguidas))
+
+    def _campos(self, inicios, contenidos, comas, lineas):
+        # (inicios, finales) en el bloque de cada columna de 'columnas' en las líneas candidatas
+        inicio_linea = inicios[lineas]
+        primera_coma = np.searchsorted(comas, inicio_linea)
+        ultima = len(self.encabezado) - 1
+        campos = []
+        for k in self.posiciones:
+            inicio = inicio_linea if k == 0 else comas[primera_coma + k - 1] + 1
+            fin = contenidos[lineas] if k == ultima else comas[primera_coma + k]
+            campos.append((inicio, fin))
+        return campos
+
+    def _chequear(self, bloque, datos, campos):
+        # Devuelve (rápidas, descartadas por fecha, valores de MAC_AP, código de MAC_AP por fila, octetos por fila)
+        n = len(campos[0][0])
+        rapidas = np.ones(n, dtype=bool)
+        enteros = {}
+        for columna, (chequeo, ancho) in _CHEQUEOS.items():
+            c, largo = _codigos(datos, *campos[columnas.index(columna)], ancho)
+            rapidas &= chequeo(c, largo)
+            if columna in ('Input_Octects', 'Output_Octects'):
+                enteros[columna] = (c, largo)
+        factorizadas = {}
+        for columna in _POR_DICCIONARIO:
+            valores, codigos = _factorizar(bloque, *campos[columnas.index(columna)])
+            factorizadas[columna] = (valores, codigos)
+            if columna == 'Inicio_de_Conexión_Dia':
+                validos = np.array([self._dia(valor)[0] for valor in valores], dtype=bool)
+            else:
+                patron = regex_patterns[columna]
+                validos = np.array([patron.match(valor) is not None for valor in valores], dtype=bool)
+            rapidas &= validos[codigos]
+
+        # Día de inicio: fuera de rango se descarta; en rango pero inexistente (p. ej. 2019-02-30)
+        # la fila se vuelve errónea, lo que decide el camino normal
+        valores_dia, codigos_dia = factorizadas['Inicio_de_Conexión_Dia']
+        info = [self._dia(valor) for valor in valores_dia]
+        en_rango = np.array([rango for _, rango, _ in info], dtype=bool)[codigos_dia]
+        calendario = np.array([valido for _, _, valido in info], dtype=bool)[codigos_dia]
+        rapidas &= ~en_rango | calendario
+        descartadas = ~en_rango
+
+        octetos = np.where(rapidas & en_rango,
+                           _valor_entero(*enteros['Input_Octects']) + _valor_entero(*enteros['Output_Octects']), 0)
+        ap_valores, ap_codigos = factorizadas['MAC_AP']
+        return rapidas, descartadas, ap_valores, ap_codigos, octetos
+
+    def _lentas(self, filas, numeros, indices, temporal, emitidas, ap_valores, ap_codigos, octetos):
+        # Filas por el camino normal, en orden; sus registros válidos se intercalan en 'temporal'
+        acumulador = self.acumulador
+        validos = []
+        errores = []
+        for i in indices:
+            fila = filas[i]
+            for registro in _registros_de_filas(((numeros[i], fila),), self.desde, self.hasta, self.reportar_error,
+                                                disposicion=self.disposicion):
+                if registro.erroneo:
+                    errores.append(registro.campos + ['', ''])
+                    acumulador(registro)
+                else:
+                    validos.append((i, registro))
+                    temporal[i] = registro.campos + ['', '']
+        if errores:
+            self.errores.writerows(errores)
+        if not len(emitidas):
+            for _, registro in validos:
+                acumulador(registro)
+            return
+
+        # Orden de aparición de las AP: primera fila (rápida o lenta) de cada una en el bloque
+        cantidad = len(ap_valores)
+        codigos = ap_codigos[emitidas]
+        sumas = np.zeros(cantidad, dtype=np.int64)
+        np.add.at(sumas, codigos, octetos[emitidas])
+        sesiones = np.bincount(codigos, minlength=cantidad)
+        primeras = np.full(cantidad, len(filas), dtype=np.int64)
+        np.minimum.at(primeras, codigos, emitidas)
+        presentes = np.flatnonzero(sesiones)
+        apariciones = [(primera, ap_valores[k]) for k, primera in zip(presentes.tolist(), primeras[presentes].tolist())]
+        apariciones += [(i, registro.mac_ap) for i, registro in validos]
+        apariciones.sort(key=lambda aparicion: aparicion[0])
+        for _, ap in apariciones:
+            acumulador.codigo(ap)
+        for k, suma, cantidad_sesiones in zip(presentes.tolist(), sumas[presentes].tolist(), sesiones[presentes].tolist()):
+            acumulador.sumar(ap_valores[k], suma, cantidad_sesiones)
+        acumulador.filas_validas += len(emitidas)
+        for _, registro in validos:
+            acumulador(registro)
+
+def procesar_csv(file_path, desde, hasta, acumulador, escritor_temporal, escritor_errores, reportar_error=None,
+                 progreso=None, bytes_por_bloque=BYTES_POR_BLOQUE):
+    # Equivale a consumir(iter_registros(file_path, desde, hasta, reportar_error, progreso), acumulador,
+    # escritor_temporal, escritor_errores), procesando el archivo por bloques de líneas completas
+    desde, hasta = _fecha_iso(desde), _fecha_iso(hasta)
+    with abrir_binario(file_path) as (archivo, posicion):
+        texto = _Texto(archivo)
+        encabezado = next(texto.reader, None)
+        if encabezado is None:
+            return
+        motor = _Motor(encabezado, desde, hasta, acumulador, escritor_temporal, escritor_errores, reportar_error)
+        if texto.pendientes:
+            # Encabezado terminado en un '\r' suelto: el resto de su línea se lee con csv.reader
+            filas, _ = texto.leer()
+            motor._procesar_filas(b'', None, None, None, None, filas, np.zeros(0, dtype=np.int64))
+        while True:
+            bloque = archivo.read(bytes_por_bloque)
+            if not bloque:
+                break
+            bloque += archivo.readline()  # Cada bloque termina en un fin de línea (o en el final del archivo)
+            motor.procesar(bloque, texto)
+            if progreso is not None:
+                progreso.avanzar(motor.numero, posicion())
+        if progreso is not None:
+            progreso.avanzar(motor.numero, posicion(), forzar=True)
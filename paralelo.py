@@ -0,0 +1,309 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from automatas import AnalisisCancelado, EscritorFilas, consumir, nuevo_acumulador, _filas_csv, _imprimir_error, \
+    _registros_de_filas
+from comprimido import abrir_binario, abrir_salida, formato_de
+
+TAMANO_BLOQUE = 1 << 20  # Bytes leídos por vez al buscar los límites de registro
+RANGOS_POR_WORKER = 4  # Más rangos que procesos para repartir mejor la carga
+BYTES_POR_TAREA = 1 << 22  # Bytes descomprimidos por tarea cuando el CSV está comprimido
+TAREAS_EN_CURSO_POR_WORKER = 2  # Tareas enviadas al pool sin terminar: acota la memoria con CSV comprimidos
+
+def _fin_de_registro(archivo, posicion, objetivo):
+    # Devuelve la posición siguiente al primer fin de registro en 'objetivo' o después (el tamaño del archivo si
+    # no hay otro). 'posicion' es un límite de registro: desde ahí se sigue el estado de las comillas con
+    # FinesDeRegistro, igual que csv.reader, así un '\n' dentro de un campo entre comillas nunca es un límite.
+    fines = FinesDeRegistro()
+    archivo.seek(posicion)
+    while True:
+        bloque = archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            return posicion
+        antes = max(objetivo - posicion, 0)  # Bytes del bloque anteriores a 'objetivo'
+        if antes >= len(bloque):
+            fines.avanzar(bloque)
+        else:
+            fines.avanzar(bloque[:antes])
+            encontrados = fines.buscar(bloque[antes:])
+            if encontrados:
+                return posicion + antes + encontrados[0]
+        posicion += len(bloque)
+
+def dividir_en_rangos(file_path, partes):
+    # Divide el archivo en hasta 'partes' rangos de bytes [inicio, fin) alineados a límites de registro.
+    # Devuelve el encabezado del CSV y la lista de rangos (el primero empieza después del encabezado).
+    tamano = os.path.getsize(file_path)
+    with open(file_path, 'rb') as archivo:
+        inicio_datos = _fin_de_registro(archivo, 0, 0)
+        archivo.seek(0)
+        encabezado = next(csv.reader(io.StringIO(archivo.read(inicio_datos).decode('utf-8'))), [])
+
+        limites = [inicio_datos]
+        for k in range(1, partes):
+            objetivo = tamano * k // partes
+            if objetivo <= limites[-1]:
+                continue
+            fin = _fin_de_registro(archivo, limites[-1], objetivo)
+            if fin >= tamano:
+                break
+            limites.append(fin)
+        if tamano > limites[-1]:
+            limites.append(tamano)
+    return encabezado, list(zip(limites, limites[1:]))
+
+def encabezado_comprimido(file_path):
+    # Encabezado de un CSV comprimido y la posición (en los datos descomprimidos) donde empiezan los registros
+    with abrir_binario(file_path) as (archivo, _):
+        inicio_datos = _fin_de_registro(archivo, 0, 0)
+        archivo.seek(0)
+        return next(csv.reader(io.StringIO(archivo.read(inicio_datos).decode('utf-8'))), []), inicio_datos
+
+def bloques_descomprimidos(file_path, inicio, tamano=BYTES_POR_TAREA):
+    # Un archivo comprimido no permite saltar a un rango de bytes: se descomprime en orden desde 'inicio' y
+    # se produce (bytes, posición en el archivo en disco) por cada bloque de registros completos. Cada
+    # bloque empieza en un límite de registro y termina en el último fin de registro leído hasta ahí.
+    with abrir_binario(file_path) as (archivo, posicion):
+        archivo.seek(inicio)
+        fines = FinesDeRegistro()
+        partes = []  # Lo leído desde el último fin de registro
+        while True:
+            bloque = archivo.read(tamano)
+            if not bloque:
+                if partes:
+                    yield b''.join(partes), posicion()
+                return
+            encontrados = fines.buscar(bloque)
+            if encontrados:
+                corte = encontrados[-1]
+                partes.append(bloque[:corte])
+                yield b''.join(partes), posicion()
+                partes = [bloque[corte:]] if corte < len(bloque) else []
+            else:
+                partes.append(bloque)
+
+def lineas_del_rango(archivo, inicio, fin):
+    # Líneas de los bytes [inicio, fin) separadas como con open(..., newline=''): un '\r' suelto también
+    # termina la línea, igual que en el recorrido secuencial. Se lee en bloques cortados en el último '\n'.
+    archivo.seek(inicio)
+    resto = b''
+    while inicio < fin:
+        bloque = archivo.read(min(TAMANO_BLOQUE, fin - inicio))
+        if not bloque:
+            break
+        inicio += len(bloque)
+        datos = resto + bloque
+        corte = datos.rfind(b'\n') + 1
+        resto = datos[corte:]
+        yield from io.StringIO(datos[:corte].decode('utf-8'), newline='')
+    if resto:
+        yield from io.StringIO(resto.decode('utf-8'), newline='')
+
+# Estados de FinesDeRegistro
+_INICIO_CAMPO, _EN_CAMPO, _ENTRE_COMILLAS, _COMILLA = range(4)
+_SEPARADORES = b',\r'  # Bytes tras los que empieza un campo (además del '\n')
+
+class FinesDeRegistro:
+    # Encuentra los fines de registro en bytes que llegan en orden, con las reglas de csv.reader: una comilla
+    # abre un campo entre comillas solo al principio del campo; dentro de él '""' es una comilla y otra
+    # comilla lo cierra. En cualquier otro lugar (o"brien) la comilla es un carácter más y no cambia nada.
+    # Fuera de comillas un '\r' suelto también termina la línea (como al leer con newline=''), pero los
+    # fines que se informan son solo los '\n'. El estado se conserva entre llamadas, así que cada byte se
+    # mira una sola vez.
+    def __init__(self):
+        self.estado = _INICIO_CAMPO
+
+    def buscar(self, datos):
+        # Posiciones siguientes a cada '\n' de 'datos' que termina un registro
+        fines = []
+        estado = self.estado
+        posicion = 0
+        largo = len(datos)
+        while posicion < largo:
+            if estado == _COMILLA:
+                # El bloque anterior terminó en una comilla dentro de un campo entre comillas
+                if datos[posicion] == 0x22:
+                    estado = _ENTRE_COMILLAS
+                    posicion += 1
+                else:
+                    estado = _EN_CAMPO
+            elif estado == _ENTRE_COMILLAS:
+                comilla = datos.find(b'"', posicion)
+                if comilla == -1:
+                    break
+                if comilla + 1 == largo:
+                    estado = _COMILLA
+                    break
+                if datos[comilla + 1] == 0x22:
+                    posicion = comilla + 2
+                else:
+                    estado = _EN_CAMPO
+                    posicion = comilla + 1
+            else:
+                salto = datos.find(b'\n', posicion)
+                limite = largo if salto == -1 else salto
+                comilla = datos.find(b'"', posicion, limite)
+                if comilla != -1:
+                    if (estado == _INICIO_CAMPO if comilla == posicion else datos[comilla - 1] in _SEPARADORES):
+                        estado = _ENTRE_COMILLAS
+                    else:
+                        estado = _EN_CAMPO
+                    posicion = comilla + 1
+                elif salto == -1:
+                    if largo > posicion:
+                        estado = _INICIO_CAMPO if datos[largo - 1] in _SEPARADORES else _EN_CAMPO
+                    break
+                else:
+                    fines.append(salto + 1)
+                    estado = _INICIO_CAMPO
+                    posicion = salto + 1
+        self.estado = estado
+        return fines
+
+    def avanzar(self, datos):
+        # Como buscar, sin devolver los fines; fuera de comillas y sin comillas en 'datos', el estado depende
+        # solo del último byte
+        if self.estado in (_INICIO_CAMPO, _EN_CAMPO) and b'"' not in datos:
+            if datos:
+                self.estado = _INICIO_CAMPO if datos[-1] in _SEPARADORES or datos[-1] == 0x0A else _EN_CAMPO
+        else:
+            self.buscar(datos)
+
+def registros_crudos(archivo, inicio):
+    # Produce (inicio, fin, bytes) de cada registro completo desde 'inicio', que debe ser un límite de
+    # registro. Un registro final sin '\n' (todavía escribiéndose) no se produce.
+    archivo.seek(inicio)
+    fines = FinesDeRegistro()
+    partes = []
+    posicion = inicio
+    for linea in iter(archivo.readline, b''):
+        posicion += len(linea)
+        partes.append(linea)
+        if fines.buscar(linea):
+            yield inicio, posicion, b''.join(partes)
+            inicio = posicion
+            partes = []
+
+def _analizar_rango(tarea):
+    # Se ejecuta en un proceso del pool: procesa un rango y escribe sus filas en archivos parciales.
+    # Con 'datos' (bloque de un CSV comprimido) el rango es sobre esos bytes y no sobre el archivo.
+    (file_path, inicio, fin, encabezado, fecha_inicio, fecha_fin, parcial_temporal, parcial_errores, medir,
+     dimensiones, memoria_top, datos) = tarea
+    errores = []  # (número de fila dentro del rango, columna, valor); se informan en orden desde el proceso principal
+    filas_leidas = [0]
+
+    def numerar(filas):
+        for row_num, row in enumerate(filas, start=1):
+            filas_leidas[0] = row_num
+            yield row_num, row
+
+    with (open(file_path, 'rb') if datos is None else io.BytesIO(datos)) as csvfile, \
+            open(parcial_temporal, 'w', newline='', encoding='utf-8') as temporalfile, \
+            open(parcial_errores, 'w', newline='', encoding='utf-8') as errfile:
+        filas, disposicion = _filas_csv(lineas_del_rango(csvfile, inicio, fin), encabezado)
+        acumulador = nuevo_acumulador(memoria_top)
+        consumidores = [acumulador, EscritorFilas(temporalfile), EscritorFilas(errfile, erroneas=True)]
+        metricas = None
+        if medir:
+            from metricas import Metricas, cronometrar_consumidores
+            metricas = Metricas()
+            consumidores = cronometrar_consumidores(metricas, acumulador, consumidores[1:])
+        analitica = None
+        if dimensiones is not None:
+            from analitica import Analitica
+            analitica = Analitica(dimensiones, memoria_top)
+            consumidores.append(analitica if metricas is None else metricas.cronometrar('agregacion', analitica))
+        registros = _registros_de_filas(numerar(filas), fecha_inicio, fecha_fin,
+                                        lambda row_num, columna, valor: errores.append((row_num, columna, valor)),
+                                        metricas, disposicion)
+        consumir(registros, *consumidores)
+    return acumulador, filas_leidas[0], errores, metricas, analitica
+
+def _anexar(destino, parcial):
+    with open(parcial, 'rb') as origen:
+        shutil.copyfileobj(origen, destino, TAMANO_BLOQUE)
+    os.remove(parcial)
+
+def _en_orden(ejecutor, tareas, en_curso):
+    # Ejecuta las (tarea, posición) en el pool y produce (tarea, posición, resultado) en el orden de las tareas,
+    # con a lo sumo 'en_curso' tareas enviadas sin terminar
+    pendientes = deque()
+    for tarea, posicion in tareas:
+        pendientes.append((tarea, posicion, ejecutor.submit(_analizar_rango, tarea)))
+        if len(pendientes) >= en_curso:
+            tarea, posicion, futuro = pendientes.popleft()
+            yield tarea, posicion, futuro.result()
+    while pendientes:
+        tarea, posicion, futuro = pendientes.popleft()
+        yield tarea, posicion, futuro.result()
+
+def analizar_en_paralelo(file_path, fecha_inicio, fecha_fin, workers, archivo_temporal, archivo_errores,
+                         progreso=None, metricas=None, reportar_error=_imprimir_error, dimensiones=None,
+                         memoria_top=None, comprimir_salida=None):
+    # Procesa los rangos en un pool de procesos y une los resultados en el orden original del archivo,
+    # de modo que temporal.csv, errores.csv y los errores informados a reportar_error son los mismos
+    # que en modo secuencial.
+    # Con 'progreso' el avance se informa (y la cancelación se revisa) cada vez que se une un rango.
+    # Con 'metricas' cada proceso mide sus rangos y las mediciones se suman (los tiempos son de CPU sumada).
+    # Con 'dimensiones' cada proceso calcula su analitica.Analitica y se combinan; se devuelve junto al acumulador.
+    # Con 'memoria_top' los acumuladores son los aproximados de frecuentes y se combinan igual.
+    # Un CSV comprimido no se divide en rangos: el proceso principal lo descomprime en bloques que reparte al pool.
+    if formato_de(file_path) is None:
+        encabezado, rangos = dividir_en_rangos(file_path, workers * RANGOS_POR_WORKER)
+        bloques = ((inicio, fin, None, fin) for inicio, fin in rangos)
+    else:
+        encabezado, inicio_datos = encabezado_comprimido(file_path)
+        bloques = ((0, len(datos), datos, posicion)
+                   for datos, posicion in bloques_descomprimidos(file_path, inicio_datos))
+    directorio = tempfile.mkdtemp(prefix='automatas_')
+    acumulador = nuevo_acumulador(memoria_top)
+    analitica = None
+    if dimensiones is not None:
+        from analitica import Analitica
+        analitica = Analitica(dimensiones, memoria_top)
+    if progreso is not None:
+        progreso.acumulador = acumulador
+    try:
+        tareas = (
+            ((file_path, inicio, fin, encabezado, fecha_inicio, fecha_fin,
+              os.path.join(directorio, f'temporal_{indice}.csv'), os.path.join(directorio, f'errores_{indice}.csv'),
+              metricas is not None, dimensiones, memoria_top, datos), posicion)
+            for indice, (inicio, fin, datos, posicion) in enumerate(bloques)
+        )
+        with ProcessPoolExecutor(max_workers=workers) as ejecutor, \
+                abrir_salida(archivo_temporal, comprimir_salida, TAMANO_BLOQUE, binario=True) as temporalfile, \
+                abrir_salida(archivo_errores, comprimir_salida, TAMANO_BLOQUE, binario=True) as errfile:
+            encabezado_salida = io.StringIO()
+            EscritorFilas(encabezado_salida, encabezado=True)
+            temporalfile.write(encabezado_salida.getvalue().encode('utf-8'))
+            errfile.write(encabezado_salida.getvalue().encode('utf-8'))
+
+            filas_anteriores = 0
+            resultados = _en_orden(ejecutor, tareas, workers * TAREAS_EN_CURSO_POR_WORKER)
+            for tarea, posicion, (parcial, filas, errores, metricas_rango, analitica_rango) in resultados:
+                for row_num, columna, valor in errores:
+                    reportar_error(filas_anteriores + row_num, columna, valor)
+                filas_anteriores += filas
+
+                acumulador.combinar(parcial)
+                if metricas is not None:
+                    metricas.combinar(metricas_rango)
+                if analitica is not None:
+                    analitica.combinar(analitica_rango)
+
+                _anexar(temporalfile, tarea[6])
+                _anexar(errfile, tarea[7])
+                if progreso is not None:
+                    try:
+                        progreso.avanzar(filas_anteriores, posicion, forzar=True)
+                    except AnalisisCancelado:
+                        ejecutor.shutdown(wait=True, cancel_futures=True)
+                        raise
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return acumulador, analitica
@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+
+from automatas import Diccionario, ReporteErrores, ResultadoAnalisis, _I_DIA, _fecha_iso, _fecha_valida, \
+    _filas_csv, _motivo_error, _registros_de_filas
+from comprimido import abrir_texto
+
+# Resúmenes por día en memoria (analizar_csv(..., memorizar=True)): la primera pasada sobre un archivo lee
+# todas las fechas y guarda, para cada día, el tráfico, las sesiones y la primera fila de cada AP, las filas
+# erróneas y los errores por columna. Un análisis posterior del mismo archivo con otro rango suma los días
+# del rango sin leer el CSV. Los resúmenes de los últimos archivos se conservan mientras entren en
+# MEMORIA_RESUMENES y se descartan si el archivo cambia.
+MEMORIA_RESUMENES = 256 << 20
+BYTES_POR_ENTRADA = 180  # Entrada del dict de un día y su lista [octetos, sesiones, primera fila] (medido con tracemalloc)
+BYTES_POR_DIA = 400      # Clave y dicts de un día
+BYTES_POR_AP = 150       # MAC en el Diccionario
+SIN_FECHA = ''           # Filas sin día (o con un día crudo inválido): entran en todos los rangos
+
+def _huella(file_path):
+    info = os.stat(file_path)
+    return info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns
+
+def _en_rango(dia, desde, hasta):
+    # Los días se comparan como texto YYYY-MM-DD, como en automatas._registros_de_filas
+    return dia == SIN_FECHA or ((desde is None or dia >= desde) and (hasta is None or dia <= hasta))
+
+class ResumenDiario:
+    # Consumidor de registros (ver automatas.consumir) de una pasada sin rango de fechas. Un registro va al
+    # día de su Inicio_de_Conexión_Dia corregido, que es el que decide si entra en un rango; sus errores
+    # van al día crudo de la fila, que es el que decide si se informan (ver automatas.fuera_de_rango).
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.huella = _huella(file_path)
+        self.aps = Diccionario()
+        self.dias = {}      # Día -> {código de AP: [octetos, sesiones, primera fila]}
+        self.erroneas = {}  # Día -> filas erróneas
+        self.errores = {}   # Día crudo -> {(columna, motivo): cantidad}
+        self.entradas = 0
+        self._dia_crudo = SIN_FECHA
+
+    def __call__(self, registro):
+        dia = registro.campos[_I_DIA] or SIN_FECHA
+        if registro.erroneo:
+            self.erroneas[dia] = self.erroneas.get(dia, 0) + 1
+            return
+        por_ap = self.dias.get(dia)
+        if por_ap is None:
+            por_ap = self.dias[dia] = {}
+        codigo = self.aps.codigo(registro.mac_ap)
+        trafico = registro.input_octetos + registro.output_octetos
+        entrada = por_ap.get(codigo)
+        if entrada is None:
+            por_ap[codigo] = [trafico, 1, registro.numero]
+            self.entradas += 1
+        else:
+            entrada[0] += trafico
+            entrada[1] += 1
+
+    def registros(self, desde=None, hasta=None, reportar_error=None, progreso=None, metricas=None):
+        # Como automatas.iter_registros sin rango de fechas, anotando el día crudo de cada fila para asignarle
+        # sus errores. A reportar_error solo llegan los errores que informaría un análisis de [desde, hasta].
+        desde, hasta = _fecha_iso(desde), _fecha_iso(hasta)
+
+        def anotar(filas):
+            for fila in filas:
+                dia = disposicion.dia(fila[1])
+                self._dia_crudo = dia if dia is not None and _fecha_valida(dia) else SIN_FECHA
+                yield fila
+
+        def reportar(row_num, columna, valor):
+            errores = self.errores.setdefault(self._dia_crudo, {})
+            clave = (columna, _motivo_error(valor))
+            errores[clave] = errores.get(clave, 0) + 1
+            if reportar_error is not None and _en_rango(self._dia_crudo, desde, hasta):
+                reportar_error(row_num, columna, valor)
+
+        with abrir_texto(self.file_path) as (csvfile, posicion):
+            filas, disposicion = _filas_csv(csvfile)
+            filas = enumerate(filas, start=1)
+            if progreso is not None:
+                filas = progreso.seguir(filas, posicion)
+            yield from _registros_de_filas(anotar(filas), None, None, reportar, metricas, disposicion)
+
+    def resultado(self, fecha_inicio, fecha_fin, limite_errores_consola=100, segundos=None, metricas=None):
+        # ResultadoAnalisis del rango a partir de los días guardados; las AP quedan en orden de primera aparición
+        desde, hasta = _fecha_iso(fecha_inicio), _fecha_iso(fecha_fin)
+        totales = {}  # Código de AP -> [octetos, sesiones, primera fila]
+        for dia, por_ap in self.dias.items():
+            if not _en_rango(dia, desde, hasta):
+                continue
+            for codigo, (trafico, sesiones, primera) in por_ap.items():
+                total = totales.get(codigo)
+                if total is None:
+                    totales[codigo] = [trafico, sesiones, primera]
+                else:
+                    total[0] += trafico
+                    total[1] += sesiones
+                    total[2] = min(total[2], primera)
+        codigos = sorted(totales, key=lambda codigo: totales[codigo][2])
+        sesiones = [totales[codigo][1] for codigo in codigos]
+        erroneas = sum(cantidad for dia, cantidad in self.erroneas.items() if _en_rango(dia, desde, hasta))
+        resultado = ResultadoAnalisis([self.aps.valores[codigo] for codigo in codigos],
+                                      [totales[codigo][0] for codigo in codigos], sesiones, sum(sesiones), erroneas,
+                                      self.file_path, fecha_inicio, fecha_fin, 'memoria', segundos, metricas)
+        reporte = ReporteErrores(limite_errores_consola)
+        for dia, errores in self.errores.items():
+            if _en_rango(dia, desde, hasta):
+                for (columna, motivo), cantidad in errores.items():
+                    reporte.total += cantidad
+                    reporte.por_columna[columna] = reporte.por_columna.get(columna, 0) + cantidad
+                    reporte.por_motivo[motivo] = reporte.por_motivo.get(motivo, 0) + cantidad
+        resultado.errores = reporte.a_dict()
+        return resultado
+
+    def bytes_ocupados(self):
+        return (self.entradas * BYTES_POR_ENTRADA + (len(self.dias) + len(self.errores)) * BYTES_POR_DIA
+                + len(self.aps.valores) * BYTES_POR_AP)
+
+class CacheResumenes:
+    # Resúmenes de los archivos usados más recientemente (LRU) mientras su tamaño estimado entre en 'memoria'.
+    # Un resumen se descarta si el archivo cambió (dispositivo, inodo, tamaño o fecha de modificación).
+    def __init__(self, memoria=MEMORIA_RESUMENES):
+        self.memoria = memoria
+        self.resumenes = OrderedDict()  # Ruta absoluta -> ResumenDiario, del menos al más usado
+        self._candado = threading.Lock()  # La interfaz analiza en un hilo aparte
+
+    def buscar(self, file_path):
+        clave = os.path.abspath(file_path)
+        with self._candado:
+            resumen = self.resumenes.get(clave)
+            if resumen is None:
+                return None
+            if resumen.huella != _huella(file_path):
+                del self.resumenes[clave]
+                return None
+            self.resumenes.move_to_end(clave)
+            return resumen
+
+    def guardar(self, resumen):
+        # No guarda el resumen si el archivo cambió durante la lectura o si no entra solo en la memoria
+        if resumen.huella != _huella(resumen.file_path) or resumen.bytes_ocupados() > self.memoria:
+            return False
+        with self._candado:
+            self.resumenes[os.path.abspath(resumen.file_path)] = resumen
+            self.resumenes.move_to_end(os.path.abspath(resumen.file_path))
+            while self.bytes_ocupados() > self.memoria:
+                self.resumenes.popitem(last=False)
+        return True
+
+    def bytes_ocupados(self):
+        return sum(resumen.bytes_ocupados() for resumen in self.resumenes.values())
+
+    def vaciar(self):
+        with self._candado:
+            self.resumenes.clear()
+
+resumenes = CacheResumenes()
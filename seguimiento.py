@@ -0,0 +1,193 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+
+from automatas import AcumuladorTrafico, EscritorFilas, ReporteErrores, ResultadoAnalisis, consumir, _fecha_iso, \
+    _filas_csv, _registros_de_filas
+from comprimido import formato_de
+from paralelo import registros_crudos
+
+# Modo seguimiento: procesa solo los registros agregados al CSV desde la última vez. La posición
+# leída, la cantidad de filas, el tráfico acumulado por AP y el tamaño de temporal.csv / errores.csv se
+# guardan en un archivo de control ('<archivo>.checkpoint'), así cada actualización cuesta lo mismo que los
+# datos nuevos. Si el proceso se corta entre escribir las salidas y guardar el control, la siguiente
+# actualización recorta las salidas al tamaño guardado antes de volver a leer esos registros.
+# Para detectar que el archivo fue reescrito se guardan su tamaño y fecha y el hash de todo lo leído: si
+# tamaño y fecha no cambiaron no hay nada que hacer; si cambiaron, se verifica el hash antes de seguir.
+VERSION = 4
+
+def ruta_checkpoint(file_path):
+    return file_path + '.checkpoint'
+
+def _hash(archivo, inicio, fin, sha=None):
+    # sha256 de los bytes [inicio, fin) del archivo, siguiendo 'sha' si se pasa
+    sha = hashlib.sha256() if sha is None else sha
+    archivo.seek(inicio)
+    while inicio < fin:
+        bloque = archivo.read(min(1 << 20, fin - inicio))
+        if not bloque:
+            break
+        sha.update(bloque)
+        inicio += len(bloque)
+    return sha
+
+def _recortar(path, tamano):
+    # Descarta lo escrito en 'path' después del último control guardado
+    if os.path.exists(path) and os.path.getsize(path) > tamano:
+        with open(path, 'r+b') as archivo:
+            archivo.truncate(tamano)
+
+class Seguimiento:
+    def __init__(self, file_path, fecha_inicio=None, fecha_fin=None, archivo_temporal='temporal.csv',
+                 archivo_errores='errores.csv', checkpoint=None, limite_errores_consola=100):
+        if formato_de(file_path) is not None:
+            # Un comprimido no crece por el final como un log: no hay registros nuevos que leer desde una posición
+            raise ValueError("El modo seguimiento necesita un CSV sin comprimir")
+        self.file_path = file_path
+        self.desde, self.hasta = _fecha_iso(fecha_inicio), _fecha_iso(fecha_fin)
+        self.archivo_temporal = archivo_temporal
+        self.archivo_errores = archivo_errores
+        self.limite_errores_consola = limite_errores_consola
+        self.checkpoint = checkpoint or ruta_checkpoint(file_path)
+        self.estado = self._cargar()
+
+    def _estado_inicial(self):
+        return {'version': VERSION, 'desde': self.desde, 'hasta': self.hasta, 'dispositivo': None,
+                'inodo': None, 'huella': None, 'posicion': 0, 'filas': 0, 'muestra': None, 'encabezado': None,
+                'ap_trafico': {}, 'ap_sesiones': {}, 'filas_validas': 0, 'filas_erroneas': 0,
+                'bytes_temporal': 0, 'bytes_errores': 0}
+
+    def _cargar(self):
+        try:
+            with open(self.checkpoint, encoding='utf-8') as entrada:
+                estado = json.load(entrada)
+        except (OSError, ValueError):
+            estado = None
+        if (not isinstance(estado, dict) or estado.get('version') != VERSION
+                or (estado.get('desde'), estado.get('hasta')) != (self.desde, self.hasta)):
+            # Sin control previo (o con otro rango de fechas): se empieza de cero y las salidas se rehacen
+            estado = self._estado_inicial()
+            for salida in (self.archivo_temporal, self.archivo_errores):
+                if os.path.exists(salida):
+                    os.remove(salida)
+        return estado
+
+    def _guardar(self):
+        temporal = self.checkpoint + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as salida:
+            json.dump(self.estado, salida)
+        os.replace(temporal, self.checkpoint)
+
+    def _leido(self, archivo, info):
+        # sha256 de lo ya leído ([0, posicion)) si el archivo es el mismo y solo creció; None si fue rotado
+        # (otro inodo), truncado o reescrito desde la última lectura
+        estado = self.estado
+        if ((info.st_dev, info.st_ino) != (estado['dispositivo'], estado['inodo'])
+                or info.st_size < estado['posicion']):
+            return None
+        sha = _hash(archivo, 0, estado['posicion'])
+        return sha if sha.hexdigest() == estado['muestra'] else None
+
+    def actualizar(self):
+        # Procesa los registros completos nuevos, los agrega a temporal.csv / errores.csv y guarda
+        # el control. Devuelve la cantidad de filas nuevas leídas.
+        try:
+            return self._actualizar()
+        except BaseException:
+            # El estado en memoria ya avanzó sobre filas que quizá no llegaron a las salidas: se vuelve al último
+            # control guardado, y la próxima actualización recorta las salidas y relee desde ahí
+            self.estado = self._cargar()
+            raise
+
+    def _actualizar(self):
+        estado = self.estado
+        leidas = 0
+        with open(self.file_path, 'rb') as archivo:
+            info = os.fstat(archivo.fileno())
+            huella = [info.st_size, info.st_mtime_ns]
+            if (info.st_dev, info.st_ino) == (estado['dispositivo'], estado['inodo']) and huella == estado['huella']:
+                return 0  # Sin cambios desde la última lectura
+            sha = None if estado['inodo'] is None else self._leido(archivo, info)
+            if sha is None:
+                if estado['inodo'] is not None:
+                    # Archivo nuevo tras una rotación: se lee desde el principio y el tráfico sigue acumulándose
+                    estado.update(posicion=0, filas=0, encabezado=None)
+                sha = hashlib.sha256()
+            estado['dispositivo'], estado['inodo'] = info.st_dev, info.st_ino
+            leido = estado['posicion']
+
+            crudos = registros_crudos(archivo, estado['posicion'])
+            if estado['encabezado'] is None:
+                primero = next(crudos, None)
+                if primero is None:
+                    return 0
+                estado['encabezado'] = next(csv.reader(io.StringIO(primero[2].decode('utf-8'))), [])
+                estado['posicion'] = primero[1]
+
+            def lineas():
+                # Como en la lectura secuencial (newline=''), un '\r' suelto fuera de comillas corta la fila
+                for _, fin, registro in crudos:
+                    yield from io.StringIO(registro.decode('utf-8'), newline='')
+                    estado['posicion'] = fin
+
+            def numeradas(filas):
+                nonlocal leidas
+                for row_num, row in enumerate(filas, start=estado['filas'] + 1):
+                    estado['filas'] = row_num
+                    leidas += 1
+                    yield row_num, row
+
+            _recortar(self.archivo_temporal, estado['bytes_temporal'])
+            _recortar(self.archivo_errores, estado['bytes_errores'])
+            nuevo_temporal = not os.path.exists(self.archivo_temporal) or os.path.getsize(self.archivo_temporal) == 0
+            nuevo_errores = not os.path.exists(self.archivo_errores) or os.path.getsize(self.archivo_errores) == 0
+            reporte = ReporteErrores(self.limite_errores_consola)  # El límite de consola es por actualización
+            acumulador = AcumuladorTrafico()
+            acumulador.combinar(self._acumulado())
+            with open(self.archivo_temporal, 'a', newline='', encoding='utf-8') as temporalfile, \
+                    open(self.archivo_errores, 'a', newline='', encoding='utf-8') as errfile:
+                filas, disposicion = _filas_csv(lineas(), estado['encabezado'])
+                consumir(_registros_de_filas(numeradas(filas), self.desde, self.hasta, reporte, None, disposicion),
+                         acumulador,
+                         EscritorFilas(temporalfile, encabezado=nuevo_temporal),
+                         EscritorFilas(errfile, erroneas=True, encabezado=nuevo_errores))
+            estado['bytes_temporal'] = os.path.getsize(self.archivo_temporal)
+            estado['bytes_errores'] = os.path.getsize(self.archivo_errores)
+            estado['muestra'] = _hash(archivo, leido, estado['posicion'], sha).hexdigest()
+            estado['huella'] = huella
+        reporte.imprimir_resumen()
+        estado.update(ap_trafico=acumulador.ap_trafico, ap_sesiones=acumulador.ap_sesiones,
+                      filas_validas=acumulador.filas_validas, filas_erroneas=acumulador.filas_erroneas)
+        self._guardar()
+        return leidas
+
+    def _acumulado(self):
+        acumulador = AcumuladorTrafico()
+        ap_sesiones = self.estado['ap_sesiones']
+        for ap, trafico in self.estado['ap_trafico'].items():
+            acumulador.sumar(ap, trafico, ap_sesiones.get(ap, 0))
+        acumulador.filas_validas = self.estado['filas_validas']
+        acumulador.filas_erroneas = self.estado['filas_erroneas']
+        return acumulador
+
+    @property
+    def ap_trafico(self):
+        return self.estado['ap_trafico']
+
+    def resultado(self):
+        return ResultadoAnalisis.desde_acumulador(self._acumulado(), self.file_path, self.desde, self.hasta,
+                                                  'seguimiento')
+
+def seguir_csv(file_path, fecha_inicio=None, fecha_fin=None, intervalo=1.0, al_actualizar=None, detener=None):
+    # Sondea el archivo cada 'intervalo' segundos hasta que detener() devuelva True.
+    # al_actualizar(seguimiento, filas_nuevas) se llama después de cada lectura con filas nuevas.
+    seguimiento = Seguimiento(file_path, fecha_inicio, fecha_fin)
+    while detener is None or not detener():
+        nuevas = seguimiento.actualizar()
+        if nuevas and al_actualizar is not None:
+            al_actualizar(seguimiento, nuevas)
+        time.sleep(intervalo)
+    return seguimiento
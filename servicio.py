@@ -0,0 +1,472 @@
+import argparse
+import asyncio
+import csv
+import heapq
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from automatas import _I_DIA, _filas_csv, _motivo_error, _registros_de_filas
+from paralelo import FinesDeRegistro
+from resumen_diario import SIN_FECHA, _en_rango
+
+# Servicio local de ingesta: recibe por HTTP (en un puerto local o en un socket Unix) varios CSV a la vez,
+# los valida y suma a medida que llegan y responde consultas de tráfico por AP y rango de fechas sobre el
+# estado en memoria, compartido por todas las subidas.
+#
+#   python3 servicio.py servir --socket /tmp/automatas.sock
+#   python3 servicio.py subir datos/*.csv --socket /tmp/automatas.sock
+#   python3 servicio.py consultar --desde 2019-01-01 --hasta 2019-06-30 --top 10 --socket /tmp/automatas.sock
+#   curl --unix-socket /tmp/automatas.sock --data-binary @datos.csv http://localhost/subir
+#
+# Rutas: POST (o PUT) /subir con el CSV como cuerpo (Content-Length o chunked), GET /trafico?desde=&hasta=&top=
+# y GET /estado. Cada subida se manda al pool de procesos en lotes de unos TAMANO_LOTE bytes; el proceso busca
+# el último fin de registro del lote, valida hasta ahí y devuelve cuántos bytes usó, y el resto pasa al lote
+# siguiente. Así ni el corte ni la validación bloquean el bucle de eventos, que solo suma los resultados
+# parciales y responde las consultas. Si en MAX_REGISTRO bytes no aparece un fin de registro (por ejemplo,
+# una comilla que abre un campo y nunca se cierra) la subida se rechaza en lugar de acumular todo el cuerpo.
+# Contrapresión: cada subida tiene a lo sumo un lote en el pool y lee el siguiente mientras tanto; el pool
+# acepta LOTES_EN_CURSO_POR_PROCESO lotes por proceso y se atienden hasta MAX_SUBIDAS subidas a la vez. Una
+# subida que espera deja de leer su conexión, y TCP frena al cliente. Si una subida falla (por ejemplo, un
+# CSV que no es UTF-8), los lotes ya sumados quedan en el estado.
+TAMANO_LECTURA = 1 << 16  # Bytes leídos de la conexión por vez
+TAMANO_LOTE = 1 << 20     # Bytes por lote validado en el pool
+MAX_REGISTRO = 16 << 20   # Bytes sin un fin de registro tras los que se rechaza la subida
+ESPERA_CIERRE = 5.0       # Segundos que se descarta lo que sigue mandando el cliente tras responder un error
+LOTES_EN_CURSO_POR_PROCESO = 2
+MAX_SUBIDAS = 32
+PUERTO = 8765
+
+class ErrorPedido(Exception):
+    # Pedido HTTP inválido; se responde con 'estado' y el mensaje
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+def _sin_fin_de_registro():
+    return ErrorPedido(413, f"No hay un fin de registro en {MAX_REGISTRO >> 20} MiB (¿una comilla sin cerrar?)")
+
+def procesar_lote(encabezado, datos, final=False):
+    # Se ejecuta en el pool: valida los registros completos de un lote (bytes UTF-8 que empiezan en un límite de
+    # registro) con el encabezado de su subida y devuelve el tráfico y las sesiones por día y AP, las filas
+    # erróneas por día, los errores por (columna, motivo) y los bytes usados, hasta el último fin de registro
+    # (todo el lote si es el 'final' de la subida). El día de cada registro es el de Inicio_de_Conexión_Dia
+    # corregido, como en resumen_diario.
+    dias = {}      # Día -> {MAC_AP: [octetos, sesiones]}
+    erroneas = {}  # Día -> filas erróneas
+    errores = {}   # (columna, motivo) -> cantidad
+
+    def reportar(row_num, columna, valor):
+        clave = (columna, _motivo_error(valor))
+        errores[clave] = errores.get(clave, 0) + 1
+
+    if final:
+        usado = len(datos)
+    else:
+        fines = FinesDeRegistro().buscar(datos)
+        usado = fines[-1] if fines else 0
+    filas, disposicion = _filas_csv(io.StringIO(datos[:usado].decode('utf-8'), newline=''), encabezado)
+    for registro in _registros_de_filas(enumerate(filas, start=1), None, None, reportar, None, disposicion):
+        dia = registro.campos[_I_DIA] or SIN_FECHA
+        if registro.erroneo:
+            erroneas[dia] = erroneas.get(dia, 0) + 1
+            continue
+        por_ap = dias.get(dia)
+        if por_ap is None:
+            por_ap = dias[dia] = {}
+        trafico = registro.input_octetos + registro.output_octetos
+        entrada = por_ap.get(registro.mac_ap)
+        if entrada is None:
+            por_ap[registro.mac_ap] = [trafico, 1]
+        else:
+            entrada[0] += trafico
+            entrada[1] += 1
+    return dias, erroneas, errores, usado
+
+class EstadoTrafico:
+    # Tráfico de todas las subidas por día y AP. Solo lo modifica el bucle de eventos, así que no necesita
+    # candados. 'totales' lleva la suma de todos los días para responder sin recorrerlos las consultas sin rango.
+    def __init__(self):
+        self.dias = {}      # Día -> {MAC_AP: [octetos, sesiones]}
+        self.totales = {}   # MAC_AP -> [octetos, sesiones]
+        self.erroneas = {}  # Día -> filas erróneas
+        self.errores = {}   # (columna, motivo) -> cantidad
+        self.subidas = 0
+
+    def agregar(self, dias, erroneas, errores):
+        for dia, por_ap in dias.items():
+            destino = self.dias.get(dia)
+            if destino is None:
+                destino = self.dias[dia] = {}
+            for mac, (trafico, sesiones) in por_ap.items():
+                for tabla in (destino, self.totales):
+                    entrada = tabla.get(mac)
+                    if entrada is None:
+                        tabla[mac] = [trafico, sesiones]
+                    else:
+                        entrada[0] += trafico
+                        entrada[1] += sesiones
+        for dia, cantidad in erroneas.items():
+            self.erroneas[dia] = self.erroneas.get(dia, 0) + cantidad
+        for clave, cantidad in errores.items():
+            self.errores[clave] = self.errores.get(clave, 0) + cantidad
+
+    def consultar(self, desde=None, hasta=None, top=None):
+        # Tráfico y sesiones por AP en [desde, hasta] (YYYY-MM-DD o None), de mayor a menor tráfico
+        if desde is None and hasta is None:
+            totales = self.totales
+        else:
+            totales = {}
+            for dia, por_ap in self.dias.items():
+                if not _en_rango(dia, desde, hasta):
+                    continue
+                for mac, (trafico, sesiones) in por_ap.items():
+                    total = totales.get(mac)
+                    if total is None:
+                        totales[mac] = [trafico, sesiones]
+                    else:
+                        total[0] += trafico
+                        total[1] += sesiones
+        clave = lambda mac: totales[mac][0]
+        orden = sorted(totales, key=clave, reverse=True) if top is None else heapq.nlargest(top, totales, key=clave)
+        return {
+            'fecha_inicio': desde,
+            'fecha_fin': hasta,
+            'filas_validas': sum(sesiones for _, sesiones in totales.values()),
+            'filas_erroneas': sum(cantidad for dia, cantidad in self.erroneas.items() if _en_rango(dia, desde, hasta)),
+            'aps': [{'mac_ap': mac, 'octetos': totales[mac][0], 'sesiones': totales[mac][1]} for mac in orden],
+        }
+
+    def a_dict(self):
+        return {
+            'subidas': self.subidas,
+            'dias': len(self.dias),
+            'aps': len(self.totales),
+            'filas_validas': sum(sesiones for _, sesiones in self.totales.values()),
+            'filas_erroneas': sum(self.erroneas.values()),
+            'errores': [{'columna': columna, 'motivo': motivo, 'cantidad': cantidad}
+                        for (columna, motivo), cantidad in sorted(self.errores.items())],
+        }
+
+async def _leer_cabeceras(lector):
+    linea = await lector.readline()
+    if not linea:
+        return None, None, None
+    try:
+        metodo, destino, _ = linea.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise ErrorPedido(400, "Línea de pedido inválida")
+    cabeceras = {}
+    while True:
+        linea = await lector.readline()
+        if linea in (b'\r\n', b'\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip()
+    return metodo, destino, cabeceras
+
+async def _cuerpo(lector, cabeceras):
+    # Bloques del cuerpo del pedido, con Content-Length o Transfer-Encoding: chunked
+    if cabeceras.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            try:
+                tamano = int((await lector.readline()).split(b';')[0], 16)
+            except ValueError:
+                raise ErrorPedido(400, "Fragmento inválido")
+            if tamano == 0:
+                while (await lector.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            while tamano:
+                bloque = await lector.read(min(tamano, TAMANO_LECTURA))
+                if not bloque:
+                    raise ErrorPedido(400, "Cuerpo incompleto")
+                tamano -= len(bloque)
+                yield bloque
+            await lector.readline()
+    else:
+        largo = cabeceras.get('content-length', '0')
+        if not (largo.isascii() and largo.isdigit()):
+            raise ErrorPedido(400, f"Content-Length inválido: {largo}")
+        restantes = int(largo)
+        while restantes:
+            bloque = await lector.read(min(restantes, TAMANO_LECTURA))
+            if not bloque:
+                raise ErrorPedido(400, "Cuerpo incompleto")
+            restantes -= len(bloque)
+            yield bloque
+
+async def _descartar_entrada(lector, escritor):
+    # Tras responder un error (quizá a mitad del cuerpo) se cierra la escritura y se descarta lo que el cliente
+    # siga mandando: cerrar con datos sin leer reinicia la conexión y el cliente podría perder la respuesta
+    if escritor.can_write_eof():
+        escritor.write_eof()
+    limite = time.monotonic() + ESPERA_CIERRE
+    while True:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return
+        try:
+            if not await asyncio.wait_for(lector.read(TAMANO_LECTURA), restante):
+                return
+        except asyncio.TimeoutError:
+            return
+
+def _fecha(parametros, nombre):
+    valor = parametros.get(nombre, [None])[0]
+    if valor is None:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ErrorPedido(400, f"Fecha inválida en '{nombre}': {valor} (use YYYY-MM-DD)")
+
+class Servicio:
+    # 'ejecutor' valida los lotes (por defecto un ProcessPoolExecutor de 'procesos' procesos)
+    def __init__(self, procesos=None, ejecutor=None, max_subidas=MAX_SUBIDAS):
+        procesos = procesos or os.cpu_count() or 1
+        self.estado = EstadoTrafico()
+        self.ejecutor = ejecutor if ejecutor is not None else ProcessPoolExecutor(procesos)
+        self.lotes = asyncio.Semaphore(procesos * LOTES_EN_CURSO_POR_PROCESO)
+        self.subidas = asyncio.Semaphore(max_subidas)
+        self.subidas_en_curso = 0
+
+    async def iniciar(self, socket=None, host='127.0.0.1', puerto=PUERTO):
+        # Devuelve el asyncio.Server escuchando en el socket Unix 'socket' o en host:puerto.
+        # Los procesos del pool se crean antes de atender pedidos: con fork se crean todos en el primer envío, y
+        # hacerlo mientras otros hilos leen archivos puede dejar a los procesos hijos bloqueados.
+        await asyncio.get_running_loop().run_in_executor(self.ejecutor, int)
+        if socket is not None:
+            return await asyncio.start_unix_server(self.atender, socket)
+        return await asyncio.start_server(self.atender, host, puerto)
+
+    def cerrar(self):
+        self.ejecutor.shutdown()
+
+    async def atender(self, lector, escritor):
+        # Un pedido por conexión
+        try:
+            try:
+                metodo, destino, cabeceras = await _leer_cabeceras(lector)
+                if metodo is None:
+                    return
+                estado, respuesta = 200, await self.responder(metodo, destino, cabeceras, lector)
+            except ErrorPedido as e:
+                estado, respuesta = e.estado, {'error': str(e)}
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                estado, respuesta = 400, {'error': str(e)}
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                estado, respuesta = 500, {'error': f"{type(e).__name__}: {e}"}
+            cuerpo = json.dumps(respuesta, ensure_ascii=False).encode('utf-8')
+            escritor.write(f"HTTP/1.1 {estado} {HTTPStatus(estado).phrase}\r\n"
+                           f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(cuerpo)}\r\n"
+                           f"Connection: close\r\n\r\n".encode('latin-1') + cuerpo)
+            await escritor.drain()
+            if estado != 200:
+                await _descartar_entrada(lector, escritor)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def responder(self, metodo, destino, cabeceras, lector):
+        url = urlsplit(destino)
+        parametros = parse_qs(url.query)
+        if url.path == '/subir':
+            if metodo not in ('POST', 'PUT'):
+                raise ErrorPedido(405, "Use POST o PUT para subir un CSV")
+            async with self.subidas:
+                return await self.subir(_cuerpo(lector, cabeceras))
+        if metodo != 'GET':
+            raise ErrorPedido(405, f"Método no admitido: {metodo}")
+        if url.path == '/trafico':
+            top = parametros.get('top', [None])[0]
+            if top is not None and not top.isdigit():
+                raise ErrorPedido(400, f"'top' inválido: {top}")
+            return self.estado.consultar(_fecha(parametros, 'desde'), _fecha(parametros, 'hasta'),
+                                         None if top is None else int(top))
+        if url.path == '/estado':
+            return dict(self.estado.a_dict(), subidas_en_curso=self.subidas_en_curso)
+        raise ErrorPedido(404, f"Ruta desconocida: {url.path}")
+
+    async def _validar(self, encabezado, datos, final=False):
+        # Devuelve (filas válidas, filas erróneas, bytes usados) del lote
+        async with self.lotes:
+            dias, erroneas, errores, usado = await asyncio.get_running_loop().run_in_executor(
+                self.ejecutor, procesar_lote, encabezado, datos, final)
+        self.estado.agregar(dias, erroneas, errores)
+        return sum(sum(sesiones for _, sesiones in por_ap.values()) for por_ap in dias.values()), \
+            sum(erroneas.values()), usado
+
+    async def subir(self, bloques):
+        # Manda el cuerpo al pool en lotes y lee el siguiente mientras se valida uno. 'resto' son los bytes
+        # recibidos que todavía no se validaron; el lote en curso es resto[:enviado].
+        inicio = time.perf_counter()
+        self.subidas_en_curso += 1
+        encabezado = None
+        fines_encabezado = FinesDeRegistro()
+        pendiente = None
+        enviado = 0
+        minimo = TAMANO_LOTE  # Bytes de 'resto' con los que se arma el próximo lote
+        validas = erroneas = 0
+        resto = bytearray()
+        try:
+            async for bloque in bloques:
+                resto += bloque
+                if encabezado is None:
+                    fines = fines_encabezado.buscar(bloque)
+                    if not fines:
+                        if len(resto) > MAX_REGISTRO:
+                            raise _sin_fin_de_registro()
+                        continue
+                    corte = len(resto) - len(bloque) + fines[0]
+                    encabezado = next(csv.reader(io.StringIO(resto[:corte].decode('utf-8'), newline='')), [])
+                    del resto[:corte]
+                if pendiente is not None:
+                    if len(resto) - enviado < TAMANO_LOTE:
+                        continue
+                    lote_validas, lote_erroneas, usado = await pendiente
+                    validas, erroneas = validas + lote_validas, erroneas + lote_erroneas
+                    pendiente = None
+                    del resto[:usado]
+                    if not usado:
+                        # Un registro ocupa todo el lote: se reintenta con el doble de bytes, así cada byte se
+                        # revisa pocas veces aunque el registro siga por varios lotes
+                        if enviado >= MAX_REGISTRO:
+                            raise _sin_fin_de_registro()
+                        minimo = 2 * enviado
+                    else:
+                        minimo = TAMANO_LOTE
+                if len(resto) < minimo:
+                    continue
+                enviado = len(resto)
+                pendiente = asyncio.ensure_future(self._validar(encabezado, bytes(resto)))
+            if encabezado is None and resto:
+                encabezado = next(csv.reader(io.StringIO(resto.decode('utf-8'), newline='')), [])
+                resto = bytearray()
+            if pendiente is not None:
+                lote_validas, lote_erroneas, usado = await pendiente
+                validas, erroneas = validas + lote_validas, erroneas + lote_erroneas
+                pendiente = None
+                del resto[:usado]
+            if resto:
+                lote_validas, lote_erroneas, _ = await self._validar(encabezado, bytes(resto), final=True)
+                validas, erroneas = validas + lote_validas, erroneas + lote_erroneas
+        finally:
+            if pendiente is not None:
+                pendiente.cancel()
+            self.subidas_en_curso -= 1
+        self.estado.subidas += 1
+        return {'filas_validas': validas, 'filas_erroneas': erroneas, 'segundos': time.perf_counter() - inicio}
+
+# Cliente: 'direccion' es la ruta de un socket Unix o (host, puerto)
+
+async def pedir(direccion, metodo, ruta, cuerpo=None):
+    # Hace un pedido y devuelve (estado, respuesta JSON). 'cuerpo' es un iterable asíncrono de bytes que se
+    # envía chunked, esperando a que el servicio lea cada bloque (contrapresión).
+    if isinstance(direccion, str):
+        lector, escritor = await asyncio.open_unix_connection(direccion)
+    else:
+        lector, escritor = await asyncio.open_connection(*direccion)
+    try:
+        escritor.write(f"{metodo} {ruta} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n".encode('latin-1')
+                       + (b"Transfer-Encoding: chunked\r\n\r\n" if cuerpo is not None else b"\r\n"))
+        if cuerpo is not None:
+            async for bloque in cuerpo:
+                if bloque:
+                    escritor.write(b'%x\r\n%s\r\n' % (len(bloque), bloque))
+                    await escritor.drain()
+            escritor.write(b'0\r\n\r\n')
+        await escritor.drain()
+        linea = await lector.readline()
+        estado = int(linea.split()[1])
+        while (await lector.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return estado, json.loads(await lector.read())
+    finally:
+        escritor.close()
+
+async def _bloques_de_archivo(path, tamano=TAMANO_LOTE):
+    from comprimido import abrir_binario  # Los CSV comprimidos se descomprimen antes de enviarlos
+    with abrir_binario(path) as (archivo, _):
+        while True:
+            bloque = await asyncio.to_thread(archivo.read, tamano)
+            if not bloque:
+                return
+            yield bloque
+
+async def subir(direccion, path):
+    return await pedir(direccion, 'POST', '/subir', _bloques_de_archivo(path))
+
+async def consultar(direccion, desde=None, hasta=None, top=None):
+    parametros = {nombre: valor for nombre, valor in (('desde', desde), ('hasta', hasta), ('top', top))
+                  if valor is not None}
+    return await pedir(direccion, 'GET', '/trafico' + ('?' + urlencode(parametros) if parametros else ''))
+
+async def _servir(args):
+    servicio = Servicio(args.procesos)
+    servidor = await servicio.iniciar(args.socket, args.host, args.puerto)
+    print(f"Escuchando en {args.socket or f'{args.host}:{args.puerto}'}", file=sys.stderr)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        servicio.cerrar()
+
+async def _subir_archivos(direccion, archivos):
+    respuestas = await asyncio.gather(*(subir(direccion, path) for path in archivos), return_exceptions=True)
+    fallidos = 0
+    for path, respuesta in zip(archivos, respuestas):
+        if isinstance(respuesta, Exception) or respuesta[0] != 200:
+            fallidos += 1
+            error = respuesta if isinstance(respuesta, Exception) else respuesta[1].get('error')
+            print(f"Error: {path}: {error}", file=sys.stderr)
+        else:
+            print(json.dumps(dict(respuesta[1], archivo=path), ensure_ascii=False))
+    return 1 if fallidos else 0
+
+def main(argv=None):
+    from cli import fecha_argumento
+    parser = argparse.ArgumentParser(description="Servicio local de ingesta y consulta del tráfico por AP.")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    for nombre, ayuda in (('servir', "escuchar pedidos"), ('subir', "subir CSV a la vez"),
+                          ('consultar', "tráfico por AP en un rango de fechas")):
+        comando = comandos.add_parser(nombre, help=ayuda)
+        comando.add_argument('--socket', help="socket Unix (por defecto TCP en --host:--puerto)")
+        comando.add_argument('--host', default='127.0.0.1')
+        comando.add_argument('--puerto', type=int, default=PUERTO)
+    comandos.choices['servir'].add_argument('--procesos', type=int, help="procesos que validan los lotes")
+    comandos.choices['subir'].add_argument('archivos', nargs='+', help="archivos CSV (pueden estar comprimidos)")
+    consulta = comandos.choices['consultar']
+    consulta.add_argument('--desde', type=fecha_argumento, help="fecha de inicio (DD-MM-YYYY o YYYY-MM-DD)")
+    consulta.add_argument('--hasta', type=fecha_argumento, help="fecha de fin (DD-MM-YYYY o YYYY-MM-DD)")
+    consulta.add_argument('--top', type=int, help="cantidad de AP")
+    args = parser.parse_args(argv)
+
+    direccion = args.socket or (args.host, args.puerto)
+    try:
+        if args.comando == 'servir':
+            asyncio.run(_servir(args))
+            return 0
+        if args.comando == 'subir':
+            return asyncio.run(_subir_archivos(direccion, args.archivos))
+        estado, respuesta = asyncio.run(consultar(direccion, args.desde, args.hasta, args.top))
+    except KeyboardInterrupt:
+        return 0
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    json.dump(respuesta, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+    return 0 if estado == 200 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())